@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+Ytelsestest for main.py
+
+Starter den lokale testserveren (mock_server.py) med syntetiske selskaper og kjører
+main.py mot den i flere moduser (uten finans, med finans, med tungt filter). For hver
+kjøring måles total tid, gjennomstrømning, svartid per forespørselstype (p50/p99)
+og maks minnebruk (RSS). Med --json tas også main.py sine egne måledata
+(--metrics-json: tid per steg og svartid sett fra klienten) med.
+
+    python3 benchmark.py --scale 1k,100k --modes basic,finance,filter --latency 0.02
+"""
+
+import argparse
+import csv
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.request import urlopen
+
+from mock_server import DEFAULT_JITTER, DEFAULT_RETRY_AFTER, STATS_PATH, parse_scale
+
+
+# Constants
+MAIN_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+MOCK_SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mock_server.py")
+DEFAULT_SCALES = "1k"
+DEFAULT_INDUSTRY = "62"  # Prefiks: fire av de seksten syntetiske næringskodene
+DEFAULT_LATENCY = 0.02  # Svartid i testserveren (sekunder)
+SERVER_START_TIMEOUT = 600  # Sekunder å vente på at testserveren har bygget dataene
+# Benchmark modes: name -> (description, extra main.py arguments)
+BENCHMARK_MODES = {
+    "basic": ("Uten finans", []),
+    "finance": ("Med finans", ["--fin"]),
+    "filter": ("Tungt filter", [
+        "--fin", "--filter",
+        "employees >= 5 and not in_liquidation and (revenue > 5000000 or profit_margin > 10) "
+        "and equity_ratio > 20 and email",
+    ]),
+}
+
+
+def start_server(companies, args):
+    """Start mock_server.py on a free port and return (process, base URL) once it is ready."""
+    command = [
+        sys.executable, MOCK_SERVER_SCRIPT,
+        "--port", "0",
+        "--companies", str(companies),
+        "--seed", str(args.seed),
+        "--latency", str(args.latency),
+        "--jitter", str(args.jitter),
+        "--error-rate", str(args.error_rate),
+        "--throttle-rate", str(args.throttle_rate),
+        "--retry-after", str(args.retry_after),
+    ]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    line = ""
+    while time.monotonic() < deadline:
+        line = process.stdout.readline()
+        if not line and process.poll() is not None:
+            break
+        match = re.search(r"http://\S+", line)
+        if match:
+            print(line.strip())
+            return process, match.group(0)
+    process.kill()
+    raise RuntimeError(f"Testserveren startet ikke: {line.strip() or 'ingen utdata'}")
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def server_stats(base_url, reset=False):
+    with urlopen(base_url + STATS_PATH + ("?reset=1" if reset else ""), timeout=30) as response:
+        return json.load(response)
+
+
+def run_main(command, env, log_path):
+    """
+    Run main.py and wait for it. Returns (exit code, wall time in seconds, peak RSS in MB or None).
+    Peak RSS comes from the child's own resource usage (os.wait4), so runs do not mix.
+    """
+    started = time.monotonic()
+    with open(log_path, "w", encoding="utf-8") as log:
+        process = subprocess.Popen(command, env=env, stdout=log, stderr=subprocess.STDOUT)
+        if hasattr(os, "wait4"):
+            _, status, usage = os.wait4(process.pid, 0)
+            process.returncode = os.waitstatus_to_exitcode(status)
+            # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+            peak_rss = usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+        else:
+            process.wait()
+            peak_rss = None
+    return process.returncode, time.monotonic() - started, peak_rss
+
+
+def count_rows(path):
+    if not os.path.exists(path):
+        return 0
+    with open(path, newline="", encoding="utf-8") as f:
+        return max(0, sum(1 for _ in csv.reader(f)) - 1)
+
+
+def run_mode(mode, companies, base_url, workdir, args):
+    """Run main.py in one benchmark mode against the server and return a result dict."""
+    description, mode_args = BENCHMARK_MODES[mode]
+    output = os.path.join(workdir, f"{companies}_{mode}.csv")
+    log_path = os.path.join(workdir, f"{companies}_{mode}.log")
+    metrics_path = os.path.join(workdir, f"{companies}_{mode}.metrics.json")
+    for stale in (output, output + ".checkpoint.json", metrics_path):
+        if os.path.exists(stale):
+            os.remove(stale)
+    command = [
+        sys.executable, MAIN_SCRIPT,
+        "--industry", args.industry,
+        "--output", output,
+        "--no-cache",
+        "--page-delay", "0",
+        "--finance-rate", "0",
+        "--page-rate", "0",
+        "--no-shared-rate-limit",
+        "--metrics-json", metrics_path,
+    ] + mode_args + args.main_args
+    env = dict(os.environ, BRREG_BASE_URL=base_url)
+    server_stats(base_url, reset=True)
+    code, elapsed, peak_rss = run_main(command, env, log_path)
+    stats = server_stats(base_url)
+    rows = count_rows(output)
+    client = None
+    if os.path.exists(metrics_path):
+        with open(metrics_path, encoding="utf-8") as f:
+            client = json.load(f)
+    requests_total = sum(e["requests"] for e in stats["endpoints"].values())
+    return {
+        "mode": mode,
+        "description": description,
+        "companies": companies,
+        "exit_code": code,
+        "rows": rows,
+        "wall_s": round(elapsed, 3),
+        "rows_per_s": round(rows / elapsed, 1) if elapsed else 0,
+        "requests": requests_total,
+        "requests_per_s": round(requests_total / elapsed, 1) if elapsed else 0,
+        "peak_rss_mb": round(peak_rss, 1) if peak_rss is not None else None,
+        "bytes_sent": stats["bytes_sent"],
+        "endpoints": stats["endpoints"],
+        "client": client,
+        "log": log_path,
+    }
+
+
+def print_result(result):
+    endpoints = result["endpoints"]
+
+    def latency(name):
+        e = endpoints.get(name)
+        return f"{e['p50_ms']:.0f}/{e['p99_ms']:.0f}" if e else "-"
+
+    failed = sum(count for e in endpoints.values() for status, count in e["statuses"].items() if status not in ("200", "404"))
+    rss = f"{result['peak_rss_mb']:.0f}" if result["peak_rss_mb"] is not None else "-"
+    print(f"{result['mode']:<10} {result['companies']:>9} {result['rows']:>8} {result['wall_s']:>9.2f} "
+          f"{result['rows_per_s']:>9.1f} {result['requests']:>7} {result['requests_per_s']:>8.1f} "
+          f"{latency('enheter'):>13} {latency('regnskap'):>13} {failed:>6} {rss:>8}"
+          + ("" if result["exit_code"] == 0 else f"  (avsluttet med kode {result['exit_code']}, se {result['log']})"))
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Mål ytelsen til main.py mot en lokal testserver med syntetiske selskaper. "
+                    "Argumenter etter -- sendes videre til main.py."
+    )
+    parser.add_argument(
+        "--scale",
+        default=DEFAULT_SCALES,
+        help="Kommaseparert liste med antall syntetiske selskaper, f.eks. 1k,100k,1m (standard: 1k)"
+    )
+    parser.add_argument(
+        "--modes",
+        default=",".join(BENCHMARK_MODES),
+        help=f"Kommaseparert liste med moduser: {', '.join(BENCHMARK_MODES)} (standard: alle)"
+    )
+    parser.add_argument(
+        "--industry",
+        default=DEFAULT_INDUSTRY,
+        help=f"Næringskode(r) som sendes til main.py (standard: {DEFAULT_INDUSTRY})"
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=DEFAULT_LATENCY,
+        help=f"Gjennomsnittlig svartid i testserveren i sekunder (standard: {DEFAULT_LATENCY})"
+    )
+    parser.add_argument("--jitter", type=float, default=DEFAULT_JITTER, help="Variasjon i svartiden, som andel av --latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Andel forespørsler som får 500-svar (standard: 0)")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Andel forespørsler som får 429-svar (standard: 0)")
+    parser.add_argument(
+        "--retry-after",
+        type=int,
+        default=DEFAULT_RETRY_AFTER,
+        help=f"Sekunder i Retry-After på 429-svar (standard: {DEFAULT_RETRY_AFTER})"
+    )
+    parser.add_argument("--seed", type=int, default=1, help="Frø for de syntetiske dataene (standard: 1)")
+    parser.add_argument("--workdir", help="Mappe for CSV-filer og logger fra kjøringene (standard: midlertidig mappe som slettes)")
+    parser.add_argument("--json", help="Skriv resultatene som JSON til denne filen")
+    argv = sys.argv[1:] if argv is None else list(argv)
+    main_args = []
+    if "--" in argv:
+        split = argv.index("--")
+        argv, main_args = argv[:split], argv[split + 1:]
+    args = parser.parse_args(argv)
+    args.main_args = main_args
+    try:
+        args.scales = [parse_scale(s) for s in args.scale.split(",") if s.strip()]
+    except ValueError as e:
+        parser.error(str(e))
+    args.mode_list = [m.strip() for m in args.modes.split(",") if m.strip()]
+    unknown = [m for m in args.mode_list if m not in BENCHMARK_MODES]
+    if unknown:
+        parser.error(f"Ukjent modus: {', '.join(unknown)}")
+    return args
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    workdir = args.workdir or tempfile.mkdtemp(prefix="brreg_benchmark_")
+    os.makedirs(workdir, exist_ok=True)
+    results = []
+    try:
+        for companies in args.scales:
+            print(f"\n=== {companies} syntetiske selskaper ===")
+            server, base_url = start_server(companies, args)
+            try:
+                print(f"{'Modus':<10} {'Selskaper':>9} {'Rader':>8} {'Tid (s)':>9} {'Rader/s':>9} {'Kall':>7} "
+                      f"{'Kall/s':>8} {'enheter ms':>13} {'regnskap ms':>13} {'Feil':>6} {'RSS MB':>8}")
+                for mode in args.mode_list:
+                    result = run_mode(mode, companies, base_url, workdir, args)
+                    results.append(result)
+                    print_result(result)
+            finally:
+                stop_server(server)
+        print("\nSvartid vises som p50/p99 målt i testserveren. Feil teller svar som ikke er 200/404 (injiserte 429/500).")
+    except KeyboardInterrupt:
+        print("\nAvbrutt.")
+        return 130
+    finally:
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump({"settings": {k: v for k, v in vars(args).items() if k not in ("scale", "modes")},
+                           "results": results}, f, indent=2, ensure_ascii=False)
+            print(f"Resultater skrevet til {args.json}")
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return 0 if all(r["exit_code"] == 0 for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
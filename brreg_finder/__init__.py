@@ -0,0 +1,51 @@
+"""
+Brønnøysundregisteret Datasøker as a library.
+
+The command line tool is main.py (or `python -m brreg_finder`). For use from Python:
+
+    from brreg_finder import iter_companies
+
+    for company in iter_companies("73.11", filter_expr="employees >= 5", finance=True):
+        ...
+
+Names are imported on first use, so importing the package is cheap and the HTTP
+stack (requests) is only loaded by the parts that talk to the network.
+"""
+
+from importlib import import_module
+
+
+# Public name -> submodule that defines it
+_EXPORTS = {
+    "iter_companies": "api",
+    "write_companies": "api",
+    "CrawlError": "api",
+    "Company": "records",
+    "Financials": "records",
+    "compile_filter": "filters",
+    "FilterError": "filters",
+    "HttpClient": "client",
+    "ResponseCache": "cache",
+    "SharedRateLimiter": "ratelimit",
+    "open_sink": "sinks",
+    "set_echo": "common",
+    "fetch_companies": "crawl",
+    "fetch_companies_from_dump": "dump",
+    "sync_companies": "incremental",
+    "main": "cli",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,7 @@
+import sys
+
+from .cli import main
+
+# Usage lines read "python -m brreg_finder" instead of "__main__.py"
+sys.argv[0] = "python -m brreg_finder"
+sys.exit(main())
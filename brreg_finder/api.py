@@ -0,0 +1,148 @@
+"""
+Library API: iterate over companies as typed records instead of writing files.
+
+    from brreg_finder import iter_companies
+
+    for company in iter_companies("62.01", filter_expr="employees >= 10", finance=True, limit=100):
+        print(company.name, company.financials.revenue if company.financials else None)
+"""
+
+import os
+from collections import deque
+
+from .common import (
+    API_PROGRESS_EVERY, DEFAULT_DUMP_FILE, DEFAULT_FINANCE_BURST, DEFAULT_FINANCE_RATE, DEFAULT_FINANCE_WORKERS,
+    DEFAULT_INDUSTRY_CODE, DEFAULT_MAX_RETRIES, DEFAULT_PAGE_DELAY, DEFAULT_PREFETCH_DEPTH, DEFAULT_SHARD_WORKERS,
+    FIELD_MAP, set_echo,
+)
+from .filters import plan_pushdown
+from .finance import FinanceFetcher
+from .pipeline import CompanyPipeline, collect_financials, prepare_filter
+from .records import Company, company_industry_codes, industry_matches
+
+
+class CrawlError(Exception):
+    """Raised by iter_companies() when pages of the search could not be fetched."""
+
+
+class RecordBuffer:
+    """Sink that keeps written rows until iter_companies() hands them out."""
+
+    def __init__(self):
+        self.rows = deque()
+        self.rows_written = 0
+
+    def write(self, row):
+        self.rows.append(row)
+        self.rows_written += 1
+
+    def close(self):
+        pass
+
+
+def _discard(text):
+    pass
+
+
+def iter_companies(industry=DEFAULT_INDUSTRY_CODE, filter_expr=None, finance=False, limit=None, source="api",
+                   dump_file=DEFAULT_DUMP_FILE, client=None, cache=None, rate_limiter=None, progress=None, messages=None,
+                   workers=DEFAULT_FINANCE_WORKERS, finance_rate=DEFAULT_FINANCE_RATE, finance_burst=DEFAULT_FINANCE_BURST,
+                   prefetch=DEFAULT_PREFETCH_DEPTH, page_delay=DEFAULT_PAGE_DELAY, shard_workers=DEFAULT_SHARD_WORKERS,
+                   max_retries=DEFAULT_MAX_RETRIES, pushdown=True):
+    """
+    Yield a Company for every entity under one or more industry codes that matches filter_expr
+    (a string or CompiledFilter), in the same order and with the same filtering as the CLI.
+    industry is a code or a list of codes; limit applies per code, and a company listed under
+    several codes is yielded once per code (Company.industry says which).
+
+    source="api" crawls the search API; source="dump" reads dump_file, downloading it first if it
+    does not exist. Only finance=True (and downloading the dump) needs the network client: pass
+    an HttpClient as `client` to share its pool, cache and rate limiting, else one is created from
+    cache, rate_limiter and max_retries and closed again when the generator finishes.
+
+    progress(entities, companies) is called every API_PROGRESS_EVERY entities and once at the end.
+    Status messages that the CLI prints go to messages(text) while the generator runs, and are
+    dropped if it is None; they are routed through set_echo(), so this applies process-wide.
+    Raises FilterError for an invalid filter and CrawlError if pages could not be fetched.
+    """
+    industry_codes = [industry] if isinstance(industry, str) else list(industry)
+    if source not in ("api", "dump"):
+        raise ValueError(f"Ukjent kilde: {source}")
+    previous_echo = set_echo(messages or _discard)
+    own_client = client is None and (source == "api" or finance or not os.path.exists(dump_file))
+    fetcher = None
+    try:
+        compiled_filter = prepare_filter(filter_expr, finance)
+        if own_client:
+            from .client import HttpClient
+            client = HttpClient(pool_size=(workers if finance else 0) + prefetch * shard_workers + 2,
+                                max_retries=max_retries, cache=cache, rate_limiter=rate_limiter)
+        if finance:
+            fetcher = FinanceFetcher(workers=workers, rate=finance_rate, burst=finance_burst, client=client,
+                                     share_results=len(industry_codes) > 1)
+        buffer = RecordBuffer()
+        fields = list(FIELD_MAP)
+        pipelines = [CompanyPipeline(buffer, fields, {f: f for f in fields}, compiled_filter, fetcher, limit=limit,
+                                     label=code, tag_industry=True) for code in industry_codes]
+        entities = 0
+
+        def drain(force_progress=False):
+            rows = buffer.rows
+            while rows:
+                yield Company.from_row(rows.popleft())
+            if progress is not None and (force_progress or entities % API_PROGRESS_EVERY == 0):
+                progress(entities, buffer.rows_written)
+
+        if source == "dump":
+            from .dump import download_dump, iter_dump_companies
+            if not os.path.exists(dump_file):
+                download_dump(dump_file, client)
+            for company in iter_dump_companies(dump_file):
+                entities += 1
+                codes = company_industry_codes(company)
+                for pipeline in pipelines:
+                    if not pipeline.done and codes and industry_matches(pipeline.label, codes):
+                        pipeline.feed(company)
+                yield from drain()
+                if all(pipeline.done for pipeline in pipelines):
+                    break
+        else:
+            from .crawl import plan_crawl
+            search_params = plan_pushdown(compiled_filter)[0] if pushdown else {}
+            for pipeline in pipelines:
+                crawl = plan_crawl(pipeline.label, client, prefetch, page_delay, shard_workers, search_params=search_params)
+                try:
+                    for company in crawl:
+                        entities += 1
+                        more = pipeline.feed(company)
+                        yield from drain()
+                        if not more:
+                            break
+                finally:
+                    crawl.close()
+                if crawl.failed:
+                    raise CrawlError(f"Noen sider for næringskode {pipeline.label} kunne ikke hentes")
+        if fetcher is not None:
+            collect_financials(fetcher, block=True)
+        yield from drain(force_progress=True)
+    finally:
+        set_echo(previous_echo)
+        if fetcher is not None:
+            fetcher.close()
+        if own_client and client is not None:
+            client.close()
+
+
+def write_companies(sink, industry=DEFAULT_INDUSTRY_CODE, **options):
+    """
+    Pass every Company from iter_companies(industry, **options) to sink.write(company), then
+    call sink.close() (also on errors). Returns the number of companies written.
+    """
+    written = 0
+    try:
+        for company in iter_companies(industry, **options):
+            sink.write(company)
+            written += 1
+    finally:
+        sink.close()
+    return written
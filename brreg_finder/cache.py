@@ -0,0 +1,116 @@
+"""
+On-disk cache of API responses (SQLite).
+"""
+
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+from .common import CACHE_TTLS, DEFAULT_CACHE_MAX_MB
+
+
+class ResponseCache:
+    """
+    Persistent on-disk cache of API responses, backed by SQLite. Entries are keyed by
+    the full request URL (page URLs for `enheter`, one URL per orgnr for `regnskap`)
+    and stored zlib-compressed with their ETag/Last-Modified headers.
+
+    Each source has its own TTL. Stale entries are revalidated with a conditional
+    request where the server supports it, and the least recently used entries are
+    evicted once the file grows past `max_bytes`. Thread-safe.
+    """
+
+    def __init__(self, path, ttls=None, max_bytes=DEFAULT_CACHE_MAX_MB * 1_000_000):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.ttls = dict(CACHE_TTLS, **(ttls or {}))
+        self.max_bytes = max_bytes
+        self.counters = {"hits": 0, "revalidated": 0, "misses": 0}
+        self.lock = threading.Lock()
+        self.puts_since_evict = 0
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, source TEXT, status INTEGER, body BLOB,"
+            " etag TEXT, last_modified TEXT, fetched_at REAL, accessed_at REAL, size INTEGER)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+        self.db.commit()
+
+    def lookup(self, key):
+        """Return (status, body_bytes, etag, last_modified, fetched_at) or None."""
+        with self.lock:
+            row = self.db.execute(
+                "SELECT status, body, etag, last_modified, fetched_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        status, body, etag, last_modified, fetched_at = row
+        return status, zlib.decompress(body), etag, last_modified, fetched_at
+
+    def is_fresh(self, source, fetched_at):
+        return time.time() - fetched_at < self.ttls.get(source, self.ttls["default"])
+
+    def store(self, key, source, status, body, etag=None, last_modified=None):
+        blob = zlib.compress(body, 1)
+        now = time.time()
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, source, status, blob, etag, last_modified, now, now, len(blob)),
+            )
+            self.db.commit()
+            self.puts_since_evict += 1
+            if self.puts_since_evict >= 500:
+                self._evict()
+
+    def touch(self, key, revalidated=False):
+        """Mark an entry as used; after a 304 answer also restart its TTL."""
+        now = time.time()
+        with self.lock:
+            if revalidated:
+                self.db.execute("UPDATE responses SET fetched_at = ?, accessed_at = ? WHERE key = ?", (now, now, key))
+            else:
+                self.db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self.db.commit()
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def _evict(self):
+        # Caller holds self.lock. Drop least recently used entries until 90 % of max_bytes.
+        self.puts_since_evict = 0
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        target = self.max_bytes * 0.9
+        rows = self.db.execute("SELECT key, size FROM responses ORDER BY accessed_at").fetchall()
+        doomed = []
+        for key, size in rows:
+            if total <= target:
+                break
+            doomed.append((key,))
+            total -= size
+        self.db.executemany("DELETE FROM responses WHERE key = ?", doomed)
+        self.db.commit()
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters)
+
+    def close(self):
+        with self.lock:
+            self._evict()
+            self.db.close()
+
+
+def format_cache_stats(stats):
+    """One-line Norwegian summary of ResponseCache.stats()."""
+    return (f"Cache: {stats['hits']} treff, {stats['revalidated']} revalidert (uendret), "
+            f"{stats['misses']} bom")
@@ -0,0 +1,614 @@
+"""
+Command line interface: argument parsing and the main() entry point behind main.py.
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+
+from .common import (
+    CACHE_TTLS, COMBINED_OUTPUT_FILE, DEFAULT_CACHE_FILE, DEFAULT_CACHE_MAX_MB, DEFAULT_CHECKPOINT_INTERVAL,
+    DEFAULT_DUMP_FILE, DEFAULT_FINANCE_BURST, DEFAULT_FINANCE_RATE, DEFAULT_FINANCE_WORKERS, DEFAULT_INDUSTRY_CODE,
+    DEFAULT_MAX_RETRIES, DEFAULT_PAGE_BURST, DEFAULT_PAGE_DELAY, DEFAULT_PAGE_RATE, DEFAULT_PARSE_WORKERS,
+    DEFAULT_PREFETCH_DEPTH, DEFAULT_PROGRESS_INTERVAL, DEFAULT_RATE_LIMIT_FILE, DEFAULT_REFRESH_INTERVAL,
+    DEFAULT_SERVE_PORT, DEFAULT_SHARD_WORKERS, DIFF_STATE_SUFFIX, FIELD_MAP, FIN_FIELD_CSV_MAP, INDUSTRY_COLUMN,
+    OUTPUT_FORMATS, STORE_FORMATS, default_output_file, output_file_for_code, output_format_for_file,
+)
+
+
+def parse_arguments():
+    """
+    Behandler kommandolinjeargumenter.
+    
+    Returns:
+        argparse.Namespace: Objekt med behandlede argumenter
+    """
+    parser = argparse.ArgumentParser(
+        description="Hent selskapsdata fra Brønnøysundregisteret basert på næringskode"
+    )
+    parser.add_argument(
+        "--industry", "--industry-code", "--naeringskode", "-i",
+        type=str,
+        default=DEFAULT_INDUSTRY_CODE,
+        help=f"Industry code(s) for companies to fetch, comma-separated; prefixes such as 73 are allowed (e.g. {DEFAULT_INDUSTRY_CODE} for advertising agency)"
+    )
+    parser.add_argument(
+        "--output", "-o", 
+        type=str, 
+        help="Navn på output CSV-fil. Standard er [næringskode]_selskaper.csv"
+    )
+    parser.add_argument(
+        "--format",
+        choices=sorted(OUTPUT_FORMATS),
+        help="Filformat: csv, parquet, arrow (Arrow IPC), sqlite eller duckdb (database som oppdateres og kan spørres med "
+             "`main.py query`). Standard er ut fra filendelsen til --output, ellers csv"
+    )
+    parser.add_argument(
+        "--fields", "-f",
+        type=str,
+        help=(
+            "Kommaseparert liste over felter som skal inkluderes i CSV. "
+            "Tilgjengelige felter: name, orgnr, incorporation_date, registration_date, "
+            "email, phone, mobile, website, address, zipcode, state, street, in_liquidation, employees. "
+            "Standard er alle felter."
+        )
+    )
+    parser.add_argument(
+        "--limit", "-l",
+        type=int,
+        default=None,
+        help="Maksimalt antall selskaper som skal lastes ned (standard: ingen grense)"
+    )
+    parser.add_argument(
+        "--filter",
+        type=str,
+        default=None,
+        help=(
+            "Valgfritt: Filteruttrykk for å kun inkludere selskaper som matcher. "
+            "Eksempel: 'email and not phone and employees and email == \"ok@test.com\"'. "
+            "Tilgjengelige felter: name, orgnr, incorporation_date, registration_date, email, phone, mobile, website, address, zipcode, state, street, in_liquidation, employees."
+        )
+    )
+    parser.add_argument(
+        "--finance", "--fin",
+        action="store_true",
+        help=f"Include financial data for each company (rate-limited to {DEFAULT_FINANCE_RATE:g} requests/sec by default)"
+    )
+    parser.add_argument(
+        "--finance-history",
+        nargs="?",
+        const="long",
+        choices=["long", "wide"],
+        help="Ta med alle regnskapsår (ikke bare siste) med vekst fra året før, i en egen fil: "
+             "long (OrgNo, Year, Field, Value; standard) eller wide (én rad per selskap og år). Aktiverer --fin"
+    )
+    parser.add_argument(
+        "--history-output",
+        type=str,
+        help="Fil for --finance-history. Standard er [output]_historikk med samme filendelse"
+    )
+    parser.add_argument(
+        "--diff",
+        action="store_true",
+        help="Sammenlign resultatet med forrige kjøring og skriv nye, fjernede og endrede selskaper (med feltene som er endret) "
+             "til en egen CSV-fil. Med --fin hentes ikke regnskapet på nytt for selskaper som ikke har levert nytt årsregnskap"
+    )
+    parser.add_argument(
+        "--diff-output",
+        type=str,
+        help="CSV-fil for endringene fra --diff. Standard er [output]_endringer.csv"
+    )
+    parser.add_argument(
+        "--diff-state",
+        type=str,
+        help=f"Tilstandsfil for --diff (fingeravtrykk per selskap fra forrige kjøring). Standard er [output]{DIFF_STATE_SUFFIX}"
+    )
+    parser.add_argument(
+        "--finance-rate",
+        type=float,
+        default=DEFAULT_FINANCE_RATE,
+        help=f"Maks antall finansoppslag per sekund, felles for alle kjøringer på maskinen (standard: {DEFAULT_FINANCE_RATE:g}, 0 = ingen grense)"
+    )
+    parser.add_argument(
+        "--finance-burst",
+        type=int,
+        default=DEFAULT_FINANCE_BURST,
+        help=f"Antall finansoppslag som kan sendes samtidig i en topp (standard: {DEFAULT_FINANCE_BURST})"
+    )
+    parser.add_argument(
+        "--combine",
+        action="store_true",
+        help=f"Med flere næringskoder: skriv alt til én fil med en {INDUSTRY_COLUMN}-kolonne i stedet for én fil per kode"
+    )
+    parser.add_argument(
+        "--source",
+        choices=["api", "dump"],
+        default="api",
+        help="Datakilde: 'api' blar gjennom API-et side for side, 'dump' leser totaluttrekket fra --dump-file (standard: api)"
+    )
+    parser.add_argument(
+        "--dump-file",
+        type=str,
+        default=DEFAULT_DUMP_FILE,
+        help=f"Lokal dumpfil (gzip JSON eller CSV) for --source dump. Lastes ned hvis den ikke finnes (standard: {DEFAULT_DUMP_FILE})"
+    )
+    parser.add_argument(
+        "--parse-workers",
+        type=int,
+        default=DEFAULT_PARSE_WORKERS,
+        help="Antall prosesser som dekoder, trekker ut og filtrerer dumpfilen med --source dump; 0 = én per kjerne "
+             f"(standard: {DEFAULT_PARSE_WORKERS}, i hovedprosessen)"
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Oppdater et lokalt snapshot fra Enhetsregisterets oppdateringsstrøm i stedet for å hente alt på nytt, og lag CSV-filen fra snapshotet"
+    )
+    parser.add_argument(
+        "--snapshot",
+        type=str,
+        default=None,
+        help="Snapshot-fil for --incremental og --serve (standard: [output].snapshot.sqlite)"
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="Kjør som tjeneste: last selskapene inn i minnet én gang, hold dem oppdatert fra oppdateringsstrømmen "
+             "og svar på filterspørringer over HTTP/JSON (se --host, --port)"
+    )
+    parser.add_argument(
+        "--host",
+        type=str,
+        default="127.0.0.1",
+        help="Adresse spørre-API-et lytter på med --serve (standard: 127.0.0.1)"
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=DEFAULT_SERVE_PORT,
+        help=f"Port for spørre-API-et med --serve (standard: {DEFAULT_SERVE_PORT})"
+    )
+    parser.add_argument(
+        "--refresh-interval",
+        type=float,
+        default=DEFAULT_REFRESH_INTERVAL,
+        help=f"Minutter mellom hver oppdatering fra oppdateringsstrømmen med --serve; 0 = aldri (standard: {DEFAULT_REFRESH_INTERVAL:g})"
+    )
+    parser.add_argument(
+        "--cache-file",
+        type=str,
+        default=DEFAULT_CACHE_FILE,
+        help=f"Lokal cache for API-svar, slik at gjentatte kjøringer går raskt (standard: {DEFAULT_CACHE_FILE})"
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Ikke bruk den lokale cachen; alt hentes på nytt fra API-et"
+    )
+    parser.add_argument(
+        "--cache-max-mb",
+        type=int,
+        default=DEFAULT_CACHE_MAX_MB,
+        help=f"Maks størrelse på cachen i MB; eldste oppføringer fjernes først (standard: {DEFAULT_CACHE_MAX_MB})"
+    )
+    parser.add_argument(
+        "--cache-ttl-pages",
+        type=float,
+        default=CACHE_TTLS["enheter"] / 3600,
+        help=f"Timer før en lagret side fra Enhetsregisteret revalideres (standard: {CACHE_TTLS['enheter'] / 3600:g})"
+    )
+    parser.add_argument(
+        "--cache-ttl-finance",
+        type=float,
+        default=CACHE_TTLS["regnskap"] / 86400,
+        help=f"Dager før et lagret regnskap revalideres (standard: {CACHE_TTLS['regnskap'] / 86400:g})"
+    )
+    parser.add_argument(
+        "--prefetch",
+        type=int,
+        default=DEFAULT_PREFETCH_DEPTH,
+        help=f"Antall sider som hentes i forkant mens gjeldende side behandles (standard: {DEFAULT_PREFETCH_DEPTH})"
+    )
+    parser.add_argument(
+        "--shard-workers",
+        type=int,
+        default=DEFAULT_SHARD_WORKERS,
+        help=f"Antall deler av et stort søk som hentes samtidig (standard: {DEFAULT_SHARD_WORKERS})"
+    )
+    parser.add_argument(
+        "--page-delay",
+        type=float,
+        default=DEFAULT_PAGE_DELAY,
+        help=f"Minste pause i sekunder mellom sidekall; pausen øker automatisk med svartid og 429-svar (standard: {DEFAULT_PAGE_DELAY:g})"
+    )
+    parser.add_argument(
+        "--page-rate",
+        type=float,
+        default=DEFAULT_PAGE_RATE,
+        help=f"Maks antall sidekall per sekund mot Enhetsregisteret, felles for alle kjøringer på maskinen (standard: {DEFAULT_PAGE_RATE:g}, 0 = ingen grense)"
+    )
+    parser.add_argument(
+        "--rate-limit-file",
+        type=str,
+        default=DEFAULT_RATE_LIMIT_FILE,
+        help=f"Fil der kjøringer på samme maskin deler ratebegrensningen (standard: {DEFAULT_RATE_LIMIT_FILE})"
+    )
+    parser.add_argument(
+        "--no-shared-rate-limit",
+        action="store_true",
+        help="Ikke del ratebegrensningen med andre kjøringer; grensene gjelder bare denne prosessen"
+    )
+    parser.add_argument(
+        "--max-retries",
+        type=int,
+        default=DEFAULT_MAX_RETRIES,
+        help=f"Antall nye forsøk ved serverfeil (5xx/429) og nettverksfeil (standard: {DEFAULT_MAX_RETRIES})"
+    )
+    parser.add_argument(
+        "--no-pushdown",
+        action="store_true",
+        help="Ikke send deler av --filter til API-et som søkeparametere; alt filtreres lokalt"
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Fortsett en avbrutt nedlasting fra siste sjekkpunkt (samme parametere som forrige kjøring)"
+    )
+    parser.add_argument(
+        "--checkpoint-interval",
+        type=float,
+        default=DEFAULT_CHECKPOINT_INTERVAL,
+        help=f"Sekunder mellom hvert sjekkpunkt for --resume; 0 slår av sjekkpunkter (standard: {DEFAULT_CHECKPOINT_INTERVAL})"
+    )
+    parser.add_argument(
+        "--progress",
+        type=float,
+        nargs="?",
+        const=DEFAULT_PROGRESS_INTERVAL,
+        default=None,
+        metavar="SEKUNDER",
+        help=f"Skriv en fremdriftslinje med antall enheter, rader/s og anslått tid igjen hvert SEKUNDER sekund (standard: {DEFAULT_PROGRESS_INTERVAL})"
+    )
+    parser.add_argument(
+        "--metrics-json",
+        type=str,
+        default=None,
+        help="Skriv måledata for kjøringen (tid per steg, tellere, svartidshistogrammer) som JSON til denne filen"
+    )
+    parser.add_argument(
+        "--profile",
+        type=str,
+        default=None,
+        help="Profiler kjøringen og lagre resultatet i denne filen (se --profile-mode)"
+    )
+    parser.add_argument(
+        "--profile-mode",
+        choices=["cprofile", "sample"],
+        default="cprofile",
+        help="'cprofile' (standard) profilerer hovedtråden med cProfile (.prof-fil); 'sample' tar stikkprøver av alle tråder og lagrer sammenslåtte stakker for flammegrafer"
+    )
+    parser.add_argument(
+        "--workers", "-w",
+        type=int,
+        default=DEFAULT_FINANCE_WORKERS,
+        help=f"Antall parallelle arbeidere for finansoppslag (standard: {DEFAULT_FINANCE_WORKERS})"
+    )
+    
+    args = parser.parse_args()
+    
+    # Always set naeringskode attribute for compatibility
+    if hasattr(args, "industry"):
+        args.naeringskode = args.industry
+    elif hasattr(args, "naeringskode"):
+        args.naeringskode = args.naeringskode
+    else:
+        args.naeringskode = DEFAULT_INDUSTRY_CODE
+
+    # Several codes (or prefixes such as 73) can be given comma-separated
+    args.industry_codes = [c.strip() for c in args.naeringskode.split(",") if c.strip()]
+    if not args.industry_codes:
+        print("Ingen næringskode oppgitt i --industry.")
+        sys.exit(1)
+    multiple = len(args.industry_codes) > 1
+
+    # Use default filename if not specified
+    if args.combine or not multiple:
+        args.output_files = [args.output or (COMBINED_OUTPUT_FILE if multiple else default_output_file(args.naeringskode))]
+    else:
+        args.output_files = [output_file_for_code(args.output, code, multiple) for code in args.industry_codes]
+    # Columnar formats get typed columns; the default names follow the chosen format
+    args.output_format = args.format or output_format_for_file(args.output_files[0])
+    if args.output_format in STORE_FORMATS and multiple and not args.combine:
+        # A store holds every industry code in one file
+        args.combine = True
+        args.output_files = [args.output or COMBINED_OUTPUT_FILE]
+    if not args.output and args.output_format != "csv":
+        args.output_files = [os.path.splitext(f)[0] + OUTPUT_FORMATS[args.output_format] for f in args.output_files]
+    args.output = args.output_files[0]
+    if args.finance_history:
+        if not args.finance:
+            print("\nMERK: --finance-history henter regnskap, så --fin er aktivert automatisk.")
+            args.finance = True
+        stem, ext = os.path.splitext(args.output)
+        if args.output_format in STORE_FORMATS:
+            # Every period goes to the financials table of the same store
+            args.history_output = args.output
+        else:
+            args.history_output = args.history_output or f"{stem}_historikk{ext}"
+    if args.diff:
+        args.diff_output = args.diff_output or f"{os.path.splitext(args.output)[0]}_endringer.csv"
+        args.diff_state = args.diff_state or args.output + DIFF_STATE_SUFFIX
+
+    # Define field mapping and default order (all English)
+    field_map = dict(FIELD_MAP)
+    default_fields = list(field_map.keys())
+
+    # Add fin_ prefix for internal keys, but allow user to specify without prefix
+    finance_fields_user = [f.replace("fin_", "") for f in FIN_FIELD_CSV_MAP.keys()]
+
+    # Handle --fields
+    if args.fields:
+        requested = [f.strip().lower() for f in args.fields.split(",") if f.strip()]
+        # Filter out invalid fields
+        selected_fields = [f for f in requested if f in field_map]
+        # Check if any finance fields are requested. A name that is also a company field
+        # (in_liquidation) means the company field; the financial one is fin_in_liquidation.
+        requested_finance = [f[len("fin_"):] if f.startswith("fin_") else f for f in requested if f not in field_map]
+        requested_finance = [f for f in requested_finance if f in finance_fields_user]
+        if requested_finance and not getattr(args, "finance", False):
+            print("\nMERK: Du har valgt finansielle felter i --fields, så --fin er aktivert automatisk.")
+            args.finance = True
+        if not selected_fields and not requested_finance:
+            print(f"Ingen gyldige felter valgt i --fields. Tilgjengelige: {', '.join(field_map.keys())}")
+            sys.exit(1)
+        args.selected_finance_fields = requested_finance
+    else:
+        selected_fields = default_fields
+        args.selected_finance_fields = None
+
+    if args.output_format in STORE_FORMATS:
+        # The store always has every column, so rows from later runs fit the same tables
+        if args.fields:
+            print(f"\nMERK: --fields gjelder ikke for --format {args.output_format}; alle felter lagres.")
+        selected_fields = default_fields
+        args.selected_finance_fields = None
+
+    args.selected_fields = selected_fields
+    args.field_map = field_map
+    return args
+
+
+def run(args, compiled_filter, cache, rate_limiter=None, changes=None):
+    """Run the download selected by the parsed arguments (query service, incremental, dump or API)."""
+    # Each mode imports its own modules, so the HTTP stack is only loaded by the modes that use it
+    if args.serve:
+        from .incremental import default_snapshot_file
+        from .serve import serve_companies
+        if args.snapshot:
+            snapshot_files = [args.snapshot]
+        else:
+            snapshot_files = [default_snapshot_file(default_output_file(code)) for code in args.industry_codes]
+        serve_companies(
+            args.industry_codes,
+            host=args.host,
+            port=args.port,
+            source=args.source,
+            dump_file=args.dump_file,
+            snapshot_files=snapshot_files,
+            finance=getattr(args, "finance", False),
+            workers=args.workers,
+            finance_rate=args.finance_rate,
+            finance_burst=args.finance_burst,
+            prefetch=args.prefetch,
+            page_delay=args.page_delay,
+            max_retries=args.max_retries,
+            cache=cache,
+            rate_limiter=rate_limiter,
+            shard_workers=args.shard_workers,
+            refresh_interval=args.refresh_interval
+        )
+        return 0
+    if args.incremental:
+        from .incremental import default_snapshot_file, sync_companies
+        synced = sync_companies(
+            args.naeringskode,
+            args.output,
+            args.snapshot or default_snapshot_file(args.output),
+            args.selected_fields,
+            args.field_map,
+            limit=args.limit,
+            filter_expr=compiled_filter,
+            finance=getattr(args, "finance", False),
+            selected_finance_fields=getattr(args, "selected_finance_fields", None),
+            workers=args.workers,
+            finance_rate=args.finance_rate,
+            finance_burst=args.finance_burst,
+            prefetch=args.prefetch,
+            page_delay=args.page_delay,
+            max_retries=args.max_retries,
+            cache=cache,
+            rate_limiter=rate_limiter,
+            shard_workers=args.shard_workers,
+            output_format=args.output_format,
+            finance_history=args.finance_history,
+            history_output=args.history_output,
+            changes=changes
+        )
+        return 0 if synced else 1
+    if args.source == "dump":
+        from .dump import fetch_companies_from_dump
+        fetch_companies_from_dump(
+            args.dump_file,
+            args.industry_codes,
+            args.output_files,
+            args.selected_fields,
+            args.field_map,
+            limit=args.limit,
+            filter_expr=compiled_filter,
+            finance=getattr(args, "finance", False),
+            selected_finance_fields=getattr(args, "selected_finance_fields", None),
+            workers=args.workers,
+            finance_rate=args.finance_rate,
+            finance_burst=args.finance_burst,
+            max_retries=args.max_retries,
+            cache=cache,
+            rate_limiter=rate_limiter,
+            combine=args.combine,
+            output_format=args.output_format,
+            finance_history=args.finance_history,
+            history_output=args.history_output,
+            parse_workers=args.parse_workers,
+            changes=changes
+        )
+        return 0
+    # Run main function
+    from .crawl import fetch_companies
+    fetch_companies(
+        args.industry_codes,
+        args.output_files,
+        args.selected_fields,
+        args.field_map,
+        limit=args.limit,
+        filter_expr=compiled_filter,
+        finance=getattr(args, "finance", False),
+        selected_finance_fields=getattr(args, "selected_finance_fields", None),
+        workers=args.workers,
+        finance_rate=args.finance_rate,
+        finance_burst=args.finance_burst,
+        prefetch=args.prefetch,
+        page_delay=args.page_delay,
+        max_retries=args.max_retries,
+        cache=cache,
+        rate_limiter=rate_limiter,
+        shard_workers=args.shard_workers,
+        combine=args.combine,
+        resume=args.resume,
+        checkpoint_interval=args.checkpoint_interval,
+        output_format=args.output_format,
+        finance_history=args.finance_history,
+        history_output=args.history_output,
+        pushdown=not args.no_pushdown,
+        changes=changes
+    )
+    return 0
+
+
+def main():
+    """Main function that runs the program."""
+    cache = None
+    rate_limiter = None
+    changes = None
+    try:
+        if sys.argv[1:2] == ["query"]:
+            from .query import query_main
+            return query_main(sys.argv[2:])
+        # Parse command line arguments
+        args = parse_arguments()
+        # Imported only now, so --help and argument errors do not pay for them
+        from .cache import ResponseCache
+        from .filters import FilterError, compile_filter
+        from .metrics import ProgressReporter, finish_profiler, format_metrics, get_metrics, start_profiler
+        from .ratelimit import SharedRateLimiter, format_rate_limit_stats
+        from .sinks import ChangeTracker, import_duckdb, import_pyarrow
+        # Validate and compile the filter before any network access
+        try:
+            compiled_filter = compile_filter(args.filter) if args.filter else None
+        except FilterError as e:
+            print(f"Feil i --filter: {e}")
+            return 1
+        if args.finance and args.selected_finance_fields == [] and not args.finance_history \
+                and (compiled_filter is None or not compiled_filter.needs_finance):
+            print("\nMERK: Verken --fields eller --filter bruker regnskapstall, så ingen finansoppslag blir gjort.")
+        if not args.no_cache:
+            try:
+                cache = ResponseCache(
+                    args.cache_file,
+                    ttls={"enheter": args.cache_ttl_pages * 3600, "regnskap": args.cache_ttl_finance * 86400},
+                    max_bytes=args.cache_max_mb * 1_000_000,
+                )
+            except (sqlite3.Error, OSError) as e:
+                print(f"MERK: Kunne ikke åpne cache ({e}), fortsetter uten cache.")
+        budgets = {"enheter": (args.page_rate, DEFAULT_PAGE_BURST), "regnskap": (args.finance_rate, args.finance_burst)}
+        rate_limit_file = None if args.no_shared_rate_limit else args.rate_limit_file
+        try:
+            rate_limiter = SharedRateLimiter(budgets, rate_limit_file)
+        except OSError as e:
+            print(f"MERK: Kunne ikke åpne {rate_limit_file} ({e}); ratebegrensningen gjelder bare denne prosessen.")
+            rate_limit_file = None
+            rate_limiter = SharedRateLimiter(budgets)
+        if args.resume and (args.incremental or args.source != "api" or args.output_format != "csv" or args.finance_history):
+            print("--resume kan kun brukes ved nedlasting fra API-et til CSV (uten --incremental og --finance-history).")
+            return 1
+        if args.output_format == "duckdb":
+            try:
+                import_duckdb()
+            except ImportError as e:
+                print(e)
+                return 1
+        elif args.output_format != "csv" and args.output_format not in STORE_FORMATS:
+            try:
+                import_pyarrow()
+            except ImportError as e:
+                print(e)
+                return 1
+        if args.incremental and (args.source != "api" or len(args.industry_codes) > 1):
+            print("--incremental kan kun brukes med --source api og én næringskode.")
+            return 1
+        if args.serve and (args.filter or args.resume or args.incremental or args.finance_history):
+            print("--serve kan ikke kombineres med --filter, --resume, --incremental eller --finance-history; "
+                  "filteret sendes med hver spørring i stedet.")
+            return 1
+        if args.diff and (args.serve or args.resume or args.limit is not None):
+            # Companies left out by --limit would be reported as removed
+            print("--diff kan ikke kombineres med --serve, --resume eller --limit.")
+            return 1
+        if args.parse_workers < 0:
+            print("--parse-workers kan ikke være negativt.")
+            return 1
+        if args.serve and args.snapshot and len(args.industry_codes) > 1:
+            print("--snapshot kan kun brukes med én næringskode sammen med --serve.")
+            return 1
+        if args.diff:
+            try:
+                changes = ChangeTracker(args.diff_state, args.diff_output, industry_column=len(args.industry_codes) > 1)
+            except (sqlite3.Error, OSError) as e:
+                print(f"Kunne ikke åpne {args.diff_state} eller {args.diff_output} for --diff: {e}")
+                return 1
+        metrics = get_metrics()
+        metrics.reset()
+        progress = ProgressReporter(metrics, args.progress) if args.progress else None
+        profiler = start_profiler(args.profile_mode) if args.profile else None
+        try:
+            return run(args, compiled_filter, cache, rate_limiter, changes)
+        finally:
+            if profiler is not None:
+                finish_profiler(profiler, args.profile)
+            if progress is not None:
+                progress.stop()
+            if cache is not None:
+                metrics.record("cache", cache.stats())
+            rate_limit_stats = rate_limiter.stats()
+            metrics.record("rate_limit", rate_limit_stats)
+            if any(s["requests"] for s in rate_limit_stats.values()):
+                print(format_rate_limit_stats(rate_limit_stats, shared=rate_limit_file is not None))
+            print(format_metrics(metrics.summary()))
+            if args.metrics_json:
+                try:
+                    metrics.write_json(args.metrics_json)
+                    print(f"Måledata lagret i {args.metrics_json}")
+                except OSError as e:
+                    print(f"Kunne ikke lagre måledata: {e}")
+    except KeyboardInterrupt:
+        print("\nProgrammet ble avbrutt av brukeren.")
+        return 1
+    except Exception as e:
+        print(f"\nEn kritisk feil oppstod: {e}")
+        return 1
+    finally:
+        if cache is not None:
+            cache.close()
+        if rate_limiter is not None:
+            rate_limiter.close()
+        if changes is not None:
+            changes.close()
@@ -0,0 +1,358 @@
+"""
+HTTP access to Enhetsregisteret: the pooled HttpClient, adaptive page pacing and page prefetching.
+"""
+
+import copy
+import queue
+import random
+import threading
+import time
+
+import requests
+
+from .common import (
+    DEFAULT_FINANCE_WORKERS, DEFAULT_MAX_RETRIES, DEFAULT_PAGE_DELAY, DEFAULT_PREFETCH_DEPTH, HTTP_TIMEOUTS, echo,
+    json_loads,
+)
+from .metrics import get_metrics
+from .ratelimit import parse_retry_after
+
+
+class PolitenessPolicy:
+    """
+    Adaptive delay between requests to the same endpoint. Replaces a fixed sleep:
+    the delay follows an exponentially weighted average of the server's response
+    time (scaled by `factor`), never drops below `min_delay`, and honours
+    Retry-After on 429/503 answers. Thread-safe.
+    """
+
+    def __init__(self, min_delay=DEFAULT_PAGE_DELAY, max_delay=60.0, factor=1.0, smoothing=0.3):
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.factor = factor
+        self.smoothing = smoothing
+        self.avg_response_time = None
+        self.delay = min_delay
+        self.next_allowed = 0.0
+        self.throttled = 0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        """Sleep until the next request is allowed."""
+        with self.lock:
+            now = time.monotonic()
+            wait = self.next_allowed - now
+            self.next_allowed = max(now, self.next_allowed) + self.delay
+        if wait > 0:
+            time.sleep(wait)
+
+    def record(self, elapsed, status=200, retry_after=None):
+        """Update the delay from a finished request's response time and status."""
+        with self.lock:
+            if status in (429, 503):
+                self.throttled += 1
+                pause = parse_retry_after(retry_after)
+                if pause is None:
+                    pause = max(self.delay * 2, 1.0)
+                # Back off hard and block new requests until the server's pause is over
+                self.delay = min(self.max_delay, max(self.delay * 2, pause))
+                self.next_allowed = max(self.next_allowed, time.monotonic() + min(pause, self.max_delay))
+                return
+            if self.avg_response_time is None:
+                self.avg_response_time = elapsed
+            else:
+                self.avg_response_time += self.smoothing * (elapsed - self.avg_response_time)
+            target = min(self.max_delay, max(self.min_delay, self.factor * self.avg_response_time))
+            # Recover gradually after a throttle instead of jumping straight back
+            self.delay = target if target >= self.delay else (self.delay + target) / 2
+
+
+class HttpClient:
+    """
+    Shared HTTP layer for all API calls. Wraps one pooled requests.Session
+    (keep-alive, gzip/deflate) and retries 5xx/429 answers and connection
+    errors with exponential backoff and jitter. Timeouts are chosen per
+    endpoint. With a SharedRateLimiter every network request to an endpoint it
+    has a budget for waits for its turn, and each answer is reported back so the
+    rate can adapt. Thread-safe; counters are available through stats().
+    """
+
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self, pool_size=DEFAULT_FINANCE_WORKERS + DEFAULT_PREFETCH_DEPTH + 2, max_retries=DEFAULT_MAX_RETRIES,
+                 backoff_base=0.5, backoff_max=30.0, timeouts=None, cache=None, rate_limiter=None):
+        self.session = requests.Session()
+        self.cache = cache
+        self.rate_limiter = rate_limiter
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=max(1, pool_size))
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Accept": "application/json", "Accept-Encoding": "gzip, deflate"})
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeouts = dict(HTTP_TIMEOUTS, **(timeouts or {}))
+        self.counters = {"requests": 0, "retries": 0, "bytes_received": 0}
+        self.lock = threading.Lock()
+
+    def _count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] += amount
+
+    def _backoff(self, attempt):
+        # "Full jitter": a random delay up to the exponential ceiling
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def get(self, url, params=None, endpoint="enheter", politeness=None, headers=None, stream=False):
+        """
+        GET a URL, retrying transient failures. Returns the final requests.Response
+        (callers still call raise_for_status()). Raises requests.RequestException
+        if the connection keeps failing. With stream=True the body is not read and
+        is not counted in bytes_received.
+        """
+        timeout = self.timeouts.get(endpoint, self.timeouts["default"])
+        metrics = get_metrics()
+        limiter = self.rate_limiter if self.rate_limiter is not None and self.rate_limiter.covers(endpoint) else None
+        attempt = 0
+        while True:
+            if politeness is not None:
+                politeness.wait()
+            if limiter is not None:
+                limiter.acquire(endpoint)
+            started = time.monotonic()
+            try:
+                response = self.session.get(url, params=params, headers=headers, timeout=timeout, stream=stream)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                metrics.count("http_network_errors")
+                if attempt >= self.max_retries:
+                    raise
+                self._count("retries")
+                time.sleep(self._backoff(attempt))
+                attempt += 1
+                continue
+            elapsed = time.monotonic() - started
+            self._count("requests")
+            metrics.add_time("http", elapsed)
+            metrics.observe(f"http.{endpoint}", elapsed * 1000)
+            metrics.count(f"http_status_{response.status_code}")
+            if not stream:
+                self._count("bytes_received", response.raw.tell() if response.raw is not None else len(response.content))
+            retry_after = response.headers.get("Retry-After")
+            if politeness is not None:
+                politeness.record(elapsed, response.status_code, retry_after)
+            if limiter is not None:
+                limiter.record(endpoint, response.status_code, retry_after)
+            if response.status_code not in self.RETRY_STATUSES or attempt >= self.max_retries:
+                return response
+            self._count("retries")
+            if (politeness is None and limiter is None) or response.status_code not in (429, 503):
+                # The politeness policy and the rate limiter already block until Retry-After has passed
+                delay = parse_retry_after(retry_after)
+                time.sleep(min(self.backoff_max, delay) if delay is not None else self._backoff(attempt))
+            attempt += 1
+
+    def get_json(self, url, params=None, endpoint="enheter", politeness=None, limiter=None):
+        """
+        GET a JSON document, reading through the ResponseCache if one is configured.
+        Fresh cache entries are returned without any request; stale ones are revalidated
+        with If-None-Match/If-Modified-Since. 404 answers are cached as well, since
+        "no accounts for this orgnr" is a stable answer. `limiter` (a TokenBucket) is
+        only acquired when a request is actually sent.
+        Raises requests.HTTPError for non-2xx answers, like raise_for_status().
+        """
+        cache = self.cache
+        key = requests.Request("GET", url, params=params).prepare().url if cache is not None else None
+        cached = cache.lookup(key) if cache is not None else None
+        headers = None
+        if cached is not None:
+            status, body, etag, last_modified, fetched_at = cached
+            if cache.is_fresh(endpoint, fetched_at):
+                cache.count("hits")
+                cache.touch(key)
+                return self._cached_result(url, status, body)
+            headers = {}
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+        if limiter is not None:
+            limiter.acquire()
+        response = self.get(url, params=params, endpoint=endpoint, politeness=politeness, headers=headers or None)
+        if cached is not None and response.status_code == 304:
+            cache.count("revalidated")
+            cache.touch(key, revalidated=True)
+            return self._cached_result(url, cached[0], cached[1])
+        if cache is not None:
+            cache.count("misses")
+            if response.status_code == 200 or response.status_code == 404:
+                cache.store(key, endpoint, response.status_code, response.content,
+                            response.headers.get("ETag"), response.headers.get("Last-Modified"))
+        response.raise_for_status()
+        started = time.perf_counter()
+        data = json_loads(response.content)
+        get_metrics().add_time("json", time.perf_counter() - started)
+        return data
+
+    @staticmethod
+    def _cached_result(url, status, body):
+        if status >= 400:
+            raise requests.exceptions.HTTPError(f"{status} Client Error (cached) for url: {url}")
+        started = time.perf_counter()
+        data = json_loads(body)
+        get_metrics().add_time("json", time.perf_counter() - started)
+        return data
+
+    def uncached(self):
+        """
+        A view of this client that bypasses the ResponseCache but shares the session, rate
+        limiter and counters. Close the original client, not the view.
+        """
+        view = copy.copy(self)
+        view.cache = None
+        return view
+
+    def stats(self):
+        """Return a dict of counters: requests, retries, bytes_received, connections_opened and connections_reused."""
+        opened = 0
+        for adapter in set(self.session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is not None:
+                    opened += pool.num_connections
+        with self.lock:
+            stats = dict(self.counters)
+        stats["connections_opened"] = opened
+        stats["connections_reused"] = max(0, stats["requests"] - opened)
+        return stats
+
+    def close(self):
+        self.session.close()
+
+
+_default_http_client = None
+
+
+def get_http_client():
+    """Return the module-wide HttpClient, creating it on first use."""
+    global _default_http_client
+    if _default_http_client is None:
+        _default_http_client = HttpClient()
+    return _default_http_client
+
+
+def format_http_stats(stats):
+    """One-line Norwegian summary of HttpClient.stats()."""
+    return (f"HTTP: {stats['requests']} forespørsler, {stats['connections_reused']} gjenbrukte tilkoblinger "
+            f"({stats['connections_opened']} nye), {stats['retries']} nye forsøk, "
+            f"{stats['bytes_received'] / 1_000_000:.1f} MB mottatt")
+
+
+def fetch_companies_page(url, params=None, page_number=0, politeness=None, client=None, label=None):
+    """
+    Fetch a page of company data from the API.
+    
+    Args:
+        url (str): API URL to fetch data from
+        params (dict, optional): Request parameters (for first call)
+        page_number (int): Page number being fetched
+        politeness (PolitenessPolicy, optional): Delay policy to wait on and report response times to
+        client (HttpClient, optional): HTTP client to use (default: the shared client)
+        label (str, optional): Shard description; progress is then printed as one line per page,
+            since several shards may be downloading at once
+    
+    Returns:
+        tuple: (data, next_url) where data is the JSON response and next_url is the link to the next page
+    """
+    client = client or get_http_client()
+    prefix = f"Henter side {page_number} ({label})..." if label else f"Henter side {page_number}..."
+    
+    try:
+        if not label:
+            echo(prefix, end="")
+            prefix = ""
+        data = client.get_json(url, params=params, endpoint="enheter", politeness=politeness)
+        
+        # Check if response contains companies
+        companies = data.get("_embedded", {}).get("enheter", [])
+        if not companies:
+            echo(f"{prefix} Ingen flere selskaper funnet.")
+            return data, None
+            
+        echo(f"{prefix} Lastet ned {len(companies)} selskaper.")
+        
+        # Find link to next page
+        next_url = data.get("_links", {}).get("next", {}).get("href")
+        return data, next_url
+        
+    except requests.exceptions.RequestException as e:
+        echo(f"\nFeil ved nedlasting av side {page_number}: {e}")
+        return None, None
+
+
+class PagePrefetcher:
+    """
+    Background producer that follows the `_links.next` chain and keeps up to
+    `depth` pages in a bounded queue, so the next page downloads while the
+    current one is processed. Iterate to get (page_number, data) tuples; a
+    page that failed to download is yielded once with data=None.
+    """
+
+    _END = object()
+
+    def __init__(self, url, params=None, depth=DEFAULT_PREFETCH_DEPTH, politeness=None, client=None, label=None):
+        self.queue = queue.Queue(maxsize=max(1, depth))
+        self.politeness = politeness
+        self.client = client
+        self.label = label
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, args=(url, params), daemon=True)
+        self.thread.start()
+
+    def _put(self, item):
+        # Block while the queue is full, but give up promptly if the consumer has stopped
+        while not self.stop_event.is_set():
+            try:
+                self.queue.put(item, timeout=0.2)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _run(self, url, params):
+        page_number = (params or {}).get("page", 0)
+        try:
+            while url and not self.stop_event.is_set():
+                data, next_url = fetch_companies_page(url, params, page_number, self.politeness, self.client, self.label)
+                if not self._put((page_number, data)) or not data:
+                    break
+                url = next_url
+                params = None
+                page_number += 1
+        except Exception as e:
+            self._put(e)
+        finally:
+            self._put(self._END)
+
+    def __iter__(self):
+        metrics = get_metrics()
+        while True:
+            started = time.perf_counter()
+            item = self.queue.get()
+            metrics.add_time("page_wait", time.perf_counter() - started)
+            if item is self._END:
+                return
+            if isinstance(item, Exception):
+                raise item
+            metrics.count("pages")
+            yield item
+
+    def close(self):
+        """Stop the producer and discard any queued pages."""
+        self.stop_event.set()
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                break
+        self.thread.join(timeout=5)
@@ -0,0 +1,303 @@
+"""
+Constants, field maps and small helpers shared by the whole package.
+"""
+
+import json
+import os
+from datetime import date, datetime, timezone
+from functools import lru_cache
+
+
+# Constants
+# BRREG_BASE_URL kan pekes mot en lokal testserver (mock_server.py)
+BRREG_BASE_URL = os.environ.get("BRREG_BASE_URL", "https://data.brreg.no").rstrip("/")
+API_BASE_URL = f"{BRREG_BASE_URL}/enhetsregisteret/api/enheter"
+REGNSKAP_API_URL = f"{BRREG_BASE_URL}/regnskapsregisteret/regnskap"
+DEFAULT_CACHE_FILE = os.path.join(os.path.expanduser("~"), ".cache", "brreg_finder", "cache.sqlite")
+DEFAULT_CACHE_MAX_MB = 500  # Maks størrelse på cachefilen
+# Hvor lenge (sekunder) et svar regnes som ferskt før det revalideres, per kilde
+CACHE_TTLS = {
+    "enheter": 24 * 3600,
+    "regnskap": 30 * 24 * 3600,  # Årsregnskap endres sjelden
+    "default": 3600,
+}
+UPDATES_URL = f"{BRREG_BASE_URL}/enhetsregisteret/api/oppdateringer/enheter"
+DUMP_URL = f"{BRREG_BASE_URL}/enhetsregisteret/api/enheter/lastned"  # Totaluttrekk (gzip JSON)
+DEFAULT_DUMP_FILE = "enheter_alle.json.gz"
+DUMP_CHUNK_SIZE = 1 << 20  # Tegn som leses om gangen fra dumpfilen
+DEFAULT_PARSE_WORKERS = 1  # Prosesser som leser dumpfilen (1 = i hovedprosessen, 0 = én per kjerne)
+PARSE_CHUNK_SIZE = 4 << 20  # Tegn per del av dumpfilen som sendes til en leseprosess
+DEFAULT_INDUSTRY_CODE = "73.11"  # Reklamebyrå som standard
+COMBINED_OUTPUT_FILE = "naeringskoder_selskaper.csv"  # Standard filnavn for --combine
+MAX_PAGE_SIZE = 1000  # Maksimalt antall selskaper per API-kall
+API_RESULT_WINDOW = 10000  # API-et lar deg ikke bla forbi så mange treff i ett søk
+SHARD_START_DATE = date(1900, 1, 1)  # Tidligste registreringsdato som tas med når søk deles opp
+DEFAULT_SHARD_WORKERS = 4  # Antall deler av et søk som hentes samtidig
+DEFAULT_FINANCE_RATE = 5.0  # Finansoppslag per sekund
+DEFAULT_FINANCE_BURST = 5  # Antall oppslag som kan sendes i en kort topp
+DEFAULT_FINANCE_WORKERS = 8  # Antall samtidige finansoppslag
+SHARED_FINANCE_RESULTS = 1000  # Ferdige finansoppslag som holdes for gjenbruk mellom næringskoder
+DEFAULT_PREFETCH_DEPTH = 2  # Antall sider som hentes i forkant
+DEFAULT_PAGE_DELAY = 0.5  # Minste pause mellom sidekall (sekunder)
+DEFAULT_PAGE_RATE = 5.0  # Sidekall per sekund, felles for alle kjøringer på maskinen
+DEFAULT_PAGE_BURST = 2  # Antall sidekall som kan sendes i en kort topp
+DEFAULT_RATE_LIMIT_FILE = os.path.join(os.path.expanduser("~"), ".cache", "brreg_finder", "ratelimit.json")
+RATE_LIMIT_DECREASE = 0.5  # Raten ganges med dette ved 429/503
+RATE_LIMIT_INCREASE = 0.5  # Økning i forespørsler per sekund, per sekund med friske svar
+RATE_LIMIT_MIN_RATE = 0.2  # Laveste rate (forespørsler per sekund) etter gjentatte 429/503
+RATE_LIMIT_MAX_PAUSE = 120  # Lengste felles pause etter Retry-After (sekunder)
+DEFAULT_MAX_RETRIES = 5  # Nye forsøk ved 5xx/429 og nettverksfeil
+DEFAULT_CHECKPOINT_INTERVAL = 30  # Sekunder mellom sjekkpunkter for --resume
+CHECKPOINT_SUFFIX = ".checkpoint.json"  # Sjekkpunktfilen ligger ved siden av utfilen
+DIFF_STATE_SUFFIX = ".diff.sqlite"  # Tilstanden for --diff ligger ved siden av utfilen
+DIFF_COLUMNS = ("Change", "OrgNo", "Name", "Field", "Old", "New")  # Kolonner i endringsfilen (--diff)
+DIFF_COMMIT_ROWS = 1000  # Rader per transaksjon i tilstandsfilen til --diff
+OUTPUT_FORMATS = {"csv": ".csv", "parquet": ".parquet", "arrow": ".arrow", "sqlite": ".sqlite", "duckdb": ".duckdb"}  # --format og filendelse
+STORE_FORMATS = ("sqlite", "duckdb")  # Formater som er en database (upsert og `query`)
+DEFAULT_ROW_GROUP_SIZE = 10000  # Rader per row group / record batch i Parquet/Arrow
+DEFAULT_STORE_BATCH_SIZE = 1000  # Rader per transaksjon i sqlite/duckdb
+DEFAULT_SERVE_PORT = 8787  # Port for spørre-API-et med --serve
+DEFAULT_REFRESH_INTERVAL = 15  # Minutter mellom oppdateringer fra oppdateringsstrømmen med --serve
+DEFAULT_QUERY_LIMIT = 100  # Rader per svar fra spørre-API-et hvis limit ikke er oppgitt
+MAX_QUERY_LIMIT = 10000  # Maks rader per svar fra spørre-API-et
+DEFAULT_PROGRESS_INTERVAL = 10  # Sekunder mellom fremdriftslinjer med --progress
+API_PROGRESS_EVERY = 1000  # Enheter mellom hvert kall til progress() i iter_companies()
+PROFILE_SAMPLE_INTERVAL = 0.005  # Sekunder mellom stikkprøver med --profile-mode sample
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000)  # Histogramgrenser (ms)
+# Norwegian names of the timed stages, in the order they are reported
+STAGE_LABELS = {
+    "http": "HTTP",
+    "json": "JSON-dekoding",
+    "page_wait": "venter på sider",
+    "parse": "lesing av dumpfil",
+    "parse_wait": "venter på leseprosesser",
+    "extract": "uttrekk av felter",
+    "filter": "filter",
+    "finance_lookup": "finansoppslag",
+    "rate_limit_wait": "ratebegrensning",
+    "finance_wait": "venter på finans",
+    "finance_apply": "finansberegning",
+    "write": "skriving",
+}
+# (connect, read) timeout i sekunder per endepunkt
+HTTP_TIMEOUTS = {
+    "enheter": (5, 60),
+    "regnskap": (5, 20),
+    "dump": (10, 300),
+    "default": (5, 30),
+}
+
+# Company fields (filter/--fields names) mapped to English CSV headers, in default order
+FIELD_MAP = {
+    "name": "Name",
+    "orgnr": "OrgNo",
+    "incorporation_date": "IncorporationDate",
+    "registration_date": "RegistrationDate",
+    "email": "Email",
+    "phone": "Phone",
+    "mobile": "Mobile",
+    "website": "Website",
+    "address": "Address",
+    "zipcode": "Zipcode",
+    "state": "State",
+    "street": "Street",
+    "in_liquidation": "InLiquidation",
+    "employees": "Employees"
+}
+
+# Extra first column when several industry codes are written to one file
+INDUSTRY_COLUMN = "Industry"
+# Row key with all næringskoder of a company, added for sinks that store them (StoreSink)
+INDUSTRY_CODES_KEY = "_industry_codes"
+
+# Add this mapping for financial fields to human-readable CSV headers
+FIN_FIELD_CSV_MAP = {
+    "fin_period_start": "Finance Period Start",
+    "fin_period_end": "Finance Period End",
+    "fin_year": "Finance Year",
+    "fin_currency": "Currency",
+    "fin_account_type": "Account Type",
+    "fin_in_liquidation": "In Liquidation (Finance)",
+    "fin_small_company": "Small Company (Finance)",
+    "fin_audited": "Audited",
+    "fin_revenue": "Revenue",
+    "fin_operating_result": "Operating Result",
+    "fin_net_profit": "Net Profit",
+    "fin_total_assets": "Total Assets",
+    "fin_total_equity": "Total Equity",
+    "fin_total_liabilities": "Total Liabilities",
+    "fin_short_term_liabilities": "Short-term Liabilities",
+    "fin_long_term_liabilities": "Long-term Liabilities",
+    "fin_retained_earnings": "Retained Earnings",
+    "fin_contributed_equity": "Contributed Equity",
+    "fin_current_assets": "Current Assets",
+    "fin_fixed_assets": "Fixed Assets",
+    "fin_net_financial_items": "Net Financial Items",
+    "fin_financial_income": "Financial Income",
+    "fin_financial_expenses": "Financial Expenses",
+    # Calculated fields
+    "fin_profit_margin": "Profit Margin (%)",
+    "fin_equity_ratio": "Equity Ratio (%)",
+    "fin_debt_ratio": "Debt Ratio (%)",
+    "fin_return_on_equity": "Return on Equity (%)"
+}
+
+# Column types for --format parquet/arrow; fields not listed are written as strings.
+# "dictionary" is a dictionary-encoded string column for values that repeat a lot.
+FIELD_TYPES = {
+    "incorporation_date": "date",
+    "registration_date": "date",
+    "zipcode": "dictionary",
+    "state": "dictionary",
+    "in_liquidation": "bool",
+    "employees": "int64",
+}
+FIN_FIELD_TYPES = {
+    "fin_period_start": "date",
+    "fin_period_end": "date",
+    "fin_year": "int64",
+    "fin_currency": "dictionary",
+    "fin_account_type": "dictionary",
+    "fin_in_liquidation": "bool",
+    "fin_small_company": "bool",
+    "fin_audited": "bool",
+    # Amounts are whole NOK
+    "fin_revenue": "int64",
+    "fin_operating_result": "int64",
+    "fin_net_profit": "int64",
+    "fin_total_assets": "int64",
+    "fin_total_equity": "int64",
+    "fin_total_liabilities": "int64",
+    "fin_short_term_liabilities": "int64",
+    "fin_long_term_liabilities": "int64",
+    "fin_retained_earnings": "int64",
+    "fin_contributed_equity": "int64",
+    "fin_current_assets": "int64",
+    "fin_fixed_assets": "int64",
+    "fin_net_financial_items": "int64",
+    "fin_financial_income": "int64",
+    "fin_financial_expenses": "int64",
+    "fin_profit_margin": "float64",
+    "fin_equity_ratio": "float64",
+    "fin_debt_ratio": "float64",
+    "fin_return_on_equity": "float64",
+}
+
+# Year-over-year growth in --finance-history: field -> (source field, header)
+HISTORY_GROWTH_FIELDS = {
+    "fin_revenue_growth": ("fin_revenue", "Revenue Growth (%)"),
+    "fin_net_profit_growth": ("fin_net_profit", "Net Profit Growth (%)"),
+    "fin_equity_growth": ("fin_total_equity", "Equity Growth (%)"),
+}
+
+# Calculated ratios (in percent): field -> (numerator, denominator)
+FINANCE_RATIOS = {
+    "fin_profit_margin": ("fin_net_profit", "fin_revenue"),
+    "fin_equity_ratio": ("fin_total_equity", "fin_total_assets"),
+    "fin_debt_ratio": ("fin_total_liabilities", "fin_total_assets"),
+    "fin_return_on_equity": ("fin_net_profit", "fin_total_equity"),
+}
+
+# Financial fields that are compared as numbers in --filter (name without fin_ prefix)
+NUMERIC_FINANCE_FIELDS = (
+    "revenue", "operating_result", "net_profit", "total_assets", "total_equity", "total_liabilities",
+    "short_term_liabilities", "long_term_liabilities", "retained_earnings", "contributed_equity",
+    "current_assets", "fixed_assets", "net_financial_items", "financial_income", "financial_expenses",
+    "profit_margin", "equity_ratio", "debt_ratio", "return_on_equity"
+)
+
+# SQL column types for the store (--format sqlite/duckdb). Dates stay ISO text, so they
+# compare the same way in SQL as in --filter.
+STORE_SQL_TYPES = {"string": "TEXT", "dictionary": "TEXT", "date": "TEXT", "int64": "BIGINT", "float64": "DOUBLE", "bool": "BOOLEAN"}
+STORE_COMPANY_COLUMNS = (
+    (("orgnr", "string"),)
+    + tuple((f, FIELD_TYPES.get(f, "string")) for f in FIELD_MAP if f != "orgnr")
+    + (("industry_code", "string"), ("finance_fetched", "bool"), ("fin_year", "int64"), ("updated_at", "string"))
+)
+STORE_FINANCE_COLUMNS = tuple((f, FIN_FIELD_TYPES.get(f, "string")) for f in FIN_FIELD_CSV_MAP if f != "fin_year")
+# Financial columns with an index in the store
+STORE_INDEXED_FINANCE_FIELDS = ("fin_revenue", "fin_operating_result", "fin_net_profit", "fin_total_assets",
+                                "fin_total_equity", "fin_profit_margin", "fin_equity_ratio")
+
+
+def default_output_file(naeringskode):
+    """Default CSV filename for an industry code, e.g. 73_11_selskaper.csv."""
+    return f"{naeringskode.replace('.', '_')}_selskaper.csv"
+
+
+def output_format_for_file(output_file):
+    """
+    Output format implied by a filename: parquet for .parquet/.pq, arrow for .arrow/.feather/.ipc,
+    sqlite for .sqlite/.sqlite3/.db, duckdb for .duckdb, otherwise csv.
+    """
+    ext = os.path.splitext(output_file)[1].lower()
+    if ext in (".parquet", ".pq"):
+        return "parquet"
+    if ext in (".arrow", ".feather", ".ipc"):
+        return "arrow"
+    if ext in (".sqlite", ".sqlite3", ".db"):
+        return "sqlite"
+    if ext == ".duckdb":
+        return "duckdb"
+    return "csv"
+
+
+def output_file_for_code(output_template, naeringskode, multiple):
+    """
+    Output file for one industry code. With a single code the given --output is used as is;
+    with several codes the code is inserted before the extension (or the default name is used).
+    """
+    if not output_template:
+        return default_output_file(naeringskode)
+    if not multiple:
+        return output_template
+    stem, ext = os.path.splitext(output_template)
+    return f"{stem}_{naeringskode.replace('.', '_')}{ext or '.csv'}"
+
+
+@lru_cache(maxsize=1)
+def import_orjson():
+    """orjson if it is installed, else None; JSON is then decoded with the standard library."""
+    try:
+        import orjson
+    except ImportError:
+        return None
+    return orjson
+
+
+def json_loads(data):
+    """Decode one JSON document (str or UTF-8 bytes), with orjson when it is available."""
+    orjson = import_orjson()
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def utc_timestamp():
+    """Current UTC time in the format the update feed expects for `dato`."""
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+
+# Where status messages go: None prints them to stdout, otherwise a callable taking one line of text
+_echo_handler = None
+
+
+def set_echo(handler):
+    """
+    Route status messages to handler (a callable taking one string) instead of stdout.
+    None restores printing. Returns the previous handler so callers can put it back.
+    """
+    global _echo_handler
+    previous, _echo_handler = _echo_handler, handler
+    return previous
+
+
+def echo(*values, sep=" ", end="\n", flush=False):
+    """print() for status messages; library callers can redirect or silence them with set_echo()."""
+    handler = _echo_handler
+    if handler is None:
+        print(*values, sep=sep, end=end, flush=flush)
+        return
+    text = sep.join(str(value) for value in values).strip()
+    if text:
+        handler(text)
@@ -0,0 +1,449 @@
+"""
+Crawling the search API: sharding of large codes, checkpoints and fetch_companies.
+"""
+
+import json
+import os
+import time
+from collections import deque
+from datetime import date, timedelta
+
+from .cache import format_cache_stats
+from .client import HttpClient, PagePrefetcher, PolitenessPolicy, format_http_stats
+from .common import (
+    API_BASE_URL, API_RESULT_WINDOW, CHECKPOINT_SUFFIX, DEFAULT_CHECKPOINT_INTERVAL, DEFAULT_FINANCE_BURST,
+    DEFAULT_FINANCE_RATE, DEFAULT_FINANCE_WORKERS, DEFAULT_MAX_RETRIES, DEFAULT_PAGE_DELAY, DEFAULT_PREFETCH_DEPTH,
+    DEFAULT_SHARD_WORKERS, MAX_PAGE_SIZE, SHARD_START_DATE, echo, utc_timestamp,
+)
+from .filters import plan_pushdown
+from .finance import FinanceFetcher
+from .metrics import get_metrics
+from .pipeline import NO_LOOKUP, collect_financials, open_pipelines, prepare_filter
+from .sinks import open_history
+
+
+def count_companies(params, client, politeness=None):
+    """Number of entities matching a search (page.totalElements), using a one-row request."""
+    probe = dict(params, size=1, page=0)
+    data = client.get_json(API_BASE_URL, params=probe, endpoint="enheter", politeness=politeness)
+    return int(data.get("page", {}).get("totalElements", 0))
+
+
+def plan_shards(params, client, window=None, politeness=None):
+    """
+    Split a search into disjoint shards that each fit under the API's paging ceiling.
+
+    The search is split on registreringsdatoEnhetsregisteret: date windows are halved
+    until every window has at most `window` entities (empty windows are dropped).
+    Registration date bounds already in `params` (from filter pushdown) are kept.
+    Returns a list of shard dicts with `params`, `label` and `expected` (entity count).
+    """
+    window = window or API_RESULT_WINDOW
+    total = count_companies(params, client, politeness)
+    if total <= window:
+        return [{"params": dict(params), "label": "", "expected": total}]
+    echo(f"{total} enheter er mer enn API-et kan bla gjennom ({window}), deler opp søket etter registreringsdato...")
+    shards = []
+
+    def split(lo, hi, count):
+        if count == 0:
+            return
+        if count <= window or lo >= hi:
+            if count > window:
+                echo(f"MERK: {count} enheter registrert {lo.isoformat()} kan ikke deles mer; bare {window} hentes.")
+            label = lo.isoformat() if lo == hi else f"{lo.isoformat()}–{hi.isoformat()}"
+            shards.append({"params": dict(shard_params, fraRegistreringsdatoEnhetsregisteret=lo.isoformat(),
+                                          tilRegistreringsdatoEnhetsregisteret=hi.isoformat()),
+                           "label": label, "expected": count})
+            return
+        mid = lo + (hi - lo) // 2
+        left = count_companies(dict(shard_params, fraRegistreringsdatoEnhetsregisteret=lo.isoformat(),
+                                    tilRegistreringsdatoEnhetsregisteret=mid.isoformat()), client, politeness)
+        # The halves are disjoint, so the right half's count follows from the parent's
+        split(lo, mid, left)
+        split(mid + timedelta(days=1), hi, count - left)
+
+    shard_params = dict(params)
+    start = params.get("fraRegistreringsdatoEnhetsregisteret")
+    end = params.get("tilRegistreringsdatoEnhetsregisteret")
+    split(date.fromisoformat(start) if start else SHARD_START_DATE, date.fromisoformat(end) if end else date.today(), total)
+    echo(f"Søket er delt i {len(shards)} deler.")
+    return shards
+
+
+class ShardedCrawl:
+    """
+    Crawl a list of shards (see plan_shards) with up to `parallel` shards downloading at
+    once, each through its own PagePrefetcher and PolitenessPolicy. Entities are yielded
+    in shard order, deduplicated on organisasjonsnummer. Per-shard counts are kept in
+    `shards[i]["received"]` so completeness can be checked against `expected`.
+
+    To resume an interrupted crawl, pass the shard and page to continue from together with
+    the orgnrs already seen. `on_page_end(shard_index, next_page)` is called once every
+    entity of a page has been consumed, with the position to resume from; it is not called
+    again after a page failed to download (`failed` is then True). `finished` is True once
+    every shard has been read to the end (not when the caller stopped early, e.g. at a limit).
+    """
+
+    def __init__(self, shards, client, parallel=DEFAULT_SHARD_WORKERS, prefetch=DEFAULT_PREFETCH_DEPTH, page_delay=DEFAULT_PAGE_DELAY,
+                 start_shard=0, start_page=0, seen=None, on_page_end=None):
+        self.shards = shards
+        self.client = client
+        self.parallel = max(1, parallel)
+        self.prefetch = prefetch
+        self.page_delay = page_delay
+        self.running = deque()
+        self.seen = set(seen or ())
+        self.duplicates = 0
+        self.next_shard = start_shard
+        self.resume_page = {start_shard: start_page} if start_page else {}
+        self.on_page_end = on_page_end
+        self.failed = False
+        self.finished = False
+        get_metrics().count("expected", sum(shard["expected"] for shard in shards[start_shard:]))
+
+    def _start_more(self):
+        while self.next_shard < len(self.shards) and len(self.running) < self.parallel:
+            index = self.next_shard
+            shard = self.shards[index]
+            page = self.resume_page.pop(index, None)
+            if page is None:
+                page = 0
+                shard["received"] = 0
+            pages = PagePrefetcher(API_BASE_URL, dict(shard["params"], size=MAX_PAGE_SIZE, page=page), depth=self.prefetch,
+                                   politeness=PolitenessPolicy(min_delay=self.page_delay), client=self.client,
+                                   label=shard["label"] or None)
+            self.running.append((index, shard, pages))
+            self.next_shard += 1
+
+    def _page_done(self, shard_index, next_page):
+        if self.on_page_end is not None and not self.failed:
+            self.on_page_end(shard_index, next_page)
+
+    def __iter__(self):
+        self._start_more()
+        while self.running:
+            index, shard, pages = self.running[0]
+            try:
+                for page_number, data in pages:
+                    if data is None:
+                        self.failed = True
+                    if not data:
+                        break
+                    for company in data.get("_embedded", {}).get("enheter", []):
+                        shard["received"] += 1
+                        orgnr = company.get("organisasjonsnummer")
+                        if orgnr in self.seen:
+                            self.duplicates += 1
+                            continue
+                        self.seen.add(orgnr)
+                        yield company
+                    self._page_done(index, page_number + 1)
+            finally:
+                pages.close()
+            self.running.popleft()
+            self._start_more()
+            self._page_done(index + 1, 0)
+        self.finished = True
+
+    def close(self):
+        for _, _, pages in self.running:
+            pages.close()
+        self.running.clear()
+
+    def incomplete(self, shard):
+        """True if a shard returned fewer entities than expected because pages failed or the result was capped."""
+        received = shard.get("received")
+        return received is not None and received < shard["expected"] and (self.failed or self.finished)
+
+    def report(self):
+        """
+        Print per-shard counts (with more than one shard) and flag shards that returned fewer
+        entities than expected. A single shard is only reported when it is incomplete.
+        """
+        if len(self.shards) <= 1:
+            for shard in self.shards:
+                if self.incomplete(shard):
+                    echo(f"\nUFULLSTENDIG: hentet {shard['received']} av {shard['expected']} enheter"
+                         + (" (noen sider kunne ikke hentes)." if self.failed else "."))
+            return
+        echo("\nAntall per del (hentet / forventet):")
+        for shard in self.shards:
+            received = shard.get("received")
+            status = "  <- UFULLSTENDIG" if self.incomplete(shard) else ""
+            echo(f"  {shard['label']}: {received if received is not None else '-'} / {shard['expected']}{status}")
+        if self.duplicates:
+            echo(f"  {self.duplicates} duplikater fjernet")
+
+
+def plan_crawl(naeringskode, client, prefetch=DEFAULT_PREFETCH_DEPTH, page_delay=DEFAULT_PAGE_DELAY,
+               shard_workers=DEFAULT_SHARD_WORKERS, on_page_end=None, search_params=None):
+    """
+    Plan the shards for an industry code and return a ShardedCrawl over them (iterate it for raw entities).
+    search_params (see plan_pushdown) narrows the search further.
+    """
+    params = dict(search_params or {}, naeringskode=naeringskode)
+    shards = plan_shards(params, client, politeness=PolitenessPolicy(min_delay=page_delay))
+    return ShardedCrawl(shards, client, parallel=shard_workers, prefetch=prefetch, page_delay=page_delay,
+                        on_page_end=on_page_end)
+
+
+class CrawlJournal:
+    """
+    Checkpoint journal that lets an interrupted API crawl continue with --resume.
+    A checkpoint holds the crawl position (industry code, shard and page), the orgnrs
+    already seen, the finance lookups still in flight (with the rows waiting on them),
+    per-pipeline counters and the byte offset of each output file. It is written to a
+    temporary file and renamed over the journal, so a crash never leaves a partial one.
+    `signature` describes the run; a journal from a run with other parameters is ignored.
+    """
+
+    def __init__(self, path, signature, interval=DEFAULT_CHECKPOINT_INTERVAL):
+        self.path = path
+        # Round-trip through JSON so it compares equal to a loaded signature
+        self.signature = json.loads(json.dumps(signature))
+        self.interval = interval
+        self.last_save = time.monotonic()
+        self.saves = 0
+
+    def load(self):
+        """Return the saved state if the journal exists and belongs to an identical run, else None."""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            echo(f"Kunne ikke lese sjekkpunktfilen {self.path}: {e}")
+            return None
+        if state.get("signature") != self.signature:
+            echo(f"Sjekkpunktet i {self.path} er fra en kjøring med andre parametere og blir ikke brukt.")
+            return None
+        return state
+
+    @property
+    def enabled(self):
+        return self.interval > 0
+
+    def due(self):
+        """True if checkpointing is enabled and `interval` seconds have passed since the last save."""
+        return self.enabled and time.monotonic() - self.last_save >= self.interval
+
+    def save(self, state):
+        state = dict(state, signature=self.signature, saved_at=utc_timestamp())
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self.last_save = time.monotonic()
+        self.saves += 1
+
+    def remove(self):
+        for path in (self.path, self.path + ".tmp"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def fetch_companies(naeringskode, output_file, selected_fields, field_map, limit=None, filter_expr=None, finance=False, selected_finance_fields=None,
+                    workers=DEFAULT_FINANCE_WORKERS, finance_rate=DEFAULT_FINANCE_RATE, finance_burst=DEFAULT_FINANCE_BURST,
+                    prefetch=DEFAULT_PREFETCH_DEPTH, page_delay=DEFAULT_PAGE_DELAY, max_retries=DEFAULT_MAX_RETRIES, cache=None,
+                    shard_workers=DEFAULT_SHARD_WORKERS, combine=False, resume=False, checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL,
+                    output_format="csv", finance_history=None, history_output=None, pushdown=True, rate_limiter=None,
+                    changes=None):
+    """
+    Main function: Fetch all companies with the specified industry code(s) and save to CSV (English headers),
+    or to Parquet / Arrow IPC with typed columns if output_format is "parquet" or "arrow".
+    naeringskode may be one code or a list of codes (prefixes such as "73" work as in the API);
+    output_file is then a list with one file per code, or a single file if combine is True,
+    in which case an Industry column tells the codes apart. All codes are run by one scheduler
+    sharing the HTTP pool, the finance rate budget and finance results for overlapping entities.
+    Matching rows are streamed to the file through a CsvSink as soon as they pass the filter.
+    Codes with more entities than the API can page through are split into registration-date shards
+    (plan_shards) and up to `shard_workers` shards are crawled at once, deduplicated on orgnr.
+    Pages are downloaded by background PagePrefetchers (up to `prefetch` pages ahead) paced by an
+    adaptive PolitenessPolicy, so network time overlaps with processing.
+    All requests share one pooled HttpClient sized to the worker count, reading through `cache`
+    (a ResponseCache) and waiting for `rate_limiter` (a SharedRateLimiter) if given.
+    If finance is True, also fetch financial data for each company. Lookups run concurrently on a
+    FinanceFetcher (worker pool behind a token bucket) while paging and filtering continue; results
+    are merged back in input order.
+    Every `checkpoint_interval` seconds (at a page boundary) progress is saved to a CrawlJournal next
+    to the first output file; with resume=True a run with the same parameters continues from the last
+    checkpoint and produces the same files as an uninterrupted run. The journal is removed on success.
+    Columnar files cannot be appended to, so checkpoints are only taken for CSV output.
+    finance_history ("long" or "wide") keeps every accounting period of the matching companies
+    and writes them, with year-over-year growth, to history_output (see FinanceHistoryWriter).
+    With pushdown=True the conditions of the filter that the search API supports are sent as
+    request parameters (plan_pushdown), so fewer pages are downloaded.
+    With a ChangeTracker as `changes` the rows are compared with the previous run (--diff).
+    filter_expr may be a string or a CompiledFilter (see compile_filter); a string is compiled once here.
+    Only include requested financial fields if specified.
+    """
+    industry_codes = [naeringskode] if isinstance(naeringskode, str) else list(naeringskode)
+    output_files = [output_file] if isinstance(output_file, str) else list(output_file)
+    echo(f"Starter nedlasting av selskaper med næringskode {', '.join(industry_codes)}..." + (f" (grense: {limit})" if limit else ""))
+    compiled_filter = prepare_filter(filter_expr, finance)
+    search_params, pushed = plan_pushdown(compiled_filter) if pushdown else ({}, [])
+    if pushed:
+        echo(f"Filtrerer i API-et: {' and '.join(pushed)} ({', '.join(f'{k}={v}' for k, v in search_params.items())})")
+    journal = CrawlJournal(output_files[0] + CHECKPOINT_SUFFIX, {
+        "version": 2,  # Journals from before pending_finance kept the kind of each entry are ignored
+        "industry_codes": industry_codes,
+        "output_files": output_files,
+        "selected_fields": list(selected_fields),
+        "selected_finance_fields": selected_finance_fields,
+        "filter": compiled_filter.expr if compiled_filter is not None else None,
+        "finance": finance,
+        "limit": limit,
+        "combine": combine,
+    }, interval=checkpoint_interval if output_format == "csv" and not finance_history else 0)
+    state = None
+    if resume:
+        state = journal.load()
+        if state is None:
+            echo(f"Fant ikke noe sjekkpunkt å fortsette fra i {journal.path}; starter fra begynnelsen.")
+        else:
+            echo(f"Fortsetter fra sjekkpunkt lagret {state['saved_at']}.")
+    client = HttpClient(pool_size=(workers if finance else 0) + prefetch * shard_workers + 2, max_retries=max_retries, cache=cache,
+                        rate_limiter=rate_limiter)
+    # --diff compares with the previous run, so its pages must not come from the response cache
+    page_client = client.uncached() if changes is not None else client
+    fetcher = None
+    if finance:
+        fetcher = FinanceFetcher(workers=workers, rate=finance_rate, burst=finance_burst, client=client,
+                                 share_results=len(industry_codes) > 1, history=bool(finance_history))
+    history = None
+    try:
+        history = open_history(finance_history, history_output, selected_finance_fields, output_format)
+        # Rows are streamed to disk as they pass the filter
+        sinks, pipelines = open_pipelines(industry_codes, output_files, selected_fields, field_map, compiled_filter, fetcher,
+                                          selected_finance_fields, limit, finance, combine,
+                                          resume_offsets=[saved["offset"] for saved in state["sinks"]] if state else None,
+                                          output_format=output_format, history=history, changes=changes)
+    except (IOError, ImportError) as e:
+        echo(f"\nFeil ved lagring av fil: {e}")
+        if history is not None:
+            history.close()
+        if fetcher is not None:
+            fetcher.close()
+        client.close()
+        return
+
+    start_code = 0
+    if state is not None:
+        start_code = state["code_index"]
+        for sink, saved in zip(sinks, state["sinks"]):
+            sink.rows_written = saved["rows"]
+        for pipeline, saved in zip(pipelines, state["pipelines"]):
+            pipeline.rows = saved["rows"]
+            pipeline.seen = saved["seen"]
+            pipeline.limit_reported = pipeline.done
+        if fetcher is not None:
+            # Lookups that were in flight when the checkpoint was taken are queued again first;
+            # rows that needed no lookup (or had a result already) are queued as they were
+            for index, company_data, company_dict, kind, fin_data in state["pending_finance"]:
+                item = (pipelines[index], company_data, company_dict)
+                if kind == "lookup":
+                    fetcher.submit(company_dict.get("orgnr"), item)
+                else:
+                    fetcher.submit_result(item, NO_LOOKUP if kind == "skipped" else fin_data)
+
+    crawls = []
+
+    def checkpoint(code_index, crawl=None, shard_index=0, page=0):
+        # Past a failed page the journal must keep pointing before it, so --resume retries it
+        if any(c.failed for c in crawls):
+            return
+        if fetcher is not None:
+            collect_financials(fetcher)
+        pipeline_index = {id(p): i for i, p in enumerate(pipelines)}
+        journal.save({
+            "code_index": code_index,
+            "shards": crawl.shards if crawl is not None else None,
+            "shard_index": shard_index,
+            "page": page,
+            "seen": list(crawl.seen) if crawl is not None else [],
+            "duplicates": crawl.duplicates if crawl is not None else 0,
+            # Each as [pipeline, row, company, "lookup"/"result"/"skipped", known result]
+            "pending_finance": [[pipeline_index[id(p)], company_data, company_dict,
+                                 "skipped" if fin_data is NO_LOOKUP else "result" if known else "lookup",
+                                 fin_data if fin_data is not NO_LOOKUP else None]
+                                for (p, company_data, company_dict), known, fin_data in fetcher.pending_items()]
+                               if fetcher is not None else [],
+            "pipelines": [{"rows": p.rows, "seen": p.seen} for p in pipelines],
+            "sinks": [{"offset": sink.position(), "rows": sink.rows_written} for sink in sinks],
+        })
+
+    completed = False
+    try:
+        for index, pipeline in enumerate(pipelines):
+            if index < start_code:
+                continue
+
+            def on_page_end(shard_index, next_page, index=index):
+                if journal.due():
+                    checkpoint(index, crawls[-1], shard_index, next_page)
+
+            if state is not None and index == start_code and state["shards"] is not None:
+                crawl = ShardedCrawl(state["shards"], page_client, parallel=shard_workers, prefetch=prefetch, page_delay=page_delay,
+                                     start_shard=state["shard_index"], start_page=state["page"], seen=state["seen"],
+                                     on_page_end=on_page_end)
+                crawl.duplicates = state["duplicates"]
+            else:
+                # Large codes are split into shards that each fit under the API's paging ceiling.
+                # Finance lookups from earlier codes keep running while the next code is crawled.
+                crawl = plan_crawl(pipeline.label, page_client, prefetch, page_delay, shard_workers, on_page_end=on_page_end,
+                                   search_params=search_params)
+            crawls.append(crawl)
+            for company in crawl:
+                if not pipeline.feed(company):
+                    break
+            crawl.close()
+            if journal.enabled:
+                checkpoint(index + 1)
+        if fetcher is not None and not all(p.done for p in pipelines):
+            echo(f"Venter på {fetcher.in_flight()} gjenstående finansoppslag...")
+            collect_financials(fetcher, block=True)
+        if any(crawl.failed for crawl in crawls):
+            echo("\nNoen sider kunne ikke hentes.")
+        else:
+            completed = True
+            journal.remove()
+    except Exception as e:
+        echo(f"\nEn uventet feil oppstod: {e}")
+        import traceback
+        traceback.print_exc()
+    finally:
+        for crawl in crawls:
+            crawl.close()
+            crawl.report()
+        if fetcher is not None:
+            fetcher.close()
+        for sink in sinks:
+            sink.close()
+        if not any(sink.rows_written for sink in sinks):
+            echo("\nIngen selskaper å lagre.")
+        echo()
+        for pipeline in pipelines:
+            echo(f"Fant {pipeline.rows} selskaper som matcher filter blant {pipeline.seen} enheter med næringskode {pipeline.label}")
+        echo(f"Data lagret til {', '.join(sink.output_file for sink in sinks)}")
+        if history is not None:
+            history.close()
+            echo(history.summary())
+        if changes is not None:
+            changes.finish(completed)
+            echo(changes.summary())
+        if not completed and os.path.exists(journal.path):
+            echo(f"Fremdriften er lagret i {journal.path}. Kjør samme kommando med --resume for å fortsette.")
+        if fetcher is not None and fetcher.reused:
+            echo(f"{fetcher.reused} finansoppslag gjenbrukt for selskaper med flere næringskoder")
+        http_stats = client.stats()
+        get_metrics().record("http", http_stats)
+        echo(format_http_stats(http_stats))
+        if cache is not None:
+            echo(format_cache_stats(cache.stats()))
+        client.close()
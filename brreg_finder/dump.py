@@ -0,0 +1,526 @@
+"""
+Reading the bulk download (totaluttrekket), serially or with several processes.
+"""
+
+import csv
+import gzip
+import io
+import json
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from .cache import format_cache_stats
+from .common import (
+    DEFAULT_FINANCE_BURST, DEFAULT_FINANCE_RATE, DEFAULT_FINANCE_WORKERS, DEFAULT_MAX_RETRIES, DEFAULT_PARSE_WORKERS,
+    DUMP_CHUNK_SIZE, DUMP_URL, FIELD_MAP, PARSE_CHUNK_SIZE, echo, json_loads,
+)
+from .filters import compile_filter
+from .finance import FinanceFetcher
+from .metrics import get_metrics
+from .pipeline import collect_financials, open_pipelines, prepare_filter
+from .records import company_industry_codes, extract_company_data, industry_matches
+from .sinks import open_history
+
+
+def open_dump(path):
+    """Open a dump file for text reading, decompressing gzip on the fly if needed."""
+    with open(path, "rb") as f:
+        magic = f.read(2)
+    if magic == b"\x1f\x8b":
+        return gzip.open(path, "rt", encoding="utf-8", newline="")
+    return open(path, "r", encoding="utf-8", newline="")
+
+
+def iter_json_values(stream, chunk_size=DUMP_CHUNK_SIZE):
+    """
+    Incrementally parse a JSON array (or a sequence of concatenated / newline-delimited
+    JSON objects) from a text stream, yielding one element at a time. Only about one
+    chunk of text is held in memory.
+    """
+    decoder = json.JSONDecoder()
+    buf = ""
+    pos = 0
+    eof = False
+    in_array = None
+    while True:
+        # Skip whitespace and separators, refilling the buffer as needed
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos < len(buf) or eof:
+                break
+            buf = stream.read(chunk_size)
+            pos = 0
+            eof = not buf
+        if pos >= len(buf):
+            if in_array:
+                raise ValueError("Dumpfilen slutter midt i JSON-listen")
+            return
+        if in_array is None:
+            in_array = buf[pos] == "["
+            if in_array:
+                pos += 1
+                continue
+        if in_array and buf[pos] == "]":
+            return
+        try:
+            value, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            chunk = stream.read(chunk_size)
+            eof = not chunk
+            buf = buf[pos:] + chunk
+            pos = 0
+            continue
+        yield value
+        pos = end
+
+
+def _unflatten_csv_row(row):
+    """Turn a CSV dump row with dotted column names (forretningsadresse.postnummer) into an API-shaped dict."""
+    company = {}
+    for key, value in row.items():
+        if key is None or value in ("", None):
+            continue
+        if value in ("true", "false"):
+            value = value == "true"
+        elif key == "antallAnsatte" and value.isdigit():
+            value = int(value)
+        elif key.endswith(".adresse"):
+            value = [value]
+        target = company
+        parts = key.split(".")
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        target[parts[-1]] = value
+    return company
+
+
+def iter_dump_companies(path):
+    """Yield raw entities (same shape as the API's `enheter`) from a JSON or CSV dump file."""
+    with open_dump(path) as stream:
+        name = path.lower()
+        if name.endswith(".gz"):
+            name = name[:-3]
+        if name.endswith(".csv"):
+            for row in csv.DictReader(stream):
+                yield _unflatten_csv_row(row)
+        else:
+            yield from iter_json_values(stream)
+
+
+def download_dump(path, client=None):
+    """Download the full Enhetsregisteret dump (gzip JSON) to path, keeping it compressed."""
+    if client is None:
+        from .client import get_http_client
+        client = get_http_client()
+    echo(f"Laster ned totaluttrekk fra Enhetsregisteret til {path} (dette kan ta noen minutter)...")
+    headers = {"Accept": "application/vnd.brreg.enhetsregisteret.enhet.v2+gzip;charset=UTF-8"}
+    response = client.get(DUMP_URL, endpoint="dump", headers=headers, stream=True)
+    response.raise_for_status()
+    partial = path + ".part"
+    with open(partial, "wb") as f:
+        for chunk in response.raw.stream(DUMP_CHUNK_SIZE, decode_content=False):
+            f.write(chunk)
+    os.replace(partial, path)
+
+
+# Characters between top-level entities of a JSON dump (and around the array)
+JSON_SEPARATORS = " \t\r\n,[]"
+
+
+class DumpChunks:
+    """
+    Split a dump file into chunks of whole entities without parsing it, so reader
+    processes can decode them independently (parse_dump_chunk). Only the layout is
+    sniffed: CSV rows end at a line break outside quotes; in a JSON dump the first
+    entity shows where entities end, either at a closing brace on its own line with
+    the entity's indentation (pretty-printed) or at any line break (one entity per
+    line). `layout` is None for JSON without line breaks between entities, which must
+    be read serially with iter_dump_companies. Iterate to get the chunks in file order.
+    """
+
+    def __init__(self, path, chunk_size=PARSE_CHUNK_SIZE):
+        self.stream = open_dump(path)
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.eof = False
+        name = path.lower()
+        if name.endswith(".gz"):
+            name = name[:-3]
+        if name.endswith(".csv"):
+            self._read()
+            end = self._header_end()
+            while end < 0 and self._read():
+                end = self._header_end()
+            end = len(self.buf) if end < 0 else end + 1
+            header, self.buf = self.buf[:end], self.buf[end:]
+            self.layout = ("csv", next(csv.reader(io.StringIO(header, newline="")), []))
+        else:
+            self.layout = self._json_layout()
+
+    def _read(self):
+        chunk = self.stream.read(self.chunk_size)
+        self.eof = not chunk
+        self.buf += chunk
+        return not self.eof
+
+    def _json_layout(self):
+        decoder = json.JSONDecoder()
+        while True:
+            start = len(self.buf) - len(self.buf.lstrip(JSON_SEPARATORS))
+            try:
+                first, end = decoder.raw_decode(self.buf, start)
+                break
+            except json.JSONDecodeError:
+                if not self._read():
+                    return None
+        if not isinstance(first, dict):
+            return None
+        close = end - 1
+        line_start = self.buf.rfind("\n", start, close)
+        if line_start >= 0 and not self.buf[line_start + 1:close].strip():
+            # Pretty-printed: nested objects close with deeper indentation
+            return ("json", self.buf[line_start:end], "}")
+        gap = end
+        while gap < len(self.buf) and self.buf[gap] in JSON_SEPARATORS:
+            gap += 1
+        if gap == len(self.buf) and not self.eof:
+            self._read()
+            return self._json_layout()
+        if "\n" in self.buf[end:gap]:
+            return ("json", "\n", "")
+        return None
+
+    def _header_end(self):
+        end = self.buf.find("\n")
+        while end >= 0 and self.buf.count('"', 0, end) % 2:
+            end = self.buf.find("\n", end + 1)
+        return end
+
+    def _csv_cut(self):
+        # A line break is a row boundary when an even number of quotes precede it
+        cut = self.buf.rfind("\n")
+        while cut >= 0 and self.buf.count('"', 0, cut) % 2:
+            cut = self.buf.rfind("\n", 0, cut)
+        return cut + 1
+
+    def _cut(self):
+        if self.layout[0] == "csv":
+            return self._csv_cut()
+        boundary = self.layout[1]
+        cut = self.buf.rfind(boundary)
+        return cut + len(boundary) if cut >= 0 else 0
+
+    def __iter__(self):
+        while True:
+            cut = self._cut() if len(self.buf) >= self.chunk_size else 0
+            if cut:
+                chunk, self.buf = self.buf[:cut], self.buf[cut:]
+                yield chunk
+            elif self.eof or not self._read():
+                break
+        if self.buf.strip(JSON_SEPARATORS):
+            yield self.buf
+        self.buf = ""
+
+    def close(self):
+        self.stream.close()
+
+
+def iter_chunk_entities(layout, chunk, industry_codes=None):
+    """
+    Yield the raw entities in a DumpChunks chunk, in order. With industry_codes, JSON
+    entities whose text contains none of the codes are yielded as None without being
+    decoded, since they cannot match.
+    """
+    if layout[0] == "csv":
+        for row in csv.DictReader(io.StringIO(chunk, newline=""), fieldnames=layout[1]):
+            yield _unflatten_csv_row(row)
+        return
+    _, boundary, keep = layout
+    pieces = chunk.split(boundary)
+    last = len(pieces) - 1
+    for i, piece in enumerate(pieces):
+        piece = (piece + keep if i < last else piece).strip(JSON_SEPARATORS)
+        if not piece:
+            continue
+        if piece[0] != "{" or piece[-1] != "}":
+            raise ValueError(f"uventet tekst mellom enhetene: {piece[:40]!r}")
+        if industry_codes and not any(code in piece for code in industry_codes):
+            yield None
+            continue
+        yield json_loads(piece)
+
+
+_parse_worker_state = None
+
+
+def _init_parse_worker(layout, industry_codes, filter_expr, with_codes):
+    global _parse_worker_state
+    compiled_filter = compile_filter(filter_expr) if filter_expr else None
+    _parse_worker_state = (layout, industry_codes, compiled_filter, with_codes)
+
+
+def parse_dump_chunk(chunk):
+    """
+    Run in a reader process: decode one chunk, keep the entities under one of the
+    industry codes and run extract_company_data and the prefilter on them.
+    Returns (entities read, rows, stage times); rows are (position in the chunk,
+    indices of the matching codes, company_dict, næringskoder, passed) in file order,
+    with company_dict and næringskoder left out (None) for companies that failed the prefilter.
+    """
+    layout, industry_codes, compiled_filter, with_codes = _parse_worker_state
+    started = time.perf_counter()
+    try:
+        entities = list(iter_chunk_entities(layout, chunk, industry_codes))
+    except ValueError as e:
+        raise ValueError(f"Kunne ikke lese en del av dumpfilen ({e}). Prøv igjen med --parse-workers 1.") from None
+    parsed = time.perf_counter()
+    extract_time = filter_time = 0.0
+    rows = []
+    for position, company in enumerate(entities):
+        if company is None:
+            continue
+        codes = company_industry_codes(company)
+        if not codes:
+            continue
+        matches = [i for i, naeringskode in enumerate(industry_codes) if industry_matches(naeringskode, codes)]
+        if not matches:
+            continue
+        extract_started = time.perf_counter()
+        company_dict = extract_company_data(company, list(FIELD_MAP), FIELD_MAP, all_fields=True)
+        extracted = time.perf_counter()
+        extract_time += extracted - extract_started
+        passed = True
+        if compiled_filter is not None:
+            passed = compiled_filter.prefilter(company_dict)
+            filter_time += time.perf_counter() - extracted
+        if passed:
+            rows.append((position, matches, company_dict, codes if with_codes else None, True))
+        else:
+            rows.append((position, matches, None, None, False))
+    stages = {"parse": (parsed - started, 1), "extract": (extract_time, len(rows))}
+    if compiled_filter is not None:
+        stages["filter"] = (filter_time, len(rows))
+    return len(entities), rows, stages
+
+
+class ParallelDumpReader:
+    """
+    Feed a dump file through a pool of `workers` reader processes: a background
+    thread splits it into chunks (DumpChunks) and submits them, and each process
+    decodes, extracts and prefilters a chunk (parse_dump_chunk). Up to two chunks
+    per process are in flight, and results are yielded in file order as
+    (entities read, rows). Decompression releases the GIL, so splitting overlaps
+    with the pipelines consuming the results. Processes are started with "spawn",
+    since finance and progress threads may already be running. Stage times from
+    the processes are added to get_metrics().
+    """
+
+    _END = object()
+
+    def __init__(self, chunks, industry_codes, compiled_filter=None, with_codes=False, workers=None):
+        self.chunks = chunks
+        self.workers = workers or os.cpu_count() or 1
+        self.metrics = get_metrics()
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_parse_worker,
+            initargs=(chunks.layout, list(industry_codes), compiled_filter.expr if compiled_filter is not None else None,
+                      with_codes),
+        )
+        self.queue = queue.Queue(maxsize=self.workers * 2)
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _put(self, item):
+        while not self.stop_event.is_set():
+            try:
+                self.queue.put(item, timeout=0.2)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _run(self):
+        try:
+            chunks = iter(self.chunks)
+            while not self.stop_event.is_set():
+                started = time.perf_counter()
+                chunk = next(chunks, None)
+                self.metrics.add_time("parse", time.perf_counter() - started)
+                if chunk is None or not self._put(self.executor.submit(parse_dump_chunk, chunk)):
+                    break
+        except Exception as e:
+            self._put(e)
+        finally:
+            self._put(self._END)
+
+    def __iter__(self):
+        while True:
+            started = time.perf_counter()
+            item = self.queue.get()
+            if item is self._END:
+                return
+            if isinstance(item, Exception):
+                raise item
+            read, rows, stages = item.result()
+            self.metrics.add_time("parse_wait", time.perf_counter() - started)
+            for stage, (seconds, count) in stages.items():
+                self.metrics.add_time(stage, seconds, count)
+            yield read, rows
+
+    def close(self):
+        """Stop splitting, cancel chunks not yet started and shut the processes down."""
+        self.stop_event.set()
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if hasattr(item, "cancel"):
+                item.cancel()
+        self.thread.join(timeout=5)
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.chunks.close()
+
+
+def fetch_companies_from_dump(dump_file, industry_codes, output_files, selected_fields, field_map, limit=None, filter_expr=None,
+                              finance=False, selected_finance_fields=None, workers=DEFAULT_FINANCE_WORKERS,
+                              finance_rate=DEFAULT_FINANCE_RATE, finance_burst=DEFAULT_FINANCE_BURST, max_retries=DEFAULT_MAX_RETRIES,
+                              cache=None, combine=False, output_format="csv", finance_history=None, history_output=None,
+                              parse_workers=DEFAULT_PARSE_WORKERS, rate_limiter=None, changes=None):
+    """
+    Answer one or more industry codes in a single sequential pass over a local dump file.
+    Each code gets its own sink (output_files[i], in output_format) and limit, or one shared file with an
+    Industry column if combine is True; everything else (filter, finance lookups,
+    formatting, --finance-history) goes through the same CompanyPipeline as the API mode.
+    With parse_workers other than 1 (0 = one per CPU core) the file is decoded, extracted and
+    prefiltered by a ParallelDumpReader and the results are fed to the pipelines in file order,
+    so the output is the same as a serial pass.
+    """
+    echo(f"Leser selskaper fra {dump_file} for næringskode {', '.join(industry_codes)}..." + (f" (grense: {limit})" if limit else ""))
+    compiled_filter = prepare_filter(filter_expr, finance)
+    # The HTTP stack (and requests) is only loaded when the file must be downloaded or accounts looked up
+    client = None
+    if finance or not os.path.exists(dump_file):
+        import requests
+        from .client import HttpClient
+        client = HttpClient(pool_size=(workers if finance else 0) + 2, max_retries=max_retries, cache=cache,
+                            rate_limiter=rate_limiter)
+    if not os.path.exists(dump_file):
+        try:
+            download_dump(dump_file, client)
+        except (requests.exceptions.RequestException, IOError) as e:
+            echo(f"\nFeil ved nedlasting av dumpfil: {e}")
+            client.close()
+            return
+    fetcher = None
+    if finance:
+        fetcher = FinanceFetcher(workers=workers, rate=finance_rate, burst=finance_burst, client=client,
+                                 share_results=len(industry_codes) > 1, history=bool(finance_history))
+    history = None
+    try:
+        history = open_history(finance_history, history_output, selected_finance_fields, output_format)
+        sinks, pipelines = open_pipelines(industry_codes, output_files, selected_fields, field_map, compiled_filter, fetcher,
+                                          selected_finance_fields, limit, finance, combine, output_format=output_format,
+                                          history=history, changes=changes)
+    except (IOError, ImportError) as e:
+        echo(f"\nFeil ved lagring av fil: {e}")
+        if history is not None:
+            history.close()
+        if fetcher is not None:
+            fetcher.close()
+        if client is not None:
+            client.close()
+        return
+
+    total_read = 0
+    metrics = get_metrics()
+    reader = None
+    completed = False
+    try:
+        workers = parse_workers or os.cpu_count() or 1
+        if workers > 1:
+            chunks = DumpChunks(dump_file)
+            if chunks.layout is None:
+                chunks.close()
+                echo("Dumpfilen har ikke linjeskift mellom enhetene og leses derfor i én prosess.")
+            else:
+                echo(f"Leser dumpfilen med {workers} prosesser...")
+                reader = ParallelDumpReader(chunks, industry_codes, compiled_filter,
+                                            with_codes=any(p.store_industry_codes for p in pipelines), workers=workers)
+        for read, rows in reader if reader is not None else ():
+            for position, matches, company_dict, codes, passed in rows:
+                for index in matches:
+                    if not pipelines[index].done:
+                        pipelines[index].feed_extracted(company_dict, codes, passed)
+                if all(pipeline.done for pipeline in pipelines):
+                    read = position + 1
+                    break
+            if total_read // 100000 != (total_read + read) // 100000:
+                echo(f"Lest {(total_read + read) // 100000 * 100000} enheter fra dumpfilen...")
+            total_read += read
+            metrics.count("dump_read", read)
+            if all(pipeline.done for pipeline in pipelines):
+                break
+        companies = iter_dump_companies(dump_file) if reader is None else iter(())
+        while True:
+            started = time.perf_counter()
+            company = next(companies, None)
+            metrics.add_time("parse", time.perf_counter() - started)
+            if company is None:
+                break
+            total_read += 1
+            metrics.count("dump_read")
+            if total_read % 100000 == 0:
+                echo(f"Lest {total_read} enheter fra dumpfilen...")
+            codes = company_industry_codes(company)
+            if not codes:
+                continue
+            for naeringskode, pipeline in zip(industry_codes, pipelines):
+                if not pipeline.done and industry_matches(naeringskode, codes):
+                    pipeline.feed(company)
+            if all(pipeline.done for pipeline in pipelines):
+                break
+        if fetcher is not None:
+            echo(f"Venter på {fetcher.in_flight()} gjenstående finansoppslag...")
+            collect_financials(fetcher, block=True)
+        completed = True
+    except Exception as e:
+        echo(f"\nEn uventet feil oppstod: {e}")
+        import traceback
+        traceback.print_exc()
+    finally:
+        if reader is not None:
+            reader.close()
+        if fetcher is not None:
+            fetcher.close()
+        echo(f"\nLest {total_read} enheter fra {dump_file}")
+        for sink in sinks:
+            sink.close()
+        for pipeline in pipelines:
+            echo(f"Fant {pipeline.rows} selskaper som matcher filter blant {pipeline.seen} enheter med næringskode {pipeline.label} -> {pipeline.sink.output_file}")
+        if history is not None:
+            history.close()
+            echo(history.summary())
+        if changes is not None:
+            changes.finish(completed)
+            echo(changes.summary())
+        if finance:
+            from .client import format_http_stats
+            http_stats = client.stats()
+            get_metrics().record("http", http_stats)
+            echo(format_http_stats(http_stats))
+            if cache is not None:
+                echo(format_cache_stats(cache.stats()))
+        if client is not None:
+            client.close()
@@ -0,0 +1,623 @@
+"""
+--filter expressions: parsing, compilation, vectorized evaluation and push-down to the search API.
+"""
+
+import ast
+import math
+import operator
+from datetime import date, timedelta
+from functools import lru_cache
+
+from .common import FIELD_MAP, FIN_FIELD_CSV_MAP, NUMERIC_FINANCE_FIELDS
+
+
+class FilterError(ValueError):
+    """Raised when a --filter expression cannot be parsed or uses unknown names."""
+
+
+class CompiledFilter:
+    """
+    A --filter expression parsed once into a validated AST.
+
+    Attributes:
+        expr (str): The original expression
+        fields (frozenset): Field names the filter reads (without the `_` raw-value prefix)
+        finance_fields (frozenset): The subset of `fields` that needs financial data
+        needs_finance (bool): True if the filter reads financial fields (for some companies
+            it may still be decided without them, see decide)
+        predicate (callable): company_dict -> bool for the full filter
+        prefilter (callable): company_dict -> bool using only non-finance fields. It is a
+            necessary condition of the full filter, so companies failing it can be
+            skipped before any finance lookup.
+        decide (callable): company_dict -> True/False when the outcome of the full filter
+            follows from the non-finance fields alone, or None when it depends on
+            financial data (see _compile_partial_node)
+        vector (callable or None): Vectorized form of predicate used by evaluate_batch
+    """
+
+    def __init__(self, expr, tree, fields, finance_fields, predicate, prefilter, decide, vector=None):
+        self.expr = expr
+        self.tree = tree
+        self.fields = fields
+        self.finance_fields = finance_fields
+        self.needs_finance = bool(finance_fields)
+        self.predicate = predicate
+        self.prefilter = prefilter
+        self.decide = decide
+        self.vector = vector
+
+    def evaluate_batch(self, numeric, company_dicts, np):
+        """
+        Evaluate the filter for a batch of companies. `numeric` maps numeric finance
+        fields to float arrays over the batch. Returns a list of bools, matching what
+        predicate would return for each company.
+        """
+        if self.vector is not None:
+            values, errors = self.vector(_VectorContext(np, numeric, company_dicts))
+            return (_as_bool_array(np, len(company_dicts), values) & ~errors).tolist()
+        columns = {field: column.tolist() for field, column in numeric.items()}
+        for i, company_dict in enumerate(company_dicts):
+            for field, column in columns.items():
+                company_dict[field] = column[i]
+        return [self.predicate(company_dict) for company_dict in company_dicts]
+
+    def __repr__(self):
+        return f"CompiledFilter({self.expr!r})"
+
+
+# Names usable in --filter: company fields, financial fields (with or without fin_ prefix)
+_FINANCE_FILTER_NAMES = {f[len("fin_"):]: f for f in FIN_FIELD_CSV_MAP}
+_COMPARE_OPS = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+    ast.In: lambda a, b: a in b,
+    ast.NotIn: lambda a, b: a not in b,
+}
+
+
+def _truthy(value):
+    # Empty/whitespace strings and None count as "missing"
+    if isinstance(value, str):
+        return bool(value.strip())
+    return bool(value) if value is not None else False
+
+
+def _resolve_filter_name(name):
+    """
+    Map a filter name to (company_dict key, field name, is_finance).
+    A leading underscore (e.g. `_email`) means the same field; it is accepted for compatibility.
+    """
+    raw = name[1:] if name.startswith("_") else name
+    if raw in FIELD_MAP:
+        return raw, raw, False
+    if raw in NUMERIC_FINANCE_FIELDS:
+        # apply_financials() stores numeric finance values under the bare name
+        return raw, raw, True
+    if raw in _FINANCE_FILTER_NAMES:
+        return _FINANCE_FILTER_NAMES[raw], raw, True
+    if raw in FIN_FIELD_CSV_MAP:
+        return raw, raw[len("fin_"):], True
+    raise FilterError(f"Ukjent felt i filter: {name}")
+
+
+def _compile_node(node, names, boolean):
+    """
+    Compile an AST node into a function of company_dict. `boolean` is True when the
+    node's value is used as a condition, in which case bare field names test for a
+    non-empty value. Records (field, is_finance) pairs in `names`.
+    """
+    if isinstance(node, ast.BoolOp):
+        parts = [_compile_node(v, names, True) for v in node.values]
+        if isinstance(node.op, ast.And):
+            return lambda d: all(p(d) for p in parts)
+        return lambda d: any(p(d) for p in parts)
+    if isinstance(node, ast.UnaryOp):
+        if isinstance(node.op, ast.Not):
+            inner = _compile_node(node.operand, names, True)
+            return lambda d: not inner(d)
+        if isinstance(node.op, (ast.USub, ast.UAdd)) and isinstance(node.operand, ast.Constant) \
+                and isinstance(node.operand.value, (int, float)):
+            value = -node.operand.value if isinstance(node.op, ast.USub) else node.operand.value
+            return lambda d: value
+    if isinstance(node, ast.Compare):
+        operands = [_compile_node(n, names, False) for n in [node.left] + node.comparators]
+        ops = []
+        for op in node.ops:
+            if type(op) not in _COMPARE_OPS:
+                raise FilterError(f"Operatoren {type(op).__name__} støttes ikke i filter")
+            ops.append(_COMPARE_OPS[type(op)])
+
+        def compare(d):
+            left = operands[0](d)
+            for op, right_fn in zip(ops, operands[1:]):
+                right = right_fn(d)
+                if not op(left, right):
+                    return False
+                left = right
+            return True
+        return compare
+    if isinstance(node, ast.Name):
+        key, field, is_finance = _resolve_filter_name(node.id)
+        names.add((field, is_finance))
+        if boolean and not node.id.startswith("_"):
+            return lambda d: _truthy(d.get(key))
+        return lambda d: d.get(key)
+    if isinstance(node, ast.Constant) and (node.value is None or isinstance(node.value, (str, int, float, bool))):
+        value = node.value
+        return lambda d: value
+    if isinstance(node, (ast.List, ast.Tuple, ast.Set)):
+        items = [_compile_node(e, names, False) for e in node.elts]
+        return lambda d: [i(d) for i in items]
+    raise FilterError(f"Uttrykket {type(node).__name__} støttes ikke i filter")
+
+
+class _NotVectorizable(Exception):
+    pass
+
+
+class _Rows(list):
+    """Per-row Python values in a vectorized filter (as opposed to a constant list)."""
+
+
+_NUMERIC_COMPARE_OPS = (operator.eq, operator.ne, operator.lt, operator.le, operator.gt, operator.ge)
+
+
+class _VectorContext:
+    """Batch being filtered: numeric finance arrays plus the company dicts for everything else."""
+
+    def __init__(self, np, numeric, company_dicts):
+        self.np = np
+        self.n = len(company_dicts)
+        self.numeric = numeric
+        self.company_dicts = company_dicts
+        self.lists = {}
+
+    def column(self, key):
+        if key not in self.lists:
+            self.lists[key] = [d.get(key) for d in self.company_dicts]
+        return self.lists[key]
+
+
+def _as_bool_array(np, n, values):
+    # Truthiness per row, like `if value:` in the scalar predicate
+    if isinstance(values, np.ndarray):
+        return values if values.dtype == np.bool_ else values != 0
+    if isinstance(values, _Rows):
+        return np.fromiter((bool(v) for v in values), dtype=np.bool_, count=n)
+    return np.full(n, bool(values))
+
+
+def _is_numeric(np, value):
+    if isinstance(value, np.ndarray):
+        return value.dtype.kind == "f"
+    return isinstance(value, (int, float))
+
+
+def _vector_compare(ctx, op, left, right):
+    """Apply a comparison to arrays/lists/constants. Returns (values, errors) as bool arrays."""
+    np = ctx.np
+    if op in _NUMERIC_COMPARE_OPS and _is_numeric(np, left) and _is_numeric(np, right) \
+            and (isinstance(left, np.ndarray) or isinstance(right, np.ndarray)):
+        return op(left, right), np.zeros(ctx.n, dtype=np.bool_)
+    values = np.zeros(ctx.n, dtype=np.bool_)
+    errors = np.zeros(ctx.n, dtype=np.bool_)
+    left_rows = left.tolist() if isinstance(left, np.ndarray) else left if isinstance(left, _Rows) else None
+    right_rows = right.tolist() if isinstance(right, np.ndarray) else right if isinstance(right, _Rows) else None
+    for i in range(ctx.n):
+        try:
+            values[i] = bool(op(left if left_rows is None else left_rows[i], right if right_rows is None else right_rows[i]))
+        except Exception:
+            errors[i] = True
+    return values, errors
+
+
+def _compile_vector_node(node, boolean):
+    """
+    Vectorized counterpart of _compile_node: compile into fn(_VectorContext) -> (values, errors).
+    values is a NumPy array over the batch, a _Rows list of per-row Python values or a constant;
+    errors marks rows where the scalar predicate would have raised (and so not matched).
+    Short-circuiting of and/or and comparison chains is reproduced row by row.
+    Raises _NotVectorizable for constructs that only the scalar predicate handles.
+    """
+    if isinstance(node, ast.BoolOp):
+        parts = [_compile_vector_node(v, True) for v in node.values]
+        is_and = isinstance(node.op, ast.And)
+
+        def bool_op(ctx):
+            np = ctx.np
+            running = np.ones(ctx.n, dtype=np.bool_) # Rows whose result is not decided yet
+            result = np.zeros(ctx.n, dtype=np.bool_)
+            errors = np.zeros(ctx.n, dtype=np.bool_)
+            for part in parts:
+                values, part_errors = part(ctx)
+                values = _as_bool_array(np, ctx.n, values)
+                errors |= running & part_errors
+                running &= ~part_errors
+                if is_and:
+                    running &= values
+                else:
+                    result |= running & values
+                    running &= ~values
+            return (running if is_and else result), errors
+        return bool_op
+    if isinstance(node, ast.UnaryOp):
+        if isinstance(node.op, ast.Not):
+            inner = _compile_vector_node(node.operand, True)
+
+            def negate(ctx):
+                values, errors = inner(ctx)
+                return ~_as_bool_array(ctx.np, ctx.n, values), errors
+            return negate
+        if isinstance(node.op, (ast.USub, ast.UAdd)) and isinstance(node.operand, ast.Constant) \
+                and isinstance(node.operand.value, (int, float)):
+            value = -node.operand.value if isinstance(node.op, ast.USub) else node.operand.value
+            return lambda ctx: (value, ctx.np.zeros(ctx.n, dtype=ctx.np.bool_))
+    if isinstance(node, ast.Compare):
+        operands = [_compile_vector_node(n, False) for n in [node.left] + node.comparators]
+        ops = [_COMPARE_OPS[type(op)] for op in node.ops]
+
+        def compare(ctx):
+            np = ctx.np
+            running = np.ones(ctx.n, dtype=np.bool_)
+            errors = np.zeros(ctx.n, dtype=np.bool_)
+            left = operands[0](ctx)[0]
+            for op, operand in zip(ops, operands[1:]):
+                right = operand(ctx)[0]
+                values, op_errors = _vector_compare(ctx, op, left, right)
+                errors |= running & op_errors
+                running &= ~op_errors & values
+                left = right
+            return running, errors
+        return compare
+    if isinstance(node, ast.Name):
+        key, field, is_finance = _resolve_filter_name(node.id)
+        numeric = is_finance and key == field and field in NUMERIC_FINANCE_FIELDS
+        truthy = boolean and not node.id.startswith("_")
+
+        def name(ctx):
+            no_errors = ctx.np.zeros(ctx.n, dtype=ctx.np.bool_)
+            if numeric and field in ctx.numeric:
+                values = ctx.numeric[field]
+                return (values != 0 if truthy else values), no_errors
+            values = _Rows(ctx.column(key))
+            if truthy:
+                return ctx.np.fromiter((_truthy(v) for v in values), dtype=ctx.np.bool_, count=ctx.n), no_errors
+            return values, no_errors
+        return name
+    if isinstance(node, ast.Constant):
+        value = node.value
+        return lambda ctx: (value, ctx.np.zeros(ctx.n, dtype=ctx.np.bool_))
+    if isinstance(node, (ast.List, ast.Tuple, ast.Set)) and all(isinstance(e, ast.Constant) for e in node.elts):
+        items = [e.value for e in node.elts]
+        return lambda ctx: (items, ctx.np.zeros(ctx.n, dtype=ctx.np.bool_))
+    raise _NotVectorizable(type(node).__name__)
+
+
+def _uses_finance(node):
+    return any(isinstance(n, ast.Name) and _resolve_filter_name(n.id)[2] for n in ast.walk(node))
+
+
+def _general_part(node):
+    """
+    Return an AST for a condition over non-finance fields that is implied by `node`,
+    or None if no such restriction can be derived (e.g. `a or net_profit > 0`).
+    """
+    if not _uses_finance(node):
+        return node
+    if isinstance(node, ast.BoolOp):
+        parts = [_general_part(v) for v in node.values]
+        if isinstance(node.op, ast.And):
+            parts = [p for p in parts if p is not None]
+            if not parts:
+                return None
+            return parts[0] if len(parts) == 1 else ast.BoolOp(op=ast.And(), values=parts)
+        if any(p is None for p in parts):
+            return None
+        return ast.BoolOp(op=ast.Or(), values=parts)
+    return None
+
+
+class _Undecided(Exception):
+    """An error in the filter that is only reached for some values of the financial fields."""
+
+
+# Partial value of a condition that depends on financial data and may also raise (and so
+# end the full filter without a match), e.g. `fin_revenue > 0` for a company without accounts
+_MAY_FAIL = object()
+
+
+def _is_safe_number(node):
+    # Operands that are always numbers: numeric constants and the numeric finance values
+    # under their bare names, which apply_financials() sets to 0.0 when missing
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+        node = node.operand
+    if isinstance(node, ast.Constant):
+        return isinstance(node.value, (int, float)) and not isinstance(node.value, bool)
+    if isinstance(node, ast.Name):
+        key, field, is_finance = _resolve_filter_name(node.id)
+        return is_finance and key == field and field in NUMERIC_FINANCE_FIELDS
+    return False
+
+
+def _finance_leaf_may_fail(node):
+    """False for conditions on financial data that cannot raise in the full filter whatever the accounts hold."""
+    if isinstance(node, ast.Name):
+        return False
+    if isinstance(node, ast.Compare):
+        return not (all(type(op) in (ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE) for op in node.ops)
+                    and all(_is_safe_number(n) for n in [node.left] + node.comparators))
+    return True
+
+
+def _compile_partial_node(node):
+    """
+    Compile a condition into a function of company_dict that returns its value when it
+    follows from the non-finance fields alone and None when it depends on financial data.
+    and/or are evaluated left to right and stop as soon as the outcome is known, like the
+    full filter. An error the full filter would certainly reach is raised as is (the
+    company does not match); one it only reaches for some financial values raises _Undecided.
+    A condition on financial data that may itself raise (a comparison with missing accounts)
+    returns _MAY_FAIL, and nothing evaluated after it can decide a match.
+    """
+    if not _uses_finance(node):
+        fn = _compile_node(node, set(), True)
+        return lambda d: bool(fn(d))
+    if isinstance(node, ast.BoolOp):
+        parts = [_compile_partial_node(v) for v in node.values]
+        # The operand value that decides the whole expression: False for and, True for or
+        stop = isinstance(node.op, ast.Or)
+
+        def evaluate(d):
+            unknown = may_fail = False
+            for part in parts:
+                try:
+                    value = part(d)
+                except Exception:
+                    if unknown:
+                        raise _Undecided() from None
+                    raise
+                if value is None or value is _MAY_FAIL:
+                    unknown = True
+                    may_fail = may_fail or value is _MAY_FAIL
+                elif value == stop:
+                    return _MAY_FAIL if may_fail else stop
+            if unknown:
+                return _MAY_FAIL if may_fail else None
+            return not stop
+        return evaluate
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+        inner = _compile_partial_node(node.operand)
+
+        def negate(d):
+            value = inner(d)
+            return value if value is None or value is _MAY_FAIL else not value
+        return negate
+    # Comparisons and names that read financial fields
+    value = _MAY_FAIL if _finance_leaf_may_fail(node) else None
+    return lambda d: value
+
+
+def _safe_decision(fn):
+    # Like _safe_predicate, but None (depends on finance) is passed through
+    def decide(company_dict):
+        try:
+            value = fn(company_dict)
+        except _Undecided:
+            return None
+        except Exception:
+            return False
+        return None if value is _MAY_FAIL else value
+    return decide
+
+
+def _safe_predicate(fn):
+    # Comparisons between mismatched types (e.g. "" > 10) make the company not match
+    def predicate(company_dict):
+        try:
+            return bool(fn(company_dict))
+        except Exception:
+            return False
+    return predicate
+
+
+def compile_filter(filter_expr):
+    """
+    Parse and validate a --filter expression once and compile it into a CompiledFilter.
+    Raises FilterError for syntax errors, unsupported constructs or unknown field names.
+    """
+    try:
+        tree = ast.parse(filter_expr.strip(), mode="eval")
+    except SyntaxError as e:
+        raise FilterError(f"Ugyldig filteruttrykk: {e.msg}") from None
+    names = set()
+    predicate = _safe_predicate(_compile_node(tree.body, names, True))
+    general = _general_part(tree.body)
+    prefilter = _safe_predicate(_compile_node(general, set(), True)) if general is not None else (lambda d: True)
+    try:
+        vector = _compile_vector_node(tree.body, True)
+    except _NotVectorizable:
+        vector = None
+    return CompiledFilter(
+        filter_expr,
+        tree,
+        frozenset(field for field, _ in names),
+        frozenset(field for field, is_finance in names if is_finance),
+        predicate,
+        prefilter,
+        _safe_decision(_compile_partial_node(tree.body)),
+        vector,
+    )
+
+
+@lru_cache(maxsize=32)
+def _cached_filter(filter_expr):
+    return compile_filter(filter_expr)
+
+
+def safe_eval_filter(filter_expr, company_dict):
+    """
+    Safely evaluate the filter expression for a single company.
+    Kept for compatibility; the expression is compiled once and cached.
+    """
+    try:
+        return _cached_filter(filter_expr).predicate(company_dict)
+    except FilterError:
+        return False
+
+
+# Filter fields that the search API can filter on: field -> (kind, from-param, to-param).
+# "range" and "date" fields take inclusive bounds, "value" fields an exact value.
+# A missing stiftelsesdato or registreringsdato is "" locally and so passes `... < date`;
+# the API would drop it, so only the lower bound of the dates is pushed.
+PUSHDOWN_PARAMS = {
+    "employees": ("range", "fraAntallAnsatte", "tilAntallAnsatte"),
+    "registration_date": ("date", "fraRegistreringsdatoEnhetsregisteret", None),
+    "incorporation_date": ("date", "fraStiftelsesdato", None),
+    "zipcode": ("value", "forretningsadresse.postnummer", None),
+    "in_liquidation": ("flag", "underAvvikling", None),
+}
+_FLIPPED_OPS = {ast.Lt: ast.Gt, ast.LtE: ast.GtE, ast.Gt: ast.Lt, ast.GtE: ast.LtE, ast.Eq: ast.Eq}
+
+
+def _conjuncts(node):
+    if isinstance(node, ast.BoolOp) and isinstance(node.op, ast.And):
+        return [c for v in node.values for c in _conjuncts(v)]
+    return [node]
+
+
+def _pushdown_field(node):
+    """Field name for a general (non-finance) filter name that the API can filter on, else None."""
+    if not isinstance(node, ast.Name):
+        return None
+    key, field, is_finance = _resolve_filter_name(node.id)
+    return field if not is_finance and field in PUSHDOWN_PARAMS else None
+
+
+def _constant(node):
+    if isinstance(node, ast.Constant):
+        return node.value
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub) and isinstance(node.operand, ast.Constant) \
+            and isinstance(node.operand.value, (int, float)):
+        return -node.operand.value
+    return None
+
+
+def _bound(kind, op, value):
+    """(low, high) inclusive bounds for `field <op> value`, or None if it cannot be expressed."""
+    if kind == "range":
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return None
+        floor, ceil = math.floor(value), math.ceil(value)
+        if op is ast.Gt:
+            return floor + 1, None
+        if op is ast.GtE:
+            return ceil, None
+        if op is ast.Lt:
+            return None, ceil - 1
+        if op is ast.LtE:
+            return None, floor
+        return (value, value) if op is ast.Eq and value == floor else None
+    # Dates are compared as ISO strings locally, which matches date order only for full dates
+    try:
+        day = date.fromisoformat(value) if isinstance(value, str) and len(value) == 10 else None
+    except ValueError:
+        day = None
+    if day is None:
+        return None
+    if op is ast.Gt:
+        return day + timedelta(days=1), None
+    if op is ast.GtE:
+        return day, None
+    if op is ast.Lt:
+        return None, day - timedelta(days=1)
+    if op is ast.LtE:
+        return None, day
+    return (day, day) if op is ast.Eq else None
+
+
+def plan_pushdown(compiled_filter):
+    """
+    Turn the parts of a --filter that the Enhetsregisteret search can evaluate into request
+    parameters. Only top-level `and` conditions are used: comparisons of employees with
+    constants, lower bounds on registration_date and incorporation_date, `zipcode == '...'` and
+    (`not`) in_liquidation. Everything else is left to local evaluation.
+
+    The pushed conditions only narrow what is downloaded; the full filter is still checked
+    locally (cheaply), so results are exactly the same as without pushdown.
+    Returns (params, pushed) where pushed lists the conditions as written.
+    """
+    if compiled_filter is None:
+        return {}, []
+    bounds = {}
+    values = {}
+    pushed = []
+    for node in _conjuncts(compiled_filter.tree.body):
+        negated = isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not)
+        field = _pushdown_field(node.operand if negated else node)
+        if field is not None and PUSHDOWN_PARAMS[field][0] == "flag":
+            values.setdefault(field, "false" if negated else "true")
+            pushed.append(ast.unparse(node))
+            continue
+        if not isinstance(node, ast.Compare):
+            continue
+        operands = [node.left] + node.comparators
+        found = False
+        for op, left, right in zip(node.ops, operands, operands[1:]):
+            op = type(op)
+            field, value = _pushdown_field(left), _constant(right)
+            if field is None:
+                field, value = _pushdown_field(right), _constant(left)
+                op = _FLIPPED_OPS.get(op)
+            if field is None or op is None or value is None:
+                continue
+            kind = PUSHDOWN_PARAMS[field][0]
+            if kind == "value" or kind == "flag":
+                if op is ast.Eq and (isinstance(value, str) if kind == "value" else isinstance(value, bool)):
+                    values.setdefault(field, value if kind == "value" else str(value).lower())
+                    found = True
+                continue
+            bound = _bound(kind, op, value)
+            if bound is not None and PUSHDOWN_PARAMS[field][2] is None:
+                bound = (bound[0], None) if bound[0] is not None else None
+            if bound is None:
+                continue
+            low, high = bounds.get(field, (None, None))
+            if bound[0] is not None:
+                low = bound[0] if low is None else max(low, bound[0])
+            if bound[1] is not None:
+                high = bound[1] if high is None else min(high, bound[1])
+            bounds[field] = (low, high)
+            found = True
+        if found:
+            pushed.append(ast.unparse(node))
+
+    params = {}
+    for field, (low, high) in bounds.items():
+        _, from_param, to_param = PUSHDOWN_PARAMS[field]
+        if low is not None:
+            params[from_param] = low.isoformat() if isinstance(low, date) else int(low)
+        if high is not None:
+            params[to_param] = high.isoformat() if isinstance(high, date) else int(high)
+    for field, value in values.items():
+        params[PUSHDOWN_PARAMS[field][1]] = value
+    return params, pushed
+
+
+def query_output_keys(fields, finance):
+    """Record keys to return for a list of --fields style names (company fields, finance with or without fin_)."""
+    if not fields:
+        return list(FIELD_MAP) + (list(FIN_FIELD_CSV_MAP) if finance else [])
+    keys = []
+    for name in fields:
+        name = name.strip().lower()
+        if name in FIELD_MAP or name in FIN_FIELD_CSV_MAP:
+            keys.append(name)
+        elif f"fin_{name}" in FIN_FIELD_CSV_MAP:
+            keys.append(f"fin_{name}")
+        elif name:
+            raise FilterError(f"Ukjent felt: {name}")
+    return keys
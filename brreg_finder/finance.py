@@ -0,0 +1,414 @@
+"""
+Annual accounts from Regnskapsregisteret: parsing, ratios and the concurrent FinanceFetcher.
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+
+from .common import (
+    DEFAULT_FINANCE_BURST, DEFAULT_FINANCE_RATE, DEFAULT_FINANCE_WORKERS, FINANCE_RATIOS, HISTORY_GROWTH_FIELDS,
+    NUMERIC_FINANCE_FIELDS, REGNSKAP_API_URL, SHARED_FINANCE_RESULTS,
+)
+from .metrics import get_metrics
+
+
+def fetch_accounts(orgnr, client=None, limiter=None):
+    """
+    Fetch the list of annual accounts for a company by orgnr from the Regnskapsregisteret.
+    Returns the raw list, or None if there is none.
+    If limiter (a TokenBucket) is given, a token is taken before any network request.
+    """
+    url = f"{REGNSKAP_API_URL}/{orgnr}"
+    if client is None:
+        from .client import get_http_client
+        client = get_http_client()
+    data = client.get_json(url, endpoint="regnskap", limiter=limiter)
+    if not data or not isinstance(data, list):
+        return None
+    return data
+
+
+def _period_end(accounts):
+    return accounts.get("regnskapsperiode", {}).get("tilDato", "")
+
+
+def parse_financial_period(accounts):
+    """Extract the fin_ fields from one entry of the accounts list."""
+    period = accounts.get("regnskapsperiode", {})
+    year = period.get("tilDato", "")[:4] if period.get("tilDato") else ""
+    # Extract financial fields (with fin_ prefix)
+    def get_nested(d, *keys):
+        for k in keys:
+            d = d.get(k, {}) if isinstance(d, dict) else {}
+        return d if isinstance(d, (int, float, str)) else ""
+    def get_sum(d, *keys):
+        v = d
+        for k in keys:
+            v = v.get(k, {}) if isinstance(v, dict) else {}
+        return v if isinstance(v, (int, float)) else ""
+    fin = {}
+    fin["fin_period_start"] = period.get("fraDato", "")
+    fin["fin_period_end"] = period.get("tilDato", "")
+    fin["fin_year"] = year
+    fin["fin_currency"] = accounts.get("valuta", "")
+    fin["fin_account_type"] = accounts.get("regnskapstype", "")
+    fin["fin_in_liquidation"] = accounts.get("avviklingsregnskap", "")
+    fin["fin_small_company"] = accounts.get("regnkapsprinsipper", {}).get("smaaForetak", "")
+    fin["fin_audited"] = not accounts.get("revisjon", {}).get("ikkeRevidertAarsregnskap", False)
+    fin["fin_revenue"] = get_sum(accounts.get("resultatregnskapResultat", {}).get("driftsresultat", {}), "driftsinntekter", "sumDriftsinntekter")
+    fin["fin_operating_result"] = get_sum(accounts.get("resultatregnskapResultat", {}), "driftsresultat", "driftsresultat")
+    fin["fin_net_profit"] = get_sum(accounts.get("resultatregnskapResultat", {}), "aarsresultat")
+    fin["fin_total_assets"] = get_sum(accounts.get("eiendeler", {}), "sumEiendeler")
+    fin["fin_total_equity"] = get_sum(accounts.get("egenkapitalGjeld", {}).get("egenkapital", {}), "sumEgenkapital")
+    fin["fin_total_liabilities"] = get_sum(accounts.get("egenkapitalGjeld", {}).get("gjeldOversikt", {}), "sumGjeld")
+    fin["fin_short_term_liabilities"] = get_sum(accounts.get("egenkapitalGjeld", {}).get("gjeldOversikt", {}), "kortsiktigGjeld", "sumKortsiktigGjeld")
+    fin["fin_long_term_liabilities"] = get_sum(accounts.get("egenkapitalGjeld", {}).get("gjeldOversikt", {}), "langsiktigGjeld", "sumLangsiktigGjeld")
+    fin["fin_retained_earnings"] = get_sum(accounts.get("egenkapitalGjeld", {}).get("egenkapital", {}), "opptjentEgenkapital", "sumOpptjentEgenkapital")
+    fin["fin_contributed_equity"] = get_sum(accounts.get("egenkapitalGjeld", {}).get("egenkapital", {}), "innskuttEgenkapital", "sumInnskuttEgenkaptial")
+    fin["fin_current_assets"] = get_sum(accounts.get("eiendeler", {}), "omloepsmidler", "sumOmloepsmidler")
+    fin["fin_fixed_assets"] = get_sum(accounts.get("eiendeler", {}), "anleggsmidler", "sumAnleggsmidler")
+    fin["fin_net_financial_items"] = get_sum(accounts.get("resultatregnskapResultat", {}).get("finansresultat", {}), "nettoFinans")
+    fin["fin_financial_income"] = get_sum(accounts.get("resultatregnskapResultat", {}).get("finansresultat", {}), "finansinntekt", "sumFinansinntekter")
+    fin["fin_financial_expenses"] = get_sum(accounts.get("resultatregnskapResultat", {}).get("finansresultat", {}), "finanskostnad", "sumFinanskostnad")
+    return fin
+
+
+def fetch_latest_financials(orgnr, client=None, limiter=None):
+    """
+    Fetch the latest available financial data for a company by orgnr.
+    Returns a dict of fin_ fields, or None if not available.
+    If limiter (a TokenBucket) is given, a token is taken before any network request.
+    """
+    try:
+        data = fetch_accounts(orgnr, client, limiter)
+        if not data:
+            return None
+        # Find the entry with the latest period end date
+        return parse_financial_period(max(data, key=_period_end))
+    except Exception:
+        return None
+
+
+def fetch_financial_history(orgnr, client=None, limiter=None):
+    """
+    Like fetch_latest_financials, but keep every period in the accounts list: returns a list
+    of fin_ dicts ordered by period end (the latest last), or None if not available.
+    """
+    try:
+        data = fetch_accounts(orgnr, client, limiter)
+        if not data:
+            return None
+        return [parse_financial_period(accounts) for accounts in sorted(data, key=_period_end)]
+    except Exception:
+        return None
+
+
+def add_growth(periods):
+    """
+    Add year-over-year growth in percent (HISTORY_GROWTH_FIELDS) to each period, compared
+    with the latest period of the previous year. "" if there is no such period or it is 0.
+    """
+    by_year = {}
+    for period in periods:
+        by_year[period.get("fin_year")] = period
+    for period in periods:
+        year = period.get("fin_year")
+        previous = by_year.get(str(int(year) - 1)) if str(year).isdigit() else None
+        for growth_key, (field, _) in HISTORY_GROWTH_FIELDS.items():
+            current = period.get(field)
+            before = previous.get(field) if previous else None
+            if isinstance(current, (int, float)) and isinstance(before, (int, float)) and before:
+                period[growth_key] = round((current - before) / abs(before) * 100, 2)
+            else:
+                period[growth_key] = ""
+    return periods
+
+
+def calculate_financial_ratios(fin):
+    """
+    Calculate financial ratios and add them to the fin dict. All values are in percent, as
+    floats rounded to 2 decimals ("" when a value is missing or the denominator is 0);
+    formatting is left to the sink.
+    """
+    def safe_div(n, d):
+        try:
+            n = float(n)
+            d = float(d)
+            if d == 0:
+                return ""
+            return n / d
+        except Exception:
+            return ""
+    for ratio_key, (numerator, denominator) in FINANCE_RATIOS.items():
+        value = safe_div(fin.get(numerator, 0), fin.get(denominator, 0))
+        fin[ratio_key] = round(value * 100, 2) if value != "" else ""
+    return fin
+
+
+def merge_financials(company_data, company_dict, fin_data, selected_finance_fields):
+    """Add selected or all financial data to company_data (for output) and company_dict (for logic)."""
+    if fin_data:
+        if selected_finance_fields is not None:
+            for f_user_key in selected_finance_fields: # e.g., "net_profit"
+                internal_fin_key = f"fin_{f_user_key}" # e.g., "fin_net_profit"
+                if internal_fin_key in fin_data:
+                    company_data[internal_fin_key] = fin_data[internal_fin_key]
+            company_dict.update(fin_data) # The filter may read fields that are not in the output
+        else: # Add all fetched financial data
+            company_data.update(fin_data) # For CSV output (uses fin_ prefix from fin_data)
+            company_dict.update(fin_data) # For internal logic
+    else: # No financial data found
+        if selected_finance_fields is not None:
+            for f_user_key in selected_finance_fields:
+                internal_fin_key = f"fin_{f_user_key}"
+                company_data[internal_fin_key] = "" # Ensure CSV column exists if requested
+                company_dict[internal_fin_key] = "" # Ensure key exists for consistency
+
+
+def apply_financials(company_data, company_dict, fin_data, compiled_filter, selected_finance_fields):
+    """
+    Merge fetched financial data into a company's row and evaluate the full filter.
+    Returns True if the company should be included in the output.
+    """
+    if fin_data:
+        fin_data = calculate_financial_ratios(fin_data)
+    merge_financials(company_data, company_dict, fin_data, selected_finance_fields)
+
+    if compiled_filter is None or not compiled_filter.needs_finance:
+        return True
+
+    # Convert the numeric financial fields the filter reads to float for evaluation.
+    # Keys like 'net_profit' (without 'fin_') are created/updated here.
+    for eval_key in compiled_filter.finance_fields:
+        if eval_key not in NUMERIC_FINANCE_FIELDS:
+            continue
+        value = company_dict.get(f"fin_{eval_key}")
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            company_dict[eval_key] = float(value)
+            continue
+        try:
+            value_str = str(value if value is not None else "").replace(" ", "").replace("\xa0", "")
+            company_dict[eval_key] = float(value_str) if value_str else 0.0
+        except ValueError:
+            # Default to 0.0 if there is no usable number
+            company_dict[eval_key] = 0.0
+
+    return compiled_filter.predicate(company_dict)
+
+
+@lru_cache(maxsize=1)
+def import_numpy():
+    """numpy if it is installed, else None; finance batches then fall back to one company at a time."""
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+class FinanceBatch:
+    """
+    Accounts for a batch of companies held as one float64 NumPy array per numeric
+    fin_ field, with NaN where a value is missing (or the company has no accounts).
+    Ratios are computed on whole arrays by compute_ratios(), rounded like calculate_financial_ratios.
+    """
+
+    def __init__(self, fin_rows, np):
+        self.np = np
+        self.size = len(fin_rows)
+        self.columns = {}
+        for field in NUMERIC_FINANCE_FIELDS:
+            key = f"fin_{field}"
+            if key in FINANCE_RATIOS:
+                continue
+            self.columns[key] = np.array([_finance_number(fin.get(key)) if fin else np.nan for fin in fin_rows],
+                                         dtype=np.float64)
+
+    def compute_ratios(self):
+        np = self.np
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for ratio_key, (numerator, denominator) in FINANCE_RATIOS.items():
+                d = self.columns[denominator]
+                ratios = np.where(d != 0, self.columns[numerator] / d * 100, np.nan)
+                # Python's round, not np.round (which rounds 0.015 up), so values on a half-way
+                # point come out the same as from calculate_financial_ratios
+                self.columns[ratio_key] = np.array([round(value, 2) for value in ratios.tolist()], dtype=np.float64)
+
+    def values(self, key):
+        """Column as Python values for the output rows: floats, or "" where missing."""
+        return ["" if value != value else value for value in self.columns[key].tolist()]
+
+    def filter_column(self, field):
+        """Column for --filter, where a missing value compares as 0.0 (as in apply_financials)."""
+        return self.np.nan_to_num(self.columns[f"fin_{field}"], nan=0.0)
+
+
+def _finance_number(value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return float("nan")
+
+
+def apply_financials_batch(entries, compiled_filter, selected_finance_fields):
+    """
+    Batch version of apply_financials for a list of (company_data, company_dict, fin_data).
+    With numpy the ratios and the numeric part of the filter run on a FinanceBatch;
+    without it each company goes through apply_financials. Returns one bool per entry.
+    """
+    np = import_numpy()
+    if np is None or len(entries) < 2:
+        return [apply_financials(data, d, fin, compiled_filter, selected_finance_fields) for data, d, fin in entries]
+    batch = FinanceBatch([fin for _, _, fin in entries], np)
+    batch.compute_ratios()
+    ratios = {key: batch.values(key) for key in FINANCE_RATIOS}
+    for i, (company_data, company_dict, fin_data) in enumerate(entries):
+        if fin_data:
+            for key, values in ratios.items():
+                fin_data[key] = values[i]
+        merge_financials(company_data, company_dict, fin_data, selected_finance_fields)
+
+    if compiled_filter is None or not compiled_filter.needs_finance:
+        return [True] * len(entries)
+    numeric = {field: batch.filter_column(field) for field in compiled_filter.finance_fields if field in NUMERIC_FINANCE_FIELDS}
+    return compiled_filter.evaluate_batch(numeric, [d for _, d, _ in entries], np)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. Allows bursts of up to `burst` requests and refills
+    at `rate` tokens per second. A rate of 0 or less disables limiting.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.capacity = max(1.0, float(burst))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available, then consume it."""
+        if self.rate <= 0:
+            return
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    break
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+        if waited:
+            get_metrics().add_time("rate_limit_wait", waited)
+
+
+class FinanceFetcher:
+    """
+    Runs fetch_latest_financials on a thread pool behind a shared TokenBucket.
+    Lookups are submitted together with an opaque item and handed back as
+    (item, fin_data) pairs in submission order. With share_results=True an orgnr that
+    is submitted again while its lookup is pending, or shortly after (the last
+    SHARED_FINANCE_RESULTS results are kept), reuses that lookup; this is for
+    industry codes that overlap.
+    With history=True fetch_financial_history is used and fin_data is a list of periods.
+    """
+
+    def __init__(self, workers=DEFAULT_FINANCE_WORKERS, rate=DEFAULT_FINANCE_RATE, burst=DEFAULT_FINANCE_BURST, client=None,
+                 share_results=False, history=False):
+        # A client with a SharedRateLimiter already holds the regnskap budget (across processes)
+        shared = client is not None and client.rate_limiter is not None and client.rate_limiter.covers("regnskap")
+        self.limiter = None if shared else TokenBucket(rate, burst)
+        self.client = client
+        self.history = history
+        self.shared = OrderedDict() if share_results else None  # orgnr -> [future, items waiting for it]
+        self.reused = 0
+        self.executor = ThreadPoolExecutor(max_workers=max(1, workers))
+        self.pending = deque()
+        # Bound the look-ahead so memory stays flat when paging outruns the rate limit
+        self.max_pending = max(1, workers) * 4
+
+    def _fetch(self, orgnr):
+        # The limiter is only consulted when the lookup actually goes to the network
+        started = time.perf_counter()
+        try:
+            if self.history:
+                return fetch_financial_history(orgnr, self.client, limiter=self.limiter)
+            return fetch_latest_financials(orgnr, self.client, limiter=self.limiter)
+        finally:
+            metrics = get_metrics()
+            metrics.add_time("finance_lookup", time.perf_counter() - started)
+            metrics.count("finance_lookups")
+
+    def submit(self, orgnr, item):
+        """Queue a lookup for orgnr. `item` is returned unchanged alongside the result."""
+        if self.shared is not None:
+            entry = self.shared.get(orgnr)
+            if entry is None:
+                entry = self.shared[orgnr] = [self.executor.submit(self._fetch, orgnr), 0]
+            else:
+                self.reused += 1
+                self.shared.move_to_end(orgnr)
+            entry[1] += 1
+            self.pending.append((item, entry[0], entry, False))
+            return
+        self.pending.append((item, self.executor.submit(self._fetch, orgnr), None, False))
+
+    def submit_result(self, item, fin_data):
+        """Queue a result that is already known (e.g. kept from the previous run) in line with the lookups."""
+        future = Future()
+        future.set_result(fin_data)
+        self.pending.append((item, future, None, True))
+
+    def in_flight(self):
+        return len(self.pending)
+
+    def pending_items(self):
+        """
+        (item, known, fin_data) for everything not handed back yet, in submission order.
+        known is True for results queued with submit_result, and fin_data is then that
+        result; for lookups it is False and fin_data None.
+        """
+        return [(item, known, future.result() if known else None) for item, future, _, known in self.pending]
+
+    def ready(self, block=False):
+        """
+        Yield (item, fin_data) for finished lookups at the head of the queue, in submission order.
+        If block is True, wait for every pending lookup. Also waits while the queue is over its bound.
+        """
+        while self.pending:
+            item, future, entry, _ = self.pending[0]
+            if not future.done() and not block and len(self.pending) <= self.max_pending:
+                return
+            self.pending.popleft()
+            if entry is not None:
+                self._release(entry)
+            if future.done():
+                yield item, future.result()
+                continue
+            started = time.perf_counter()
+            result = future.result()
+            get_metrics().add_time("finance_wait", time.perf_counter() - started)
+            yield item, result
+
+    def _release(self, entry):
+        # A shared result stays while items wait for it; of the rest only the most recent are kept
+        entry[1] -= 1
+        while len(self.shared) > SHARED_FINANCE_RESULTS:
+            oldest = next(iter(self.shared.values()))
+            if oldest[1] > 0:
+                break
+            self.shared.popitem(last=False)
+
+    def close(self):
+        """Cancel lookups that have not started and shut down the pool."""
+        for _, future, _, _ in self.pending:
+            future.cancel()
+        self.pending.clear()
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,291 @@
+"""
+--incremental: a local snapshot kept up to date from the update feed.
+"""
+
+import json
+import os
+import sqlite3
+
+import requests
+
+from .cache import format_cache_stats
+from .client import HttpClient, format_http_stats
+from .common import (
+    API_BASE_URL, DEFAULT_FINANCE_BURST, DEFAULT_FINANCE_RATE, DEFAULT_FINANCE_WORKERS, DEFAULT_MAX_RETRIES,
+    DEFAULT_PAGE_DELAY, DEFAULT_PREFETCH_DEPTH, DEFAULT_SHARD_WORKERS, MAX_PAGE_SIZE, UPDATES_URL, echo, json_loads,
+    utc_timestamp,
+)
+from .crawl import plan_crawl
+from .finance import FinanceFetcher
+from .metrics import get_metrics
+from .pipeline import CompanyPipeline, collect_financials, finance_output_fields, prepare_filter
+from .sinks import open_history, open_sink
+
+
+class IncompleteCrawlError(Exception):
+    """Raised by sync_snapshot when pages of a full crawl could not be fetched; the snapshot is left as it was."""
+
+
+class CompanySnapshot:
+    """
+    Local SQLite snapshot of the raw entities for one industry code, plus the
+    update-feed cursor from the last sync. Entities keep their original order
+    (seq) so regenerated output matches a fresh crawl.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS companies (orgnr TEXT PRIMARY KEY, seq INTEGER, data TEXT)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS companies_seq ON companies (seq)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.db.commit()
+        self.next_seq = (self.db.execute("SELECT MAX(seq) FROM companies").fetchone()[0] or 0) + 1
+
+    def get_meta(self, key, default=None):
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        self.db.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, str(value)))
+
+    def upsert(self, company):
+        """Insert or replace an entity, keeping its position if it is already known."""
+        orgnr = company.get("organisasjonsnummer")
+        row = self.db.execute("SELECT seq FROM companies WHERE orgnr = ?", (orgnr,)).fetchone()
+        if row:
+            seq = row[0]
+        else:
+            seq = self.next_seq
+            self.next_seq += 1
+        self.db.execute("INSERT OR REPLACE INTO companies VALUES (?, ?, ?)",
+                        (orgnr, seq, json.dumps(company, ensure_ascii=False)))
+
+    def delete(self, orgnr):
+        return self.db.execute("DELETE FROM companies WHERE orgnr = ?", (orgnr,)).rowcount > 0
+
+    def get(self, orgnr):
+        """The stored raw entity for orgnr, or None."""
+        row = self.db.execute("SELECT data FROM companies WHERE orgnr = ?", (orgnr,)).fetchone()
+        return json_loads(row[0]) if row else None
+
+    def clear(self):
+        self.db.execute("DELETE FROM companies")
+        self.db.execute("DELETE FROM meta")
+        self.next_seq = 1
+
+    def __contains__(self, orgnr):
+        return self.db.execute("SELECT 1 FROM companies WHERE orgnr = ?", (orgnr,)).fetchone() is not None
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM companies").fetchone()[0]
+
+    def iter_companies(self):
+        """Yield stored raw entities in their original order."""
+        for (data,) in self.db.execute("SELECT data FROM companies ORDER BY seq"):
+            yield json_loads(data)
+
+    def commit(self):
+        self.db.commit()
+
+    def rollback(self):
+        self.db.rollback()
+        self.next_seq = (self.db.execute("SELECT MAX(seq) FROM companies").fetchone()[0] or 0) + 1
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+
+def default_snapshot_file(output_file):
+    """Snapshot stored next to the output file, e.g. 73_11_selskaper.snapshot.sqlite."""
+    return f"{os.path.splitext(output_file)[0]}.snapshot.sqlite"
+
+
+def iter_updates(client, cursor_id=None, since=None):
+    """
+    Yield entries from the Enhetsregisteret update feed (oppdateringer) after a cursor:
+    either the last seen oppdateringsid or, on the first sync, an ISO timestamp.
+    """
+    while True:
+        params = {"size": MAX_PAGE_SIZE}
+        if cursor_id is not None:
+            params["oppdateringsid"] = cursor_id + 1
+        else:
+            params["dato"] = since
+        response = client.get(UPDATES_URL, params=params, endpoint="enheter")
+        response.raise_for_status()
+        updates = response.json().get("_embedded", {}).get("oppdaterteEnheter", [])
+        if not updates:
+            return
+        for update in updates:
+            yield update
+        cursor_id = max(int(u.get("oppdateringsid", 0)) for u in updates)
+        if len(updates) < MAX_PAGE_SIZE:
+            return
+
+
+def fetch_entities_in_industry(orgnrs, naeringskode, client):
+    """
+    Look up a batch of orgnrs restricted to an industry code with one search request.
+    Returns {orgnr: entity} for those that (still) belong to the industry.
+    """
+    params = {"organisasjonsnummer": ",".join(orgnrs), "naeringskode": naeringskode, "size": len(orgnrs)}
+    response = client.get(API_BASE_URL, params=params, endpoint="enheter")
+    response.raise_for_status()
+    companies = response.json().get("_embedded", {}).get("enheter", [])
+    return {c.get("organisasjonsnummer"): c for c in companies}
+
+
+def sync_snapshot(snapshot, naeringskode, client, prefetch=DEFAULT_PREFETCH_DEPTH, page_delay=DEFAULT_PAGE_DELAY,
+                  shard_workers=DEFAULT_SHARD_WORKERS):
+    """
+    Bring a CompanySnapshot up to date. Without a stored cursor (or for a different
+    industry code) this is a full crawl; otherwise only orgnrs from the update feed are
+    re-fetched, in batches restricted to the industry, and deleted entities are dropped.
+    Returns a dict with counts of what changed; `changed` lists the orgnrs from the update
+    feed (each now either stored or removed). If pages of a full crawl fail, the snapshot is
+    rolled back (keeping the previous code and cursor) and IncompleteCrawlError is raised.
+    """
+    stats = {"full": False, "updates": 0, "upserted": 0, "deleted": 0, "changed": []}
+    if snapshot.get_meta("naeringskode") != naeringskode or not snapshot.get_meta("since"):
+        echo(f"Ingen gyldig snapshot funnet, henter alle selskaper med næringskode {naeringskode}...")
+        stats["full"] = True
+        since = utc_timestamp()  # Changes made during the crawl are picked up next time
+        snapshot.clear()
+        # Cached pages can be older than `since`, and changes before it never come through the feed
+        crawl = plan_crawl(naeringskode, client.uncached(), prefetch, page_delay, shard_workers)
+        try:
+            for company in crawl:
+                snapshot.upsert(company)
+                stats["upserted"] += 1
+        finally:
+            crawl.close()
+            crawl.report()
+        if crawl.failed:
+            # A partial crawl stamped with `since` would never be completed by the update feed
+            snapshot.rollback()
+            raise IncompleteCrawlError(f"noen sider for næringskode {naeringskode} kunne ikke hentes")
+        snapshot.set_meta("naeringskode", naeringskode)
+        snapshot.set_meta("since", since)
+        snapshot.commit()
+        return stats
+
+    cursor = snapshot.get_meta("last_update_id")
+    cursor_id = int(cursor) if cursor else None
+    echo("Henter endringer fra oppdateringsstrømmen" + (f" etter id {cursor_id}..." if cursor_id else f" siden {snapshot.get_meta('since')}..."))
+    # Keep only the latest change type per orgnr
+    changes = {}
+    for update in iter_updates(client, cursor_id, snapshot.get_meta("since")):
+        stats["updates"] += 1
+        changes[update.get("organisasjonsnummer")] = update.get("endringstype", "")
+        cursor_id = max(cursor_id or 0, int(update.get("oppdateringsid", 0)))
+
+    stats["changed"] = list(changes)
+    refetch = []
+    for orgnr, change in changes.items():
+        if change in ("Sletting", "Fjernet"):
+            if snapshot.delete(orgnr):
+                stats["deleted"] += 1
+        else:
+            refetch.append(orgnr)
+
+    # New and changed entities may have moved in or out of the industry
+    batch_size = 100
+    for start in range(0, len(refetch), batch_size):
+        batch = refetch[start:start + batch_size]
+        found = fetch_entities_in_industry(batch, naeringskode, client)
+        for orgnr in batch:
+            if orgnr in found:
+                snapshot.upsert(found[orgnr])
+                stats["upserted"] += 1
+            elif snapshot.delete(orgnr):
+                stats["deleted"] += 1
+
+    if cursor_id is not None:
+        snapshot.set_meta("last_update_id", cursor_id)
+    snapshot.commit()
+    return stats
+
+
+def sync_companies(naeringskode, output_file, snapshot_file, selected_fields, field_map, limit=None, filter_expr=None,
+                   finance=False, selected_finance_fields=None, workers=DEFAULT_FINANCE_WORKERS,
+                   finance_rate=DEFAULT_FINANCE_RATE, finance_burst=DEFAULT_FINANCE_BURST,
+                   prefetch=DEFAULT_PREFETCH_DEPTH, page_delay=DEFAULT_PAGE_DELAY, max_retries=DEFAULT_MAX_RETRIES, cache=None,
+                   shard_workers=DEFAULT_SHARD_WORKERS, output_format="csv", finance_history=None, history_output=None,
+                   rate_limiter=None, changes=None):
+    """
+    Incremental mode: update the local snapshot from the update feed (or crawl once if
+    there is none) and regenerate the output file from the snapshot through the usual
+    CompanyPipeline (filter, finance lookups, limit), comparing it with the previous
+    run if `changes` (a ChangeTracker) is given. Returns True if the snapshot was brought
+    up to date and the output written; False if the sync failed (the output is then written
+    from the previous snapshot, if it is for the same code) or the output could not be written.
+    """
+    compiled_filter = prepare_filter(filter_expr, finance)
+    client = HttpClient(pool_size=(workers if finance else 0) + prefetch * shard_workers + 2, max_retries=max_retries, cache=cache,
+                        rate_limiter=rate_limiter)
+    snapshot = CompanySnapshot(snapshot_file)
+    try:
+        stats = sync_snapshot(snapshot, naeringskode, client, prefetch, page_delay, shard_workers)
+    except (requests.exceptions.RequestException, IncompleteCrawlError) as e:
+        stats = None
+        if snapshot.get_meta("naeringskode") != naeringskode:
+            echo(f"\nFeil ved oppdatering av snapshot: {e}. Ingen tidligere snapshot for {naeringskode} å bruke.")
+            snapshot.close()
+            client.close()
+            return False
+        echo(f"\nFeil ved oppdatering av snapshot: {e}. Bruker forrige snapshot.")
+    if stats is not None and not stats["full"]:
+        echo(f"{stats['updates']} endringer i oppdateringsstrømmen: {stats['upserted']} oppdatert, {stats['deleted']} fjernet.")
+    echo(f"Snapshot {snapshot_file} inneholder {len(snapshot)} enheter med næringskode {naeringskode}.")
+
+    history = None
+    try:
+        history = open_history(finance_history, history_output, selected_finance_fields, output_format)
+        sink = open_sink(output_file, selected_fields, field_map, extra_fields=finance_output_fields(finance, selected_finance_fields),
+                         output_format=output_format)
+    except (IOError, ImportError) as e:
+        echo(f"\nFeil ved lagring av fil: {e}")
+        if history is not None:
+            history.close()
+        snapshot.close()
+        client.close()
+        return False
+    fetcher = None
+    if finance:
+        fetcher = FinanceFetcher(workers=workers, rate=finance_rate, burst=finance_burst, client=client, history=bool(finance_history))
+    pipeline = CompanyPipeline(sink, selected_fields, field_map, compiled_filter, fetcher, selected_finance_fields, limit,
+                               history=history, changes=changes)
+    completed = False
+    try:
+        for company in snapshot.iter_companies():
+            if not pipeline.feed(company):
+                break
+        if fetcher is not None and not pipeline.done:
+            collect_financials(fetcher, block=True)
+        completed = True
+    except Exception as e:
+        echo(f"\nEn uventet feil oppstod: {e}")
+        import traceback
+        traceback.print_exc()
+    finally:
+        if fetcher is not None:
+            fetcher.close()
+        sink.close()
+        snapshot.close()
+        echo(f"\nFant {sink.rows_written} selskaper som matcher filter blant {pipeline.seen} enheter med næringskode {naeringskode}")
+        echo(f"Data lagret til {output_file}")
+        if history is not None:
+            history.close()
+            echo(history.summary())
+        if changes is not None:
+            changes.finish(completed)
+            echo(changes.summary())
+        http_stats = client.stats()
+        get_metrics().record("http", http_stats)
+        echo(format_http_stats(http_stats))
+        if cache is not None:
+            echo(format_cache_stats(cache.stats()))
+        client.close()
+    return completed and stats is not None
@@ -0,0 +1,297 @@
+"""
+Run-wide instrumentation: stage timers, latency histograms, progress lines and profiling.
+"""
+
+import bisect
+import io
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+from .common import DEFAULT_PROGRESS_INTERVAL, LATENCY_BUCKETS_MS, PROFILE_SAMPLE_INTERVAL, STAGE_LABELS, echo
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram (bucket upper bounds in `bounds`, plus an overflow bucket).
+    Percentiles are interpolated linearly within the bucket they fall in, clamped to the
+    observed min/max. Not thread-safe on its own; Metrics holds the lock.
+    """
+
+    def __init__(self, bounds=LATENCY_BUCKETS_MS):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, pct):
+        if not self.count:
+            return 0
+        rank = pct / 100 * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            if n and seen + n >= rank:
+                low = max(self.min, self.bounds[i - 1] if i else 0)
+                high = min(self.max, self.bounds[i]) if i < len(self.bounds) else self.max
+                return low + (high - low) * (rank - seen) / n
+            seen += n
+        return self.max
+
+    def summary(self):
+        labels = [f"<={b}" for b in self.bounds] + [f">{self.bounds[-1]}"]
+        return {
+            "count": self.count,
+            "mean": round(self.total / self.count, 3) if self.count else 0,
+            "min": round(self.min, 3) if self.min is not None else None,
+            "max": round(self.max, 3) if self.max is not None else None,
+            "p50": round(self.percentile(50), 3),
+            "p90": round(self.percentile(90), 3),
+            "p99": round(self.percentile(99), 3),
+            "buckets": {label: n for label, n in zip(labels, self.buckets) if n},
+        }
+
+
+class Metrics:
+    """
+    Run-wide instrumentation: counters, time spent per pipeline stage (see STAGE_LABELS)
+    and latency histograms per request type. Stage times are summed over all threads,
+    so stages that run in background threads (HTTP, finance lookups) can add up to more
+    than the wall time. Thread-safe; see get_metrics() for the module-wide instance.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started = time.monotonic()
+            self.started_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+            self.counters = {}
+            self.stages = {}
+            self.histograms = {}
+            self.extra = {}
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def add_time(self, stage, seconds, count=1):
+        with self.lock:
+            totals = self.stages.get(stage)
+            if totals is None:
+                self.stages[stage] = [seconds, count]
+            else:
+                totals[0] += seconds
+                totals[1] += count
+
+    def observe(self, name, value):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(value)
+
+    def record(self, name, stats):
+        """Attach a stats dict from another component (e.g. HttpClient.stats()) to the summary."""
+        with self.lock:
+            self.extra[name] = dict(stats)
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def counter(self, name):
+        with self.lock:
+            return self.counters.get(name, 0)
+
+    def summary(self):
+        """A JSON-serialisable dict of everything recorded so far."""
+        with self.lock:
+            order = list(STAGE_LABELS) + sorted(set(self.stages) - set(STAGE_LABELS))
+            return {
+                "started_at": self.started_at,
+                "wall_seconds": round(time.monotonic() - self.started, 3),
+                "stages": {name: {"seconds": round(self.stages[name][0], 4), "count": self.stages[name][1]}
+                           for name in order if name in self.stages},
+                "counters": dict(sorted(self.counters.items())),
+                "latency_ms": {name: h.summary() for name, h in sorted(self.histograms.items())},
+                **self.extra,
+            }
+
+    def write_json(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, indent=2, ensure_ascii=False)
+
+
+_default_metrics = None
+
+
+def get_metrics():
+    """Return the module-wide Metrics, creating it on first use."""
+    global _default_metrics
+    if _default_metrics is None:
+        _default_metrics = Metrics()
+    return _default_metrics
+
+
+def format_duration(seconds):
+    """Format seconds as H:MM:SS (or M:SS under an hour)."""
+    seconds = int(round(seconds))
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+
+def format_metrics(summary):
+    """Norwegian summary lines (stage times and request latency) of Metrics.summary()."""
+    stages = ", ".join(f"{STAGE_LABELS.get(name, name)} {stage['seconds']:.2f} s" for name, stage in summary["stages"].items())
+    lines = [f"Tid per steg (sum over tråder, total {summary['wall_seconds']:.1f} s): {stages or '-'}"]
+    latency = [f"{name[len('http.'):]} p50 {h['p50']:.0f} / p99 {h['p99']:.0f} ms ({h['count']} kall)"
+               for name, h in summary["latency_ms"].items() if name.startswith("http.")]
+    if latency:
+        lines.append("Svartid: " + ", ".join(latency))
+    skipped = summary["counters"].get("finance_skipped", 0)
+    if skipped:
+        lines.append(f"Finansoppslag: {summary['counters'].get('finance_lookups', 0)} gjort, {skipped} unngått "
+                     f"(verken utdata eller filter trengte regnskapet)")
+    return "\n".join(lines)
+
+
+def format_progress(metrics):
+    """One progress line: entities processed (of expected), rows written, throughput and ETA."""
+    elapsed = max(metrics.elapsed(), 1e-9)
+    companies = metrics.counter("companies")
+    expected = metrics.counter("expected")
+    rows = metrics.counter("rows")
+    parts = []
+    read = metrics.counter("dump_read")
+    if read:
+        parts.append(f"{read} lest fra dumpfil")
+    done = f"{companies} enheter"
+    if expected:
+        done += f" av ca. {expected} ({min(100.0, 100 * companies / expected):.0f} %)"
+    parts.append(done)
+    parts.append(f"{rows} rader")
+    lookups = metrics.counter("finance_lookups")
+    if lookups:
+        parts.append(f"{lookups} finansoppslag")
+    rate = companies / elapsed
+    parts.append(f"{rate:.0f} enheter/s, {rows / elapsed:.0f} rader/s")
+    if expected and rate > 0 and companies < expected:
+        parts.append(f"ca. {format_duration((expected - companies) / rate)} igjen")
+    return f"[{format_duration(elapsed)}] " + ", ".join(parts)
+
+
+class ProgressReporter:
+    """Background thread that prints format_progress() every `interval` seconds until stopped."""
+
+    def __init__(self, metrics, interval=DEFAULT_PROGRESS_INTERVAL):
+        self.metrics = metrics
+        self.interval = max(0.5, interval)
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            echo(format_progress(self.metrics), flush=True)
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler covering every thread: a background thread records the stack of
+    all other threads every `interval` seconds. Unlike cProfile (main thread only) it
+    shows where the prefetch and finance worker threads spend their time.
+    write() saves the samples as collapsed stacks ("thread;outer;...;inner count"), which
+    flame graph tools such as speedscope and flamegraph.pl read directly.
+    """
+
+    def __init__(self, interval=PROFILE_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = {}
+        self.samples = 0
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self.stop_event.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                key = ";".join(reversed(stack))
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+            self.samples += 1
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+
+    def write(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, n in sorted(self.stacks.items()):
+                f.write(f"{stack} {n}\n")
+
+    def top(self, limit=15):
+        """(function, share of samples where it was on top of a stack) for the busiest functions."""
+        own = {}
+        total = sum(self.stacks.values()) or 1
+        for stack, n in self.stacks.items():
+            leaf = stack.rsplit(";", 1)[-1]
+            own[leaf] = own.get(leaf, 0) + n
+        return [(name, n / total) for name, n in sorted(own.items(), key=lambda item: -item[1])[:limit]]
+
+
+def start_profiler(mode):
+    """Start a cProfile.Profile (mode "cprofile") or SamplingProfiler (mode "sample")."""
+    if mode == "sample":
+        return SamplingProfiler().start()
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def finish_profiler(profiler, path):
+    """Stop the profiler, save its output to `path` and print the busiest functions."""
+    if isinstance(profiler, SamplingProfiler):
+        profiler.stop()
+        profiler.write(path)
+        echo(f"\nProfil ({profiler.samples} stikkprøver fra alle tråder) lagret i {path}. Mest tid (egen tid):")
+        for name, share in profiler.top():
+            echo(f"  {share * 100:5.1f} %  {name}")
+        return
+    import pstats
+    profiler.disable()
+    profiler.dump_stats(path)
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(15)
+    echo(f"\nProfil (cProfile, kun hovedtråden) lagret i {path}. Les den med `python -m pstats {path}`.")
+    echo(out.getvalue().strip())
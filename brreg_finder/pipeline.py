@@ -0,0 +1,238 @@
+"""
+Per-company processing shared by every input source (CompanyPipeline).
+"""
+
+import time
+
+from .common import FIN_FIELD_CSV_MAP, INDUSTRY_CODES_KEY, INDUSTRY_COLUMN, echo
+from .filters import CompiledFilter, compile_filter
+from .finance import apply_financials_batch
+from .metrics import get_metrics
+from .records import company_industry_codes, extract_company_data
+from .sinks import open_sink
+
+
+# Queued in place of a finance lookup that CompanyPipeline skipped
+NO_LOOKUP = object()
+
+
+class CompanyPipeline:
+    """
+    Per-company processing shared by every input source: extract fields, run the
+    non-finance part of the filter, queue a finance lookup if needed, evaluate the
+    full filter and write matching rows to a sink, in input order.
+
+    Several pipelines (one per industry code) may share one FinanceFetcher and even
+    one sink; each queued lookup carries its pipeline so results are routed back
+    correctly, and the limit applies per pipeline. With tag_industry=True the label
+    is written to the sink's Industry column. With a FinanceHistoryWriter as `history`
+    the fetcher returns every period and all of them are written for matching companies.
+    With a ChangeTracker as `changes` every written row is compared with the previous run,
+    and the accounts kept from that run are used instead of a lookup when they are still current.
+
+    A finance lookup is only queued when the result can change the row: when the output has
+    financial columns (or history), or when the filter cannot be decided from the other
+    fields (CompiledFilter.decide). Companies the filter rules out are dropped either way.
+    """
+
+    def __init__(self, sink, selected_fields, field_map, compiled_filter=None, fetcher=None,
+                 selected_finance_fields=None, limit=None, label="", tag_industry=False, history=None, changes=None):
+        self.sink = sink
+        self.history = history
+        self.changes = changes
+        self.tag_industry = tag_industry
+        self.rows = 0
+        self.selected_fields = selected_fields
+        self.field_map = field_map
+        self.compiled_filter = compiled_filter
+        self.fetcher = fetcher
+        self.selected_finance_fields = selected_finance_fields
+        self.limit = limit
+        self.label = label
+        self.seen = 0
+        self.limit_reported = False
+        self.store_industry_codes = getattr(sink, "stores_industry_codes", False)
+        # Whether written rows carry financial data; else lookups only serve the filter
+        self.finance_output = selected_finance_fields is None or bool(selected_finance_fields) or history is not None
+        self.metrics = get_metrics()
+
+    @property
+    def done(self):
+        """True once the row limit has been reached."""
+        return self.limit is not None and self.rows >= self.limit
+
+    def feed(self, company):
+        """Process one raw API entity. Returns False once the limit is reached."""
+        if self.done:
+            return False
+        metrics = self.metrics
+        started = time.perf_counter()
+        company_dict = extract_company_data(company, self.selected_fields, self.field_map, all_fields=True)
+        codes = company_industry_codes(company) if self.store_industry_codes else None
+        extracted = time.perf_counter()
+        metrics.add_time("extract", extracted - started)
+
+        # Only the non-finance part of the filter is evaluated before any lookup
+        passed = True
+        if self.compiled_filter is not None:
+            passed = self.compiled_filter.prefilter(company_dict)
+            metrics.add_time("filter", time.perf_counter() - extracted)
+        return self.feed_extracted(company_dict, codes, passed)
+
+    def feed_extracted(self, company_dict, codes=None, passed=True):
+        """
+        Process one entity that was already run through extract_company_data(all_fields=True)
+        and the prefilter (passed), e.g. by a dump reader process. codes are its næringskoder,
+        only needed for sinks that store them. Returns False once the limit is reached.
+        """
+        if self.done:
+            return False
+        self.seen += 1
+        self.metrics.count("companies")
+        if not passed:
+            return True # Skip company if preliminary (general) filter fails
+        company_data = {self.field_map[f]: company_dict[f] for f in self.selected_fields}
+        if self.tag_industry:
+            company_data[INDUSTRY_COLUMN] = self.label
+        if self.store_industry_codes:
+            company_data[INDUSTRY_CODES_KEY] = codes
+
+        decided = True
+        if self.compiled_filter is not None and self.compiled_filter.needs_finance:
+            decided = self.compiled_filter.decide(company_dict)
+            if decided is False:
+                return True
+
+        if self.fetcher is not None: # If --fin is active (args.finance)
+            # Queue the lookup and keep going; results are merged back in input order.
+            item = (self, company_data, company_dict)
+            kept, fin_data = (False, None)
+            if decided and not self.finance_output:
+                # Neither the output nor the filter needs the accounts of this company; it is
+                # still queued so the row keeps its place
+                kept, fin_data = True, NO_LOOKUP
+                self.metrics.count("finance_skipped")
+            elif self.changes is not None and not self.fetcher.history:
+                kept, fin_data = self.changes.previous_finance(self.label, company_dict)
+            if kept:
+                self.fetcher.submit_result(item, fin_data)
+            else:
+                self.fetcher.submit(company_dict.get("orgnr"), item)
+            collect_financials(self.fetcher)
+        elif self.compiled_filter is None or not self.compiled_filter.needs_finance:
+            # A financial filter cannot be satisfied if financial data is not fetched.
+            self.write(company_data, company_dict)
+        return not self.done
+
+    def accept_financials(self, entries):
+        """Called with finished finance lookups, (company_data, company_dict, fin_data) in input order, queued by this pipeline."""
+        if self.done:
+            return
+        # Rows queued without a lookup were already decided by the filter and are written as
+        # they are; only the looked-up ones get financial data
+        looked_up = [i for i, (_, _, fin_data) in enumerate(entries) if fin_data is not NO_LOOKUP]
+        batch = [entries[i] for i in looked_up]
+        periods = None
+        if self.history is not None:
+            # Lookups return every period; the latest one is used for the row and the filter
+            periods = [fin_data for _, _, fin_data in batch]
+            batch = [(company_data, company_dict, fin_data[-1] if fin_data else None)
+                     for company_data, company_dict, fin_data in batch]
+        matched = {}
+        if batch:
+            started = time.perf_counter()
+            matches = apply_financials_batch(batch, self.compiled_filter, self.selected_finance_fields)
+            self.metrics.add_time("finance_apply", time.perf_counter() - started, len(batch))
+            matched = {i: n for n, i in enumerate(looked_up) if matches[n]}
+        for i, (company_data, company_dict, fin_data) in enumerate(entries):
+            if self.done:
+                break
+            if fin_data is NO_LOOKUP:
+                self.write(company_data, company_dict)
+            elif i in matched:
+                n = matched[i]
+                self.write(company_data, company_dict, batch[n][2], finance=True)
+                if periods is not None:
+                    self.history.write(company_dict.get("orgnr"), periods[n])
+
+    def write(self, company_data, company_dict, fin_data=None, finance=False):
+        """Write one matching row; finance=True if fin_data is the result of its finance lookup."""
+        started = time.perf_counter()
+        self.sink.write(company_data)
+        if self.changes is not None:
+            self.changes.observe(self.label, company_data, company_dict, fin_data, finance)
+        self.metrics.add_time("write", time.perf_counter() - started)
+        self.metrics.count("rows")
+        self.rows += 1
+        if self.done and not self.limit_reported:
+            self.limit_reported = True
+            echo(f"\nGrense på {self.limit} selskaper nådd" + (f" for {self.label}." if self.label else "."))
+
+
+def collect_financials(fetcher, block=False):
+    """
+    Route finished finance lookups (in input order) back to the pipelines that queued them.
+    Consecutive results for the same pipeline are handed over as one batch.
+    """
+    pipeline, entries = None, []
+    for (owner, company_data, company_dict), fin_data in fetcher.ready(block):
+        if owner is not pipeline and entries:
+            pipeline.accept_financials(entries)
+            entries = []
+        pipeline = owner
+        entries.append((company_data, company_dict, fin_data))
+    if entries:
+        pipeline.accept_financials(entries)
+
+
+def finance_output_fields(finance, selected_finance_fields):
+    """fin_ columns to write: the requested ones, all of them, or None without --fin."""
+    if not finance:
+        return None
+    # Only include requested finance fields if specified
+    if selected_finance_fields is not None:
+        return [f"fin_{f}" for f in selected_finance_fields]
+    return list(FIN_FIELD_CSV_MAP)
+
+
+def prepare_filter(filter_expr, finance):
+    """Compile filter_expr unless it already is a CompiledFilter, and warn if it cannot match without --fin."""
+    # Parse the filter once; per-company evaluation only runs the compiled predicate
+    compiled_filter = filter_expr if isinstance(filter_expr, CompiledFilter) or filter_expr is None else compile_filter(filter_expr)
+    if compiled_filter is not None and compiled_filter.needs_finance and not finance:
+        echo("\nMERK: Filteret bruker finansielle felter, men --fin er ikke aktivert. Ingen selskaper vil matche.")
+    return compiled_filter
+
+
+def open_pipelines(industry_codes, output_files, selected_fields, field_map, compiled_filter, fetcher,
+                   selected_finance_fields, limit, finance, combine=False, resume_offsets=None, output_format="csv",
+                   history=None, changes=None):
+    """
+    Create one CompanyPipeline per industry code. Each code gets its own sink (see open_sink) from
+    output_files, or with combine=True all codes share output_files[0] with an Industry column.
+    resume_offsets (one per sink) reopens existing CSV files at a checkpoint instead of starting over.
+    All pipelines share `history` (a FinanceHistoryWriter or None) and `changes` (a ChangeTracker or None).
+    Returns (sinks, pipelines); raises IOError after closing anything already opened.
+    """
+    extra_fields = finance_output_fields(finance, selected_finance_fields)
+    resume_offsets = resume_offsets or [None] * len(output_files)
+    sinks = []
+    try:
+        if combine:
+            sinks.append(open_sink(output_files[0], selected_fields, field_map, extra_fields=extra_fields, industry_column=True,
+                                   output_format=output_format, resume_at=resume_offsets[0]))
+        else:
+            for output_file, offset in zip(output_files, resume_offsets):
+                sinks.append(open_sink(output_file, selected_fields, field_map, extra_fields=extra_fields,
+                                       output_format=output_format, resume_at=offset))
+    except (IOError, ImportError):
+        for sink in sinks:
+            sink.close()
+        raise
+    pipelines = []
+    for i, naeringskode in enumerate(industry_codes):
+        sink = sinks[0] if combine else sinks[i]
+        pipelines.append(CompanyPipeline(sink, selected_fields, field_map, compiled_filter, fetcher,
+                                         selected_finance_fields, limit, label=naeringskode, tag_industry=combine,
+                                         history=history, changes=changes))
+    return sinks, pipelines
@@ -0,0 +1,283 @@
+"""
+The `query` subcommand: filter queries against a local SQLite/DuckDB store.
+"""
+
+import argparse
+import ast
+import os
+import sqlite3
+import sys
+import time
+
+from .common import (
+    DEFAULT_STORE_BATCH_SIZE, FIELD_MAP, FIELD_TYPES, FIN_FIELD_TYPES, NUMERIC_FINANCE_FIELDS, STORE_COMPANY_COLUMNS,
+    STORE_FINANCE_COLUMNS, STORE_FORMATS, output_format_for_file,
+)
+from .filters import (
+    FilterError, _COMPARE_OPS, _FLIPPED_OPS, _conjuncts, _constant, _resolve_filter_name, compile_filter,
+    query_output_keys,
+)
+from .metrics import get_metrics
+from .sinks import CompanyStore, open_sink
+
+
+_SQL_OPS = {ast.Eq: "=", ast.Lt: "<", ast.LtE: "<=", ast.Gt: ">", ast.GtE: ">="}
+
+
+def _store_filter_column(node):
+    """(SQL expression, FIELD_TYPES kind, is a bare numeric finance name) for a filter name in query_store, or None."""
+    if not isinstance(node, ast.Name):
+        return None
+    key, field, is_finance = _resolve_filter_name(node.id)
+    if not is_finance:
+        return f"c.{key}", FIELD_TYPES.get(key, "string"), False
+    if key in NUMERIC_FINANCE_FIELDS:
+        return f"f.fin_{key}", "float64", True
+    if key == "fin_year":
+        return "f.year", "int64", False
+    return f"f.{key}", FIN_FIELD_TYPES.get(key, "string"), False
+
+
+def _sql_kind_matches(kind, value):
+    # Only constants of the column's own type are sent to SQL; --filter decides the rest
+    if kind in ("int64", "float64"):
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    if kind == "bool":
+        return isinstance(value, bool)
+    return isinstance(value, str)
+
+
+def _sql_compare(op, left, right):
+    """(SQL condition, params) implied by `left <op> right`, or None."""
+    column = _store_filter_column(left)
+    if column is None:
+        column, op, right = _store_filter_column(right), _FLIPPED_OPS.get(op), left
+    if column is None or op is None:
+        return None
+    sql, kind, bare = column
+    if op is ast.In:
+        if bare or not isinstance(right, (ast.List, ast.Tuple, ast.Set)):
+            return None
+        values = [_constant(e) for e in right.elts]
+        if not values or not all(_sql_kind_matches(kind, v) for v in values):
+            return None
+        return f"{sql} IN ({', '.join('?' * len(values))})", values
+    value = _constant(right)
+    if op not in _SQL_OPS or not _sql_kind_matches(kind, value):
+        return None
+    if bare and _COMPARE_OPS[op](0.0, value):
+        # A missing financial value is 0 in --filter
+        sql = f"COALESCE({sql}, 0)"
+    return f"{sql} {_SQL_OPS[op]} ?", [value]
+
+
+def _sql_truthy(node, negated):
+    """(SQL condition, params) for a bare field name used as a condition (or `not name`), or None."""
+    column = _store_filter_column(node)
+    if column is None or node.id.startswith("_"):
+        return None
+    sql, kind, _ = column
+    if kind in ("int64", "float64"):
+        return (f"({sql} IS NULL OR {sql} = 0)" if negated else f"{sql} <> 0"), []
+    if kind == "bool":
+        return (f"({sql} IS NULL OR {sql} = ?)", [False]) if negated else (f"{sql} = ?", [True])
+    if negated:
+        # --filter also treats tabs and other whitespace as empty, which TRIM does not
+        return None
+    return f"TRIM({sql}) <> ''", []
+
+
+def filter_to_sql(compiled_filter):
+    """
+    Translate a --filter expression into SQL conditions on the store's query (companies c
+    joined with their latest financials f). Like plan_pushdown, only top-level `and`
+    conditions that map directly to a column are translated: comparisons and `in` lists with
+    constants of the column's type, and bare names (or `not name`) used as conditions. Every
+    matching company satisfies the result, and query_store evaluates the full filter on the
+    rows it returns. Returns (conditions, params, translated conditions as filter text).
+    """
+    conditions, params, used = [], [], []
+    if compiled_filter is None:
+        return conditions, params, used
+    if compiled_filter.needs_finance:
+        # As in a normal run, a financial filter only matches companies with a finance lookup
+        conditions.append("c.finance_fetched = ?")
+        params.append(True)
+    for node in _conjuncts(compiled_filter.tree.body):
+        parts = []
+        if isinstance(node, ast.Compare):
+            operands = [node.left] + node.comparators
+            parts = [_sql_compare(type(op), left, right) for op, left, right in zip(node.ops, operands, operands[1:])]
+        elif isinstance(node, ast.Name):
+            parts = [_sql_truthy(node, False)]
+        elif isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not) and isinstance(node.operand, ast.Name):
+            parts = [_sql_truthy(node.operand, True)]
+        parts = [p for p in parts if p is not None]
+        if parts:
+            used.append(ast.unparse(node))
+        for condition, values in parts:
+            conditions.append(condition)
+            params.extend(values)
+    return conditions, params, used
+
+
+def store_company_dict(row):
+    """
+    company_dict (as CompanyPipeline builds it, with financial data applied) for a row of
+    query_store's SELECT: STORE_COMPANY_COLUMNS, f.year, then STORE_FINANCE_COLUMNS.
+    """
+    n = len(STORE_COMPANY_COLUMNS)
+    stored = dict(zip((name for name, _ in STORE_COMPANY_COLUMNS), row[:n]))
+    company_dict = {}
+    for field in FIELD_MAP:
+        value = stored[field]
+        if field == "in_liquidation":
+            value = bool(value)
+        elif field == "employees":
+            value = int(value) if value is not None else ""
+        company_dict[field] = "" if value is None else value
+    if not stored["finance_fetched"]:
+        return company_dict
+    year = row[n]
+    if year is not None:
+        # parse_financial_period gives the year as text
+        company_dict["fin_year"] = str(year)
+        for (name, kind), value in zip(STORE_FINANCE_COLUMNS, row[n + 1:]):
+            if value is None:
+                value = ""
+            elif kind == "bool":
+                value = bool(value)
+            company_dict[name] = value
+    for field in NUMERIC_FINANCE_FIELDS:
+        value = company_dict.get(f"fin_{field}")
+        company_dict[field] = float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else 0.0
+    return company_dict
+
+
+def query_store(store, compiled_filter=None, industries=None, limit=None, show_sql=False, batch_size=DEFAULT_STORE_BATCH_SIZE):
+    """
+    Yield company_dicts from a CompanyStore that match the filter and industry code prefixes,
+    in orgnr order, without any network access. The translatable part of the filter runs in
+    SQL (see filter_to_sql) so the indexes narrow the rows; the full compiled filter is then
+    evaluated on each row, so the result is the same as filtering during the download.
+    """
+    conditions, params, used = [], [], []
+    if industries:
+        # Prefix ranges on company_industries.code, e.g. 62.0 -> [62.0, 62.1)
+        ranges = " OR ".join("(code >= ? AND code < ?)" for _ in industries)
+        conditions.append(f"c.orgnr IN (SELECT orgnr FROM company_industries WHERE {ranges})")
+        for prefix in industries:
+            params += [prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)]
+    filter_conditions, filter_params, used = filter_to_sql(compiled_filter)
+    conditions += filter_conditions
+    params += filter_params
+    columns = [f"c.{name}" for name, _ in STORE_COMPANY_COLUMNS] + ["f.year"] + [f"f.{name}" for name, _ in STORE_FINANCE_COLUMNS]
+    sql = (f"SELECT {', '.join(columns)} FROM companies c "
+           "LEFT JOIN financials f ON f.orgnr = c.orgnr AND f.year = c.fin_year"
+           + (f" WHERE {' AND '.join(conditions)}" if conditions else "")
+           + " ORDER BY c.orgnr")
+    if show_sql:
+        print(f"SQL: {sql}\nParametere: {params}\nOversatt fra filteret: {', '.join(used) or '-'}", file=sys.stderr)
+    predicate = compiled_filter.predicate if compiled_filter is not None else None
+    metrics = get_metrics()
+    cursor = store.execute(sql, params)
+    matched = 0
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        for row in rows:
+            metrics.count("companies")
+            company_dict = store_company_dict(row)
+            if predicate is not None and not predicate(company_dict):
+                continue
+            yield company_dict
+            matched += 1
+            if limit is not None and matched >= limit:
+                return
+
+
+def parse_query_arguments(argv):
+    """Arguments for `main.py query STORE ...`."""
+    parser = argparse.ArgumentParser(
+        prog=f"{os.path.basename(sys.argv[0])} query",
+        description="Søk med --filter i en lokal database laget med --format sqlite eller duckdb, uten nettverkstilgang"
+    )
+    parser.add_argument("store", help="Databasefilen (.sqlite/.db eller .duckdb)")
+    parser.add_argument(
+        "--filter",
+        type=str,
+        default=None,
+        help="Filteruttrykk, som for nedlasting (f.eks. 'employees > 10 and revenue > 5000000')"
+    )
+    parser.add_argument(
+        "--industry", "-i",
+        type=str,
+        default=None,
+        help="Næringskode(r) eller prefikser, kommaseparert (standard: alle i databasen)"
+    )
+    parser.add_argument(
+        "--fields", "-f",
+        type=str,
+        default=None,
+        help="Kommaseparert liste over felter (selskapsfelter og finansfelter). Standard er alle"
+    )
+    parser.add_argument("--limit", "-l", type=int, default=None, help="Maksimalt antall selskaper")
+    parser.add_argument(
+        "--output", "-o",
+        type=str,
+        default=None,
+        help="Skriv resultatet til fil (csv, parquet eller arrow ut fra filendelsen). Standard er CSV til skjermen"
+    )
+    parser.add_argument("--format", choices=["csv", "parquet", "arrow"], help="Filformat for --output")
+    parser.add_argument("--engine", choices=STORE_FORMATS, help="Databasetype (standard: ut fra filendelsen)")
+    parser.add_argument("--show-sql", action="store_true", help="Skriv SQL-spørringen som kjøres mot databasen")
+    return parser.parse_args(argv)
+
+
+def query_main(argv):
+    """The `query` subcommand: run a --filter against a local store and write the matches."""
+    args = parse_query_arguments(argv)
+    to_stdout = not args.output
+    log = sys.stderr if to_stdout else sys.stdout
+    try:
+        compiled_filter = compile_filter(args.filter) if args.filter else None
+        keys = query_output_keys([f for f in (args.fields or "").split(",") if f.strip()], True)
+    except FilterError as e:
+        print(f"Feil i --filter/--fields: {e}", file=log)
+        return 1
+    if not os.path.exists(args.store):
+        print(f"Fant ikke databasen {args.store}.", file=log)
+        return 1
+    output_format = "csv" if to_stdout else args.format or output_format_for_file(args.output)
+    if output_format not in ("csv", "parquet", "arrow"):
+        print("--output må være en csv-, parquet- eller arrow-fil.", file=log)
+        return 1
+    engine = args.engine or ("duckdb" if output_format_for_file(args.store) == "duckdb" else "sqlite")
+    industries = [c.strip() for c in (args.industry or "").split(",") if c.strip()]
+    get_metrics().reset()
+    started = time.monotonic()
+    store = sink = None
+    try:
+        store = CompanyStore(args.store, engine)
+        selected_fields = [k for k in keys if k in FIELD_MAP]
+        extra_fields = [k for k in keys if k.startswith("fin_")]
+        if not args.fields and store.execute("SELECT 1 FROM companies WHERE finance_fetched LIMIT 1").fetchone() is None:
+            extra_fields = []  # No financial data in the store
+        sink = open_sink(args.output or "-", selected_fields, FIELD_MAP, extra_fields=extra_fields, output_format=output_format)
+        for company_dict in query_store(store, compiled_filter, industries, args.limit, args.show_sql):
+            row = {FIELD_MAP[f]: company_dict[f] for f in selected_fields}
+            row.update((key, company_dict.get(key, "")) for key in extra_fields)
+            sink.write(row)
+    except (sqlite3.Error, IOError, ImportError) as e:
+        print(f"\nFeil ved spørring: {e}", file=log)
+        return 1
+    finally:
+        if sink is not None:
+            sink.close()
+        if store is not None:
+            store.close()
+    print(f"Fant {sink.rows_written} selskaper som matcher filter blant {get_metrics().counter('companies')} "
+          f"kandidater i {args.store} ({time.monotonic() - started:.2f} s)"
+          + ("" if to_stdout else f". Data lagret til {args.output}"), file=log)
+    return 0
@@ -0,0 +1,209 @@
+"""
+Rate limiting: the token bucket for finance lookups and the limiter shared between processes.
+"""
+
+import json
+import os
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+from .common import RATE_LIMIT_DECREASE, RATE_LIMIT_INCREASE, RATE_LIMIT_MAX_PAUSE, RATE_LIMIT_MIN_RATE
+from .metrics import get_metrics
+
+
+def parse_retry_after(value):
+    """
+    Parse a Retry-After header (delay in seconds or an HTTP date) into seconds.
+    Returns None if the header is missing or invalid.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+        return max(0.0, retry_at.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _lock_file(fd):
+    """Take an exclusive lock on an open file (blocks until it is free)."""
+    if os.name == "nt":
+        import msvcrt
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+    else:
+        import fcntl
+        fcntl.flock(fd, fcntl.LOCK_EX)
+
+
+def _unlock_file(fd):
+    if os.name == "nt":
+        import msvcrt
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+    else:
+        import fcntl
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+class SharedRateLimiter:
+    """
+    Client-side rate limits per endpoint, shared by every process on the host that
+    uses the same state file. Each endpoint in `budgets` (endpoint -> (max rate per
+    second, burst); rate 0 = no limit) has its own budget. Requests are spaced with
+    the generic cell rate algorithm, a token bucket kept as one "theoretical arrival
+    time" so that `burst` requests may go back to back. The rate adapts AIMD-style:
+    a 429/503 answer halves it (once per episode) and pauses every process until
+    Retry-After has passed, and healthy answers raise it again by
+    RATE_LIMIT_INCREASE requests per second per second, up to the budget's rate.
+
+    The shared state is a small JSON file read and rewritten under an exclusive
+    file lock for every request; with path=None it is kept in memory and only
+    shared between the threads of this process. Thread-safe.
+    """
+
+    def __init__(self, budgets, path=None):
+        self.budgets = {endpoint: (max(0.0, float(rate)), max(1.0, float(burst)))
+                        for endpoint, (rate, burst) in budgets.items()}
+        self.path = path
+        self.state = {}
+        self.lock = threading.Lock()
+        self.counters = {endpoint: {"requests": 0, "throttled": 0, "decreases": 0, "waited_s": 0.0,
+                                    "rate": rate or None, "min_rate": rate or None}
+                         for endpoint, (rate, _) in self.budgets.items()}
+        self.fd = None
+        if path is not None:
+            directory = os.path.dirname(os.path.abspath(path))
+            os.makedirs(directory, exist_ok=True)
+            self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+
+    def covers(self, endpoint):
+        return endpoint in self.budgets
+
+    def _update(self, endpoint, fn):
+        # Run fn(entry, now) on the endpoint's shared state and save it
+        with self.lock:
+            if self.fd is None:
+                return fn(self.state.setdefault(endpoint, {}), time.time())
+            _lock_file(self.fd)
+            try:
+                os.lseek(self.fd, 0, os.SEEK_SET)
+                raw = b""
+                while True:
+                    chunk = os.read(self.fd, 65536)
+                    if not chunk:
+                        break
+                    raw += chunk
+                try:
+                    state = json.loads(raw) if raw.strip() else {}
+                except ValueError:
+                    state = {}  # A damaged file only resets the shared budgets
+                result = fn(state.setdefault(endpoint, {}), time.time())
+                data = json.dumps(state).encode("utf-8")
+                os.lseek(self.fd, 0, os.SEEK_SET)
+                os.ftruncate(self.fd, 0)
+                os.write(self.fd, data)
+                return result
+            finally:
+                _unlock_file(self.fd)
+
+    def _rate(self, entry, max_rate):
+        # Processes may be started with different budgets; each stays under its own
+        return min(entry.get("rate") or max_rate, max_rate)
+
+    def acquire(self, endpoint):
+        """Block until a request to endpoint is allowed by the shared budget."""
+        budget = self.budgets.get(endpoint)
+        if budget is None:
+            return
+        max_rate, burst = budget
+
+        def reserve(entry, now):
+            start = max(now, entry.get("blocked_until", 0.0))
+            if max_rate > 0:
+                interval = 1.0 / self._rate(entry, max_rate)
+                arrival = max(entry.get("tat", 0.0), start)
+                start = max(start, arrival - (burst - 1) * interval)
+                entry["tat"] = arrival + interval
+            return start - now
+
+        wait = self._update(endpoint, reserve)
+        counters = self.counters[endpoint]
+        with self.lock:
+            counters["requests"] += 1
+            if wait > 0:
+                counters["waited_s"] += wait
+        if wait > 0:
+            get_metrics().add_time("rate_limit_wait", wait)
+            time.sleep(wait)
+
+    def record(self, endpoint, status, retry_after=None):
+        """Adjust the endpoint's rate from an answer: back off on 429/503, ramp up on healthy answers."""
+        budget = self.budgets.get(endpoint)
+        if budget is None:
+            return
+        max_rate = budget[0]
+        throttled = status in (429, 503)
+        if not throttled and (status >= 400 and status != 404):
+            return
+
+        def adjust(entry, now):
+            rate = self._rate(entry, max_rate) if max_rate > 0 else 0.0
+            decreased = False
+            if throttled:
+                pause = parse_retry_after(retry_after)
+                if pause is None:
+                    pause = max(1.0, 2.0 / rate) if rate > 0 else 1.0
+                pause = min(pause, RATE_LIMIT_MAX_PAUSE)
+                entry["blocked_until"] = max(entry.get("blocked_until", 0.0), now + pause)
+                # Answers to requests sent before the back-off belong to the same episode
+                if rate > 0 and now >= entry.get("calm_until", 0.0):
+                    rate = max(RATE_LIMIT_MIN_RATE, rate * RATE_LIMIT_DECREASE)
+                    entry["calm_until"] = now + pause + 1.0 / rate
+                    decreased = True
+            elif 0 < rate < max_rate:
+                rate = min(max_rate, rate + RATE_LIMIT_INCREASE / rate)
+            if max_rate > 0:
+                entry["rate"] = rate
+            return rate, decreased
+
+        rate, decreased = self._update(endpoint, adjust)
+        counters = self.counters[endpoint]
+        with self.lock:
+            if max_rate > 0:
+                counters["rate"] = rate
+                counters["min_rate"] = min(counters["min_rate"], rate)
+            if throttled:
+                counters["throttled"] += 1
+            if decreased:
+                counters["decreases"] += 1
+
+    def stats(self):
+        """Per endpoint: max_rate, current rate, lowest rate, requests, throttled answers, decreases and seconds waited."""
+        with self.lock:
+            return {endpoint: dict(counters, max_rate=self.budgets[endpoint][0] or None,
+                                   waited_s=round(counters["waited_s"], 3))
+                    for endpoint, counters in self.counters.items()}
+
+    def close(self):
+        with self.lock:
+            if self.fd is not None:
+                os.close(self.fd)
+                self.fd = None
+
+
+def format_rate_limit_stats(stats, shared=True):
+    """One-line Norwegian summary of SharedRateLimiter.stats() for the endpoints that were used."""
+    parts = []
+    for endpoint, s in stats.items():
+        if not s["requests"]:
+            continue
+        rate = f"{s['rate']:.1f}/s (maks {s['max_rate']:g}, laveste {s['min_rate']:.1f})" if s["max_rate"] else "ingen grense"
+        parts.append(f"{endpoint} {rate}, {s['throttled']} × 429/503, ventet {s['waited_s']:.1f} s")
+    scope = "felles for alle prosesser" if shared else "kun denne prosessen"
+    return f"Ratebegrensning ({scope}): " + ("; ".join(parts) if parts else "ingen forespørsler")
@@ -0,0 +1,159 @@
+"""
+Company fields extracted from raw entities, and the typed records of the library API.
+"""
+
+from dataclasses import dataclass
+from datetime import date
+from typing import Optional
+
+from .common import FIELD_MAP, FIELD_TYPES, FIN_FIELD_CSV_MAP, FIN_FIELD_TYPES, INDUSTRY_COLUMN
+
+
+def extract_company_data(company, selected_fields, field_map, all_fields=False):
+    """
+    Extract relevant company data for selected fields (all English keys). If all_fields=True, return all possible fields (Pythonic keys).
+    """
+    all_data = {
+        "name": company.get("navn", ""),
+        "orgnr": company.get("organisasjonsnummer", ""),
+        "incorporation_date": company.get("stiftelsesdato", ""),
+        "registration_date": company.get("registreringsdatoEnhetsregisteret", ""),
+        "email": company.get("epostadresse", "").lower() if company.get("epostadresse") else "",
+        "phone": company.get("telefon", ""),
+        "mobile": company.get("mobil", ""),
+        "website": company.get("hjemmeside", ""),
+        "address": "",
+        "zipcode": "",
+        "state": "",
+        "street": "",
+        "in_liquidation": bool(company.get("underAvvikling", False)),
+        "employees": company.get("antallAnsatte", ""),
+        # Not an output field: lets --diff skip finance lookups when the accounts have not moved
+        "last_accounts_year": company.get("sisteInnsendteAarsregnskap", "")
+    }
+    if company.get("forretningsadresse"):
+        adresse_list = company.get("forretningsadresse", {}).get("adresse", [])
+        postnr = company.get("forretningsadresse", {}).get("postnummer", "")
+        poststed = company.get("forretningsadresse", {}).get("poststed", "")
+        kommune = company.get("forretningsadresse", {}).get("kommune", "")
+        if adresse_list:
+            address = ", ".join(adresse_list)
+            if postnr and poststed:
+                address += f", {postnr} {poststed}"
+            all_data["address"] = address
+            all_data["street"] = ", ".join(adresse_list)
+        all_data["zipcode"] = postnr
+        all_data["state"] = kommune
+    if all_fields:
+        return all_data
+    return {field_map[f]: all_data[f] for f in selected_fields}
+
+
+def to_column_value(value, kind):
+    """
+    Convert a row value to the Python value for a typed column (see FIELD_TYPES).
+    Empty and unparseable values become None (null).
+    """
+    if value is None or value == "":
+        return None
+    try:
+        if kind in ("int64", "float64"):
+            if isinstance(value, str):
+                value = float(value.replace(" ", "").replace("\xa0", ""))
+            return int(round(value)) if kind == "int64" else float(value)
+        if kind == "bool":
+            if isinstance(value, str):
+                return value.strip().lower() in ("true", "1")
+            return bool(value)
+        if kind == "date":
+            return date.fromisoformat(str(value)[:10])
+    except (TypeError, ValueError):
+        return None
+    return str(value)
+
+
+def company_industry_codes(company):
+    """All næringskoder (1-3) registered for an entity."""
+    codes = []
+    for key in ("naeringskode1", "naeringskode2", "naeringskode3"):
+        value = company.get(key)
+        if isinstance(value, dict) and value.get("kode"):
+            codes.append(value["kode"])
+    return codes
+
+
+def industry_matches(naeringskode, company_codes):
+    """True if any of the entity's codes equals or lies under naeringskode (e.g. 73.11 covers 73.110)."""
+    return any(code == naeringskode or code.startswith(naeringskode) for code in company_codes)
+
+
+@dataclass(frozen=True)
+class Financials:
+    """The latest annual accounts of a company, as yielded by iter_companies(). Missing values are None."""
+    period_start: Optional[date] = None
+    period_end: Optional[date] = None
+    year: Optional[int] = None
+    currency: Optional[str] = None
+    account_type: Optional[str] = None
+    in_liquidation: Optional[bool] = None
+    small_company: Optional[bool] = None
+    audited: Optional[bool] = None
+    revenue: Optional[int] = None
+    operating_result: Optional[int] = None
+    net_profit: Optional[int] = None
+    total_assets: Optional[int] = None
+    total_equity: Optional[int] = None
+    total_liabilities: Optional[int] = None
+    short_term_liabilities: Optional[int] = None
+    long_term_liabilities: Optional[int] = None
+    retained_earnings: Optional[int] = None
+    contributed_equity: Optional[int] = None
+    current_assets: Optional[int] = None
+    fixed_assets: Optional[int] = None
+    net_financial_items: Optional[int] = None
+    financial_income: Optional[int] = None
+    financial_expenses: Optional[int] = None
+    profit_margin: Optional[float] = None
+    equity_ratio: Optional[float] = None
+    debt_ratio: Optional[float] = None
+    return_on_equity: Optional[float] = None
+
+    @classmethod
+    def from_row(cls, row):
+        """Build from the fin_ keys of a row, or return None if the row has no accounts."""
+        values = {key[4:]: to_column_value(row.get(key), FIN_FIELD_TYPES.get(key, "string")) for key in FIN_FIELD_CSV_MAP}
+        if all(value is None for value in values.values()):
+            return None
+        return cls(**values)
+
+
+@dataclass(frozen=True)
+class Company:
+    """
+    One company yielded by iter_companies(): the fields of FIELD_MAP with Python types
+    (dates as date, employees as int), the industry code it was found under and its
+    Financials (None without finance=True or when it has no accounts). Missing values are None.
+    """
+    orgnr: str
+    name: Optional[str] = None
+    incorporation_date: Optional[date] = None
+    registration_date: Optional[date] = None
+    email: Optional[str] = None
+    phone: Optional[str] = None
+    mobile: Optional[str] = None
+    website: Optional[str] = None
+    address: Optional[str] = None
+    zipcode: Optional[str] = None
+    state: Optional[str] = None
+    street: Optional[str] = None
+    in_liquidation: Optional[bool] = None
+    employees: Optional[int] = None
+    industry: Optional[str] = None
+    financials: Optional[Financials] = None
+
+    @classmethod
+    def from_row(cls, row):
+        """Build from a row with the Python field names as keys (extract_company_data(all_fields=True) plus fin_ keys)."""
+        values = {field: to_column_value(row.get(field), FIELD_TYPES.get(field, "string")) for field in FIELD_MAP}
+        values["orgnr"] = values["orgnr"] or ""
+        return cls(**values, industry=row.get(INDUSTRY_COLUMN), financials=Financials.from_row(row))
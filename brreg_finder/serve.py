@@ -0,0 +1,616 @@
+"""
+--serve: an in-memory index of the companies behind a small HTTP query API.
+"""
+
+import ast
+import bisect
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+from .client import HttpClient, format_http_stats
+from .common import (
+    DEFAULT_DUMP_FILE, DEFAULT_FINANCE_BURST, DEFAULT_FINANCE_RATE, DEFAULT_FINANCE_WORKERS, DEFAULT_MAX_RETRIES,
+    DEFAULT_PAGE_DELAY, DEFAULT_PREFETCH_DEPTH, DEFAULT_QUERY_LIMIT, DEFAULT_REFRESH_INTERVAL, DEFAULT_SERVE_PORT,
+    DEFAULT_SHARD_WORKERS, FIELD_MAP, MAX_QUERY_LIMIT, NUMERIC_FINANCE_FIELDS, echo, utc_timestamp,
+)
+from .dump import download_dump, iter_dump_companies
+from .filters import (
+    FilterError, _FLIPPED_OPS, _cached_filter, _conjuncts, _constant, _resolve_filter_name, query_output_keys,
+)
+from .finance import FinanceFetcher, calculate_financial_ratios
+from .incremental import (
+    CompanySnapshot, IncompleteCrawlError, fetch_entities_in_industry, iter_updates, sync_snapshot,
+)
+from .metrics import get_metrics
+from .records import company_industry_codes, extract_company_data, industry_matches
+
+
+# Indexes kept by CompanyIndex: exact-value fields and numeric fields answered with range lookups
+SERVE_VALUE_INDEXES = ("state", "zipcode")
+SERVE_RANGE_INDEXES = ("employees",) + NUMERIC_FINANCE_FIELDS
+_RANGE_OPS = (ast.Gt, ast.GtE, ast.Lt, ast.LtE, ast.Eq)
+
+
+def company_record(company):
+    """All company fields of a raw entity (filter names as keys), as stored by CompanyIndex."""
+    return extract_company_data(company, list(FIELD_MAP), FIELD_MAP, all_fields=True)
+
+
+def set_record_finance(record, fin_data):
+    """
+    Replace the financial data of a record: fin_ fields plus the numeric values under their
+    bare names as floats (0.0 when missing), the same values --filter sees in a normal run.
+    """
+    for key in [k for k in record if k.startswith("fin_")]:
+        del record[key]
+    if fin_data:
+        record.update(calculate_financial_ratios(dict(fin_data)))
+    for field in NUMERIC_FINANCE_FIELDS:
+        value = record.get(f"fin_{field}")
+        record[field] = float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else 0.0
+
+
+class CompanyIndex:
+    """
+    In-memory store of companies for --serve, with secondary indexes so --filter queries
+    do not have to scan every company:
+
+    - industry code -> orgnrs (queries by code prefix, like --industry)
+    - exact values of SERVE_VALUE_INDEXES (kommune, postnummer) -> orgnrs
+    - sorted (value, orgnr) lists for SERVE_RANGE_INDEXES (employees and the numeric
+      finance fields), rebuilt lazily after changes and searched by bisection
+
+    Top-level `and` conditions of a filter that an index can answer narrow the candidates;
+    the full compiled filter is then evaluated on those only, so results are exactly what
+    a normal run with the same --filter would return. Thread-safe.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.records = {}
+        self.codes = {}
+        self.positions = {}
+        self.next_position = 0
+        self.by_code = {}
+        self.by_value = {field: {} for field in SERVE_VALUE_INDEXES}
+        self.ranges = {}
+        self.with_finance = 0
+
+    def __len__(self):
+        return len(self.records)
+
+    def upsert(self, company):
+        """Add or replace a raw entity. Financial data already loaded for it is kept."""
+        orgnr = company.get("organisasjonsnummer")
+        if not orgnr:
+            return
+        record = company_record(company)
+        with self.lock:
+            old = self.records.get(orgnr)
+            if old is not None:
+                self._unindex(orgnr, old)
+                for key, value in old.items():
+                    if key.startswith("fin_") or key in NUMERIC_FINANCE_FIELDS:
+                        record[key] = value
+                if "revenue" in record:
+                    self.with_finance += 1
+            else:
+                self.positions[orgnr] = self.next_position
+                self.next_position += 1
+            self.records[orgnr] = record
+            self.codes[orgnr] = company_industry_codes(company)
+            for code in self.codes[orgnr]:
+                self.by_code.setdefault(code, set()).add(orgnr)
+            for field in SERVE_VALUE_INDEXES:
+                self.by_value[field].setdefault(record.get(field), set()).add(orgnr)
+            self.ranges.clear()
+
+    def remove(self, orgnr):
+        with self.lock:
+            record = self.records.pop(orgnr, None)
+            if record is None:
+                return False
+            self._unindex(orgnr, record)
+            del self.positions[orgnr]
+            del self.codes[orgnr]
+            self.ranges.clear()
+            return True
+
+    def _unindex(self, orgnr, record):
+        for code in self.codes.get(orgnr, ()):
+            self.by_code.get(code, set()).discard(orgnr)
+        for field in SERVE_VALUE_INDEXES:
+            self.by_value[field].get(record.get(field), set()).discard(orgnr)
+        if "revenue" in record:
+            self.with_finance -= 1
+
+    def set_finance(self, orgnr, fin_data):
+        """Store the result of a finance lookup (None if the company has no accounts)."""
+        with self.lock:
+            record = self.records.get(orgnr)
+            if record is None:
+                return
+            if "revenue" not in record:
+                self.with_finance += 1
+            set_record_finance(record, fin_data)
+            for field in NUMERIC_FINANCE_FIELDS:
+                self.ranges.pop(field, None)
+
+    def get(self, orgnr):
+        with self.lock:
+            record = self.records.get(orgnr)
+            return dict(record, industry_codes=self.codes[orgnr]) if record is not None else None
+
+    def _range_index(self, key):
+        index = self.ranges.get(key)
+        if index is None:
+            pairs = []
+            for orgnr, record in self.records.items():
+                value = record.get(key)
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    pairs.append((value, orgnr))
+            pairs.sort()
+            index = self.ranges[key] = ([v for v, _ in pairs], [o for _, o in pairs])
+        return index
+
+    def _index_key(self, node):
+        if not isinstance(node, ast.Name):
+            return None
+        key = _resolve_filter_name(node.id)[0]
+        return key if key in SERVE_VALUE_INDEXES or key in SERVE_RANGE_INDEXES else None
+
+    def _compare_lookup(self, op, left, right):
+        """orgnrs where `left <op> right` holds, if an index can tell, else None."""
+        key = self._index_key(left)
+        if key is not None and op is ast.In and isinstance(right, (ast.List, ast.Tuple, ast.Set)) \
+                and key in SERVE_VALUE_INDEXES:
+            values = [_constant(e) for e in right.elts]
+            if not all(isinstance(v, str) for v in values):
+                return None
+            return set().union(*(self.by_value[key].get(v, ()) for v in values))
+        value = _constant(right)
+        if key is None:
+            key, value, op = self._index_key(right), _constant(left), _FLIPPED_OPS.get(op)
+        if key is None or op is None:
+            return None
+        if key in SERVE_VALUE_INDEXES:
+            return set(self.by_value[key].get(value, ())) if op is ast.Eq and isinstance(value, str) else None
+        if op not in _RANGE_OPS or isinstance(value, bool) or not isinstance(value, (int, float)):
+            return None
+        values, orgnrs = self._range_index(key)
+        low, high = 0, len(values)
+        if op is ast.Gt:
+            low = bisect.bisect_right(values, value)
+        elif op is ast.GtE:
+            low = bisect.bisect_left(values, value)
+        elif op is ast.Lt:
+            high = bisect.bisect_left(values, value)
+        elif op is ast.LtE:
+            high = bisect.bisect_right(values, value)
+        else:
+            low, high = bisect.bisect_left(values, value), bisect.bisect_right(values, value)
+        return set(orgnrs[low:high])
+
+    def candidates(self, compiled_filter, industries=None):
+        """
+        orgnrs that may match (a superset of the matches), or None if no index applies.
+        Returns (candidates, list of the indexed conditions used).
+        """
+        sets = []
+        used = []
+        if industries:
+            sets.append(set().union(*(orgnrs for code, orgnrs in self.by_code.items()
+                                      if any(code == prefix or code.startswith(prefix) for prefix in industries))))
+            used.append("industry")
+        if compiled_filter is not None:
+            for node in _conjuncts(compiled_filter.tree.body):
+                if not isinstance(node, ast.Compare):
+                    continue
+                operands = [node.left] + node.comparators
+                found = None
+                for op, left, right in zip(node.ops, operands, operands[1:]):
+                    ids = self._compare_lookup(type(op), left, right)
+                    if ids is not None:
+                        found = ids if found is None else found & ids
+                if found is not None:
+                    sets.append(found)
+                    used.append(ast.unparse(node))
+        if not sets:
+            return None, used
+        sets.sort(key=len)
+        result = sets[0]
+        for other in sets[1:]:
+            result = result & other
+        return result, used
+
+    def query(self, compiled_filter=None, industries=None, offset=0, limit=DEFAULT_QUERY_LIMIT):
+        """
+        Companies matching the filter (and industry prefixes), in load order.
+        Returns (total number of matches, records offset..offset+limit, indexed conditions used).
+        """
+        with self.lock:
+            candidates, used = self.candidates(compiled_filter, industries)
+            if candidates is None:
+                orgnrs = self.records.keys()
+            else:
+                orgnrs = sorted(candidates, key=self.positions.__getitem__)
+            if compiled_filter is not None:
+                predicate = compiled_filter.predicate
+                matches = [orgnr for orgnr in orgnrs if predicate(self.records[orgnr])]
+            else:
+                matches = list(orgnrs)
+            page = [dict(self.records[orgnr], industry_codes=self.codes[orgnr]) for orgnr in matches[offset:offset + limit]]
+            return len(matches), page, used
+
+    def stats(self):
+        with self.lock:
+            return {
+                "companies": len(self.records),
+                "with_finance": self.with_finance,
+                "industry_codes": len([c for c, orgnrs in self.by_code.items() if orgnrs]),
+                "kommuner": len([v for v, orgnrs in self.by_value["state"].items() if orgnrs]),
+                "postnumre": len([v for v, orgnrs in self.by_value["zipcode"].items() if orgnrs]),
+            }
+
+
+class FinanceLoader:
+    """
+    Background thread that runs finance lookups for orgnrs (through a FinanceFetcher, so the
+    usual rate limit and cache apply) and stores the results in a CompanyIndex.
+    """
+
+    def __init__(self, index, fetcher):
+        self.index = index
+        self.fetcher = fetcher
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, orgnrs):
+        orgnrs = list(orgnrs)
+        with self.lock:
+            self.pending += len(orgnrs)
+        self.queue.put(orgnrs)
+
+    def _store(self, results):
+        for orgnr, fin_data in results:
+            self.index.set_finance(orgnr, fin_data)
+            with self.lock:
+                self.pending -= 1
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            try:
+                batch = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            for orgnr in batch:
+                if self.stop_event.is_set():
+                    return
+                self.fetcher.submit(orgnr, orgnr)
+                self._store(self.fetcher.ready())
+            self._store(self.fetcher.ready(block=True))
+
+    def close(self):
+        self.stop_event.set()
+        self.thread.join()
+        self.fetcher.close()
+
+
+class CompanyService:
+    """
+    Keeps a CompanyIndex loaded for --serve. With source "api" each industry code has a
+    CompanySnapshot (crawled once, then updated from the update feed as in --incremental);
+    with source "dump" the companies are read once from the dump file and later changes come
+    from the update feed, starting at the time the dump file was written. refresh() applies
+    new changes to the index; changed companies get new finance lookups.
+    """
+
+    def __init__(self, industry_codes, client, source="api", dump_file=None, snapshot_files=None, finance_loader=None,
+                 prefetch=DEFAULT_PREFETCH_DEPTH, page_delay=DEFAULT_PAGE_DELAY, shard_workers=DEFAULT_SHARD_WORKERS):
+        self.industry_codes = industry_codes
+        self.client = client
+        self.source = source
+        self.dump_file = dump_file
+        self.snapshot_files = snapshot_files
+        self.finance_loader = finance_loader
+        self.prefetch = prefetch
+        self.page_delay = page_delay
+        self.shard_workers = shard_workers
+        self.index = CompanyIndex()
+        self.owners = {}  # orgnr -> industry codes whose snapshot holds it (source "api")
+        self.cursor_id = None
+        self.since = None
+        self.loaded_at = None
+        self.refreshed_at = None
+        self.last_refresh = None
+        self.refresh_lock = threading.Lock()
+
+    def _sync(self, code, path, reload=False):
+        """
+        Bring the snapshot of one code up to date and apply it to the index: all of it when
+        reload is True or the snapshot was rebuilt, otherwise only the changed companies.
+        Returns (sync stats or None, orgnrs added or changed).
+        """
+        snapshot = CompanySnapshot(path)
+        try:
+            try:
+                stats = sync_snapshot(snapshot, code, self.client, self.prefetch, self.page_delay, self.shard_workers)
+            except (requests.exceptions.RequestException, IncompleteCrawlError) as e:
+                echo(f"\nFeil ved oppdatering av snapshot for {code}: {e}. Bruker forrige snapshot.")
+                if not reload:
+                    return None, []
+                stats = None
+            if reload or stats["full"]:
+                # Reload the whole code
+                for orgnr in [o for o, owners in self.owners.items() if code in owners]:
+                    self._release(orgnr, code)
+                companies = list(snapshot.iter_companies())
+                for company in companies:
+                    self._hold(company, code)
+                return stats, [c.get("organisasjonsnummer") for c in companies]
+            for orgnr in stats["changed"]:
+                company = snapshot.get(orgnr)
+                if company is not None:
+                    self._hold(company, code)
+                else:
+                    self._release(orgnr, code)
+            return stats, stats["changed"]
+        finally:
+            snapshot.close()
+
+    def _hold(self, company, code):
+        self.index.upsert(company)
+        self.owners.setdefault(company.get("organisasjonsnummer"), set()).add(code)
+
+    def _release(self, orgnr, code):
+        owners = self.owners.get(orgnr)
+        if owners is None:
+            return
+        owners.discard(code)
+        if not owners:
+            del self.owners[orgnr]
+            self.index.remove(orgnr)
+
+    def load(self):
+        """Fill the index from the snapshots (crawling any that are missing) or the dump file."""
+        started = time.monotonic()
+        changed = []
+        if self.source == "dump":
+            if not os.path.exists(self.dump_file):
+                download_dump(self.dump_file, self.client)
+            # Changes after the dump was written are picked up by refresh()
+            self.since = datetime.fromtimestamp(os.path.getmtime(self.dump_file), timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+            for company in iter_dump_companies(self.dump_file):
+                if any(industry_matches(code, company_industry_codes(company)) for code in self.industry_codes):
+                    self.index.upsert(company)
+                    changed.append(company.get("organisasjonsnummer"))
+        else:
+            for code, path in zip(self.industry_codes, self.snapshot_files):
+                changed.extend(self._sync(code, path, reload=True)[1])
+        self.loaded_at = utc_timestamp()
+        echo(f"{len(self.index)} selskaper lastet inn på {time.monotonic() - started:.1f} s.")
+        if self.finance_loader is not None and changed:
+            echo(f"Henter regnskap for {len(changed)} selskaper i bakgrunnen...")
+            self.finance_loader.submit(changed)
+
+    def refresh(self):
+        """Apply changes from the update feed. Returns a dict with counts."""
+        with self.refresh_lock:
+            stats = {"updates": 0, "upserted": 0, "deleted": 0}
+            changed = []
+            if self.source == "dump":
+                changes = {}
+                cursor_id = self.cursor_id
+                for update in iter_updates(self.client, self.cursor_id, self.since):
+                    stats["updates"] += 1
+                    changes[update.get("organisasjonsnummer")] = update.get("endringstype", "")
+                    cursor_id = max(cursor_id or 0, int(update.get("oppdateringsid", 0)))
+                refetch = [orgnr for orgnr, change in changes.items() if change not in ("Sletting", "Fjernet")]
+                for orgnr, change in changes.items():
+                    if change in ("Sletting", "Fjernet") and self.index.remove(orgnr):
+                        stats["deleted"] += 1
+                for start in range(0, len(refetch), 100):
+                    batch = refetch[start:start + 100]
+                    found = {}
+                    for code in self.industry_codes:
+                        found.update(fetch_entities_in_industry(batch, code, self.client))
+                    for orgnr in batch:
+                        if orgnr in found:
+                            self.index.upsert(found[orgnr])
+                            changed.append(orgnr)
+                            stats["upserted"] += 1
+                        elif self.index.remove(orgnr):
+                            stats["deleted"] += 1
+                # Only move the cursor once the changes are applied, so a failed refresh is retried
+                self.cursor_id = cursor_id
+            else:
+                for code, path in zip(self.industry_codes, self.snapshot_files):
+                    result, orgnrs = self._sync(code, path)
+                    if result is not None:
+                        for key in ("updates", "upserted", "deleted"):
+                            stats[key] += result[key]
+                    changed.extend(o for o in orgnrs if o in self.owners)
+            if self.finance_loader is not None and changed:
+                self.finance_loader.submit(changed)
+            self.refreshed_at = utc_timestamp()
+            self.last_refresh = stats
+            return stats
+
+    def status(self):
+        return dict(
+            self.index.stats(),
+            source=self.source,
+            industry=self.industry_codes,
+            loaded_at=self.loaded_at,
+            refreshed_at=self.refreshed_at,
+            last_refresh=self.last_refresh,
+            finance_pending=self.finance_loader.pending if self.finance_loader is not None else None,
+        )
+
+
+def _list_param(value):
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [v.strip() for v in value.split(",") if v.strip()]
+    return [str(v).strip() for v in value]
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """
+    JSON API over the CompanyService of the owning QueryServer:
+
+    GET  /query?filter=...&industry=73.11&fields=name,orgnr&limit=100&offset=0
+    POST /query with the same keys in a JSON body
+    GET  /company/{orgnr}
+    GET  /status
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/query":
+            return self._query({k: v[-1] for k, v in parse_qs(url.query).items()})
+        if url.path.startswith("/company/"):
+            record = self.server.service.index.get(url.path[len("/company/"):].strip("/"))
+            if record is None:
+                return self._send(404, {"error": "Fant ikke selskapet"})
+            return self._send(200, record)
+        if url.path == "/status":
+            return self._send(200, self.server.service.status())
+        return self._send(404, {"error": "Ukjent adresse. Bruk /query, /company/{orgnr} eller /status."})
+
+    def do_POST(self):
+        if urlparse(self.path).path != "/query":
+            return self._send(404, {"error": "Ukjent adresse"})
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        except ValueError as e:
+            return self._send(400, {"error": f"Ugyldig JSON: {e}"})
+        if not isinstance(body, dict):
+            return self._send(400, {"error": "Forventet et JSON-objekt"})
+        return self._query(body)
+
+    def _query(self, params):
+        service = self.server.service
+        started = time.perf_counter()
+        try:
+            compiled_filter = _cached_filter(params["filter"]) if params.get("filter") else None
+            keys = query_output_keys(_list_param(params.get("fields")), service.finance_loader is not None)
+            limit = min(MAX_QUERY_LIMIT, max(0, int(params.get("limit", DEFAULT_QUERY_LIMIT))))
+            offset = max(0, int(params.get("offset", 0)))
+        except (FilterError, ValueError, TypeError) as e:
+            return self._send(400, {"error": str(e)})
+        total, records, used = service.index.query(compiled_filter, _list_param(params.get("industry")), offset, limit)
+        took = (time.perf_counter() - started) * 1000
+        metrics = get_metrics()
+        metrics.observe("query", took)
+        metrics.count("queries")
+        self._send(200, {
+            "count": total,
+            "offset": offset,
+            "returned": len(records),
+            "took_ms": round(took, 2),
+            "indexes_used": used,
+            "finance_pending": service.finance_loader.pending if service.finance_loader is not None else None,
+            "results": [dict({key: record.get(key, "") for key in keys}, industry_codes=record["industry_codes"])
+                        for record in records],
+        })
+
+    def _send(self, status, body):
+        payload = json.dumps(body, ensure_ascii=False, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class QueryServer(ThreadingHTTPServer):
+    """Threaded HTTP server answering QueryHandler requests from a CompanyService."""
+
+    daemon_threads = True
+
+    def __init__(self, address, service):
+        super().__init__(address, QueryHandler)
+        self.service = service
+
+
+def serve_companies(industry_codes, host="127.0.0.1", port=DEFAULT_SERVE_PORT, source="api", dump_file=DEFAULT_DUMP_FILE,
+                    snapshot_files=None, finance=False, workers=DEFAULT_FINANCE_WORKERS, finance_rate=DEFAULT_FINANCE_RATE,
+                    finance_burst=DEFAULT_FINANCE_BURST, prefetch=DEFAULT_PREFETCH_DEPTH, page_delay=DEFAULT_PAGE_DELAY,
+                    max_retries=DEFAULT_MAX_RETRIES, cache=None, shard_workers=DEFAULT_SHARD_WORKERS,
+                    refresh_interval=DEFAULT_REFRESH_INTERVAL, rate_limiter=None):
+    """
+    Daemon mode: load the companies of the industry codes into a CompanyIndex (see
+    CompanyService), keep it current from the update feed every `refresh_interval` minutes
+    and answer --filter queries over HTTP/JSON (see QueryHandler) until interrupted.
+    With finance=True financial data is looked up in the background after loading.
+    """
+    client = HttpClient(pool_size=(workers if finance else 0) + prefetch * shard_workers + 2, max_retries=max_retries, cache=cache,
+                        rate_limiter=rate_limiter)
+    finance_loader = None
+    service = None
+    server = None
+    stop_event = threading.Event()
+    try:
+        service = CompanyService(industry_codes, client, source, dump_file, snapshot_files,
+                                 prefetch=prefetch, page_delay=page_delay, shard_workers=shard_workers)
+        if finance:
+            fetcher = FinanceFetcher(workers=workers, rate=finance_rate, burst=finance_burst, client=client)
+            finance_loader = service.finance_loader = FinanceLoader(service.index, fetcher)
+        try:
+            service.load()
+        except (requests.exceptions.RequestException, IOError) as e:
+            echo(f"\nKunne ikke laste inn selskaper: {e}")
+            return
+        try:
+            server = QueryServer((host, port), service)
+        except OSError as e:
+            echo(f"\nKunne ikke starte spørre-API-et på {host}:{port}: {e}")
+            return
+
+        def refresh_loop():
+            while not stop_event.wait(refresh_interval * 60):
+                try:
+                    stats = service.refresh()
+                    echo(f"[{utc_timestamp()}] Oppdatert: {stats['updates']} endringer, "
+                          f"{stats['upserted']} oppdatert, {stats['deleted']} fjernet.", flush=True)
+                except Exception as e:
+                    echo(f"[{utc_timestamp()}] Oppdatering feilet: {e}", flush=True)
+
+        if refresh_interval > 0:
+            threading.Thread(target=refresh_loop, daemon=True).start()
+        address = f"http://{server.server_address[0]}:{server.server_address[1]}"
+        echo(f"Spørre-API klart på {address} (Ctrl+C for å stoppe). Eksempel:")
+        echo(f"  curl '{address}/query?industry={industry_codes[0]}&filter=state%20%3D%3D%20%22OSLO%22&limit=10'")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            echo("\nStopper spørre-API-et.")
+    finally:
+        stop_event.set()
+        if server is not None:
+            server.server_close()
+        if finance_loader is not None:
+            finance_loader.close()
+        http_stats = client.stats()
+        get_metrics().record("http", http_stats)
+        echo(format_http_stats(http_stats))
+        client.close()
@@ -0,0 +1,703 @@
+"""
+Output: CSV, Parquet/Arrow and SQLite/DuckDB sinks, finance history and --diff.
+"""
+
+import csv
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+from .common import (
+    DEFAULT_ROW_GROUP_SIZE, DEFAULT_STORE_BATCH_SIZE, DIFF_COLUMNS, DIFF_COMMIT_ROWS, FIELD_MAP, FIELD_TYPES, FIN_FIELD_CSV_MAP,
+    FIN_FIELD_TYPES, HISTORY_GROWTH_FIELDS, INDUSTRY_CODES_KEY, INDUSTRY_COLUMN, NUMERIC_FINANCE_FIELDS,
+    STORE_COMPANY_COLUMNS, STORE_FINANCE_COLUMNS, STORE_FORMATS, STORE_INDEXED_FINANCE_FIELDS, STORE_SQL_TYPES, echo,
+    json_loads, utc_timestamp,
+)
+from .finance import add_growth, calculate_financial_ratios
+from .metrics import get_metrics
+from .records import to_column_value
+
+
+def format_finance_value(value):
+    """
+    Format a financial value for CSV: remove .0 for ints, add space as thousands separator.
+    Floats (such as ratios) are rounded to 2 decimals first. Non-numeric values are returned unchanged.
+    """
+    if isinstance(value, float):
+        num = round(value, 2)
+    elif isinstance(value, int):
+        num = value
+    elif isinstance(value, str):
+        try:
+            num = float(value)
+        except ValueError:
+            return value
+    else:
+        return value
+    if num == int(num):
+        return f"{int(num):,}".replace(",", " ")
+    return f"{num:,.2f}".replace(",", " ")
+
+
+class CsvSink:
+    """
+    Streaming CSV output (headers in English). The header is written when the sink is
+    opened and rows are appended as they arrive, so memory use does not grow with the
+    number of companies. At most `buffer_size` rows are held before they are written,
+    and the file is flushed at least every `flush_interval` seconds.
+
+    With resume_at (a byte offset from position()) an existing file is truncated there
+    and appended to instead, without writing the header again.
+    """
+
+    def __init__(self, output_file, selected_fields, field_map, extra_fields=None, buffer_size=500, flush_interval=5.0,
+                 industry_column=False, resume_at=None):
+        self.output_file = output_file
+        # (row key, is financial field) per column; financial values are formatted on write
+        self.columns = [(INDUSTRY_COLUMN, False)] if industry_column else []
+        self.columns += [(field_map[f], False) for f in selected_fields]
+        self.columns += [(f, True) for f in (extra_fields or [])]
+        self.buffer_size = max(1, buffer_size)
+        self.flush_interval = flush_interval
+        self.buffer = []
+        self.rows_written = 0
+        self.last_flush = time.monotonic()
+        if resume_at is not None:
+            # Drop anything written after the checkpoint and continue from there
+            self.file = open(output_file, 'r+', newline='', encoding='utf-8')
+            self.file.truncate(resume_at)
+            self.file.seek(resume_at)
+            self.writer = csv.writer(self.file)
+            return
+        # "-" writes to standard output (used by `query`)
+        self.file = sys.stdout if output_file == "-" else open(output_file, 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file)
+        fieldnames = [INDUSTRY_COLUMN] if industry_column else []
+        fieldnames += [field_map[f] for f in selected_fields]
+        # Use human-readable names for financial fields
+        fieldnames += [FIN_FIELD_CSV_MAP.get(f, f) for f in (extra_fields or [])]
+        self.writer.writerow(fieldnames)
+
+    def write(self, data):
+        """Append one row (dict keyed by CSV header for base fields and fin_ keys for financial fields)."""
+        self.buffer.append([
+            format_finance_value(data.get(key, "")) if is_fin else data.get(key, "")
+            for key, is_fin in self.columns
+        ])
+        self.rows_written += 1
+        if len(self.buffer) >= self.buffer_size or time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.writer.writerows(self.buffer)
+            self.buffer.clear()
+        self.file.flush()
+        self.last_flush = time.monotonic()
+
+    def position(self):
+        """Flush and return the current end of the file (a resume_at offset)."""
+        self.flush()
+        return self.file.tell()
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            if self.file is not sys.stdout:
+                self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def import_pyarrow():
+    """Import pyarrow on demand; it is only needed for --format parquet/arrow."""
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("pyarrow er ikke installert. Installer med: pip install pyarrow") from None
+    return pyarrow
+
+
+class ColumnarSink:
+    """
+    Typed columnar output for --format parquet and arrow, with the same interface as
+    CsvSink. Values keep their native types (FIELD_TYPES / FIN_FIELD_TYPES) instead of
+    formatted strings, and rows are buffered per column and written as one Parquet row
+    group or Arrow record batch every `row_group_size` rows. Dictionary columns share
+    one growing dictionary across batches, which Arrow IPC files require.
+    """
+
+    def __init__(self, output_file, selected_fields, field_map, extra_fields=None, row_group_size=DEFAULT_ROW_GROUP_SIZE,
+                 industry_column=False, output_format="parquet", field_types=None):
+        pa = import_pyarrow()
+        self.pa = pa
+        self.output_file = output_file
+        # (row key, column name, type) per column
+        self.columns = [(INDUSTRY_COLUMN, INDUSTRY_COLUMN, "dictionary")] if industry_column else []
+        field_types = FIELD_TYPES if field_types is None else field_types
+        self.columns += [(field_map[f], field_map[f], field_types.get(f, "string")) for f in selected_fields]
+        self.columns += [(f, FIN_FIELD_CSV_MAP.get(f, f), FIN_FIELD_TYPES.get(f, "string")) for f in (extra_fields or [])]
+        arrow_types = {
+            "string": pa.string(),
+            "int64": pa.int64(),
+            "float64": pa.float64(),
+            "bool": pa.bool_(),
+            "date": pa.date32(),
+            "dictionary": pa.dictionary(pa.int32(), pa.string()),
+        }
+        self.schema = pa.schema([pa.field(name, arrow_types[kind]) for _, name, kind in self.columns])
+        self.buffers = [[] for _ in self.columns]
+        self.dictionaries = {i: {} for i, (_, _, kind) in enumerate(self.columns) if kind == "dictionary"}
+        self.row_group_size = max(1, row_group_size)
+        self.rows_written = 0
+        self.closed = False
+        if output_format == "parquet":
+            dictionary_columns = [name for _, name, kind in self.columns if kind == "dictionary"]
+            self.writer = pa.parquet.ParquetWriter(output_file, self.schema, compression="zstd",
+                                                   use_dictionary=dictionary_columns)
+        else:
+            options = pa.ipc.IpcWriteOptions(compression="zstd", emit_dictionary_deltas=True)
+            self.writer = pa.ipc.new_file(output_file, self.schema, options=options)
+
+    def write(self, data):
+        """Append one row (dict keyed like CsvSink rows)."""
+        for buffer, (key, _, kind) in zip(self.buffers, self.columns):
+            buffer.append(to_column_value(data.get(key, ""), kind))
+        self.rows_written += 1
+        if len(self.buffers[0]) >= self.row_group_size:
+            self.flush()
+
+    def _array(self, index, values, kind):
+        pa = self.pa
+        if kind != "dictionary":
+            return pa.array(values, type=self.schema.field(index).type)
+        # Codes index into a dictionary that only ever grows, so later batches are deltas
+        dictionary = self.dictionaries[index]
+        codes = [None if v is None else dictionary.setdefault(v, len(dictionary)) for v in values]
+        return pa.DictionaryArray.from_arrays(pa.array(codes, type=pa.int32()), pa.array(list(dictionary), type=pa.string()))
+
+    def flush(self):
+        if not self.columns or not self.buffers[0]:
+            return
+        arrays = [self._array(i, values, kind) for i, (values, (_, _, kind)) in enumerate(zip(self.buffers, self.columns))]
+        self.writer.write_batch(self.pa.RecordBatch.from_arrays(arrays, schema=self.schema))
+        for buffer in self.buffers:
+            buffer.clear()
+
+    def close(self):
+        if not self.closed:
+            self.flush()
+            self.writer.close()
+            self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def import_duckdb():
+    """Import duckdb on demand; it is only needed for --format duckdb."""
+    try:
+        import duckdb
+    except ImportError:
+        raise ImportError("duckdb er ikke installert. Installer med: pip install duckdb") from None
+    return duckdb
+
+
+class CompanyStore:
+    """
+    A local SQLite or DuckDB database of companies (--format sqlite/duckdb, and `query`):
+
+    - companies: one row per orgnr with every company field, the primary næringskode,
+      whether financial data has been looked up, and the year of the latest accounts
+    - company_industries: (code, orgnr) for næringskode 1-3, for prefix searches
+    - financials: one row per (orgnr, year) with every fin_ field
+
+    Rows are upserted by key in batched transactions, so repeated runs update the store
+    instead of duplicating it. Indexes cover næringskode, kommune, postnummer, employees
+    and STORE_INDEXED_FINANCE_FIELDS. Text fields are stored as "" rather than NULL so that
+    comparisons in SQL behave as they do in --filter.
+    """
+
+    def __init__(self, path, engine="sqlite"):
+        self.path = path
+        self.engine = engine
+        if engine == "duckdb":
+            self.db = import_duckdb().connect(path)
+        else:
+            self.db = sqlite3.connect(path, isolation_level=None)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+        company_columns = ", ".join(f"{name} {STORE_SQL_TYPES[kind]}" for name, kind in STORE_COMPANY_COLUMNS[1:])
+        finance_columns = ", ".join(f"{name} {STORE_SQL_TYPES[kind]}" for name, kind in STORE_FINANCE_COLUMNS)
+        for statement in (
+            f"CREATE TABLE IF NOT EXISTS companies (orgnr TEXT PRIMARY KEY, {company_columns})",
+            "CREATE TABLE IF NOT EXISTS company_industries (code TEXT, orgnr TEXT)",
+            f"CREATE TABLE IF NOT EXISTS financials (orgnr TEXT, year BIGINT, {finance_columns}, PRIMARY KEY (orgnr, year))",
+            "CREATE INDEX IF NOT EXISTS idx_companies_industry ON companies (industry_code)",
+            "CREATE INDEX IF NOT EXISTS idx_companies_state ON companies (state)",
+            "CREATE INDEX IF NOT EXISTS idx_companies_zipcode ON companies (zipcode)",
+            "CREATE INDEX IF NOT EXISTS idx_companies_employees ON companies (employees)",
+            "CREATE INDEX IF NOT EXISTS idx_company_industries_code ON company_industries (code)",
+            "CREATE INDEX IF NOT EXISTS idx_company_industries_orgnr ON company_industries (orgnr)",
+        ) + tuple(f"CREATE INDEX IF NOT EXISTS idx_financials_{name} ON financials ({name})" for name in STORE_INDEXED_FINANCE_FIELDS):
+            self.db.execute(statement)
+        # INSERT statements as (table, [(column, SQL type)], conflict clause)
+        columns = [(name, STORE_SQL_TYPES[kind]) for name, kind in STORE_COMPANY_COLUMNS]
+        updates = [f"{name} = excluded.{name}" for name, _ in columns[1:] if name not in ("finance_fetched", "fin_year")]
+        # A run without --fin keeps what earlier runs found
+        updates += ["finance_fetched = finance_fetched OR excluded.finance_fetched",
+                    "fin_year = COALESCE(excluded.fin_year, fin_year)"]
+        self.upsert_companies = ("companies", columns, f"ON CONFLICT (orgnr) DO UPDATE SET {', '.join(updates)}")
+        columns = [("orgnr", "TEXT"), ("year", "BIGINT")] + [(name, STORE_SQL_TYPES[kind]) for name, kind in STORE_FINANCE_COLUMNS]
+        self.upsert_financials = ("financials", columns,
+                                  f"ON CONFLICT (orgnr, year) DO UPDATE SET {', '.join(f'{n} = excluded.{n}' for n, _ in columns[2:])}")
+        self.insert_industries = ("company_industries", [("code", "TEXT"), ("orgnr", "TEXT")], "")
+
+    def _staged(self, columns, rows):
+        """
+        Write rows to a temporary newline-delimited JSON file for DuckDB's read_json.
+        Binding Python values as statement parameters is slow in DuckDB (executemany runs
+        one row at a time), while reading a batch from a file is close to free.
+        Returns (table expression, path); the expression takes the path as its only
+        statement parameter and the caller removes the file.
+        """
+        fd, path = tempfile.mkstemp(prefix="brreg_store_", suffix=".json")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(dict(zip((name for name, _ in columns), row)), ensure_ascii=False))
+                f.write("\n")
+        types = ", ".join(f"'{name}': '{'VARCHAR' if kind == 'TEXT' else kind}'" for name, kind in columns)
+        return f"read_json(?, format='newline_delimited', columns={{{types}}})", path
+
+    def _insert(self, statement, rows):
+        table, columns, conflict = statement
+        names = ", ".join(name for name, _ in columns)
+        if self.engine != "duckdb":
+            self.db.executemany(f"INSERT INTO {table} ({names}) VALUES ({', '.join('?' * len(columns))}) {conflict}", rows)
+            return
+        source, path = self._staged(columns, rows)
+        try:
+            self.db.execute(f"INSERT INTO {table} ({names}) SELECT * FROM {source} {conflict}", [path])
+        finally:
+            os.remove(path)
+
+    def _delete_industries(self, orgnrs):
+        if self.engine != "duckdb":
+            self.db.executemany("DELETE FROM company_industries WHERE orgnr = ?", [(orgnr,) for orgnr in orgnrs])
+            return
+        source, path = self._staged([("orgnr", "TEXT")], [(orgnr,) for orgnr in orgnrs])
+        try:
+            self.db.execute(f"DELETE FROM company_industries WHERE orgnr IN (SELECT orgnr FROM {source})", [path])
+        finally:
+            os.remove(path)
+
+    def write(self, companies=(), industries=(), financials=()):
+        """
+        Upsert one batch in a single transaction: company rows (tuples in STORE_COMPANY_COLUMNS
+        order), {orgnr: [codes]} for company_industries and financials rows (orgnr, year, fin_ values).
+        Keys must be unique within a batch.
+        """
+        self.db.execute("BEGIN TRANSACTION")
+        try:
+            if companies:
+                self._insert(self.upsert_companies, companies)
+            if industries:
+                self._delete_industries(industries)
+                rows = [(code, orgnr) for orgnr, codes in industries.items() for code in codes]
+                if rows:
+                    self._insert(self.insert_industries, rows)
+            if financials:
+                self._insert(self.upsert_financials, financials)
+            self.db.execute("COMMIT")
+        except Exception:
+            self.db.execute("ROLLBACK")
+            raise
+
+    def execute(self, sql, params=()):
+        """Run a query and return a cursor (sqlite3) or the connection (duckdb) to fetch from."""
+        return self.db.execute(sql, params)
+
+    def close(self):
+        self.db.close()
+
+
+def store_value(value, kind):
+    """Value for a store column of the given FIELD_TYPES kind: text as-is ("" kept), other empty values as NULL."""
+    if kind in ("string", "dictionary", "date"):
+        return "" if value is None else str(value)
+    return to_column_value(value, kind)
+
+
+def store_financials_row(orgnr, fin_data):
+    """financials row (orgnr, year, fin_ values) for one accounting period, or None without a year."""
+    year = to_column_value(fin_data.get("fin_year"), "int64")
+    if year is None:
+        return None
+    return (orgnr, year) + tuple(store_value(fin_data.get(name), kind) for name, kind in STORE_FINANCE_COLUMNS)
+
+
+class StoreSink:
+    """
+    Output to a CompanyStore (--format sqlite/duckdb) with the same interface as CsvSink.
+    Every company field is stored whatever --fields says, so the pipeline is opened with
+    all fields; rows also carry INDUSTRY_CODES_KEY (see CompanyPipeline). With financial
+    columns the latest accounts go to the financials table. Rows are buffered and written
+    `batch_size` at a time, each batch in one transaction.
+    """
+
+    stores_industry_codes = True
+
+    def __init__(self, output_file, selected_fields, field_map, extra_fields=None, output_format="sqlite",
+                 batch_size=DEFAULT_STORE_BATCH_SIZE):
+        self.output_file = output_file
+        self.store = CompanyStore(output_file, output_format)
+        self.headers = [(name, field_map[name] if name in field_map else None, kind) for name, kind in STORE_COMPANY_COLUMNS]
+        self.finance = bool(extra_fields)
+        self.batch_size = max(1, batch_size)
+        self.buffer = []
+        self.rows_written = 0
+        self.closed = False
+
+    def write(self, data):
+        """Add one row (dict keyed like CsvSink rows)."""
+        self.buffer.append(data)
+        self.rows_written += 1
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        updated_at = utc_timestamp()
+        # Keyed by orgnr: a company found under several industry codes is stored once
+        companies, industries, financials = {}, {}, {}
+        for data in self.buffer:
+            orgnr = data.get(FIELD_MAP["orgnr"], "")
+            codes = data.get(INDUSTRY_CODES_KEY) or []
+            values = {
+                "industry_code": codes[0] if codes else "",
+                "finance_fetched": self.finance,
+                "fin_year": data.get("fin_year") if self.finance else None,
+                "updated_at": updated_at,
+            }
+            companies[orgnr] = tuple(
+                store_value(data.get(header, "") if header else values[name], kind) for name, header, kind in self.headers
+            )
+            industries[orgnr] = codes
+            if self.finance:
+                row = store_financials_row(orgnr, data)
+                if row is not None:
+                    financials[row[:2]] = row
+        self.store.write(list(companies.values()), industries, list(financials.values()))
+        self.buffer.clear()
+
+    def close(self):
+        if not self.closed:
+            self.flush()
+            self.store.close()
+            self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_sink(output_file, selected_fields, field_map, extra_fields=None, industry_column=False, output_format="csv",
+              resume_at=None, field_types=None):
+    """
+    Open a CsvSink, a ColumnarSink for output_format "parquet"/"arrow" or a StoreSink for
+    "sqlite"/"duckdb" (neither can resume). field_types overrides FIELD_TYPES for the
+    columns of a columnar sink.
+    """
+    if output_format in STORE_FORMATS:
+        return StoreSink(output_file, selected_fields, field_map, extra_fields=extra_fields, output_format=output_format)
+    if output_format == "csv":
+        return CsvSink(output_file, selected_fields, field_map, extra_fields=extra_fields, industry_column=industry_column,
+                       resume_at=resume_at)
+    return ColumnarSink(output_file, selected_fields, field_map, extra_fields=extra_fields, industry_column=industry_column,
+                        output_format=output_format, field_types=field_types)
+
+
+class FinanceHistoryWriter:
+    """
+    Writes every accounting period of the companies in the output (--finance-history) to a
+    separate file, either "long" (OrgNo, Year, Field, Value for the numeric fields, skipping
+    empty values) or "wide" (one row per company and period). Ratios and year-over-year
+    growth (HISTORY_GROWTH_FIELDS) are computed for each period. Each orgnr is written once,
+    also when it is found under several industry codes.
+    """
+
+    def __init__(self, output_file, layout="long", selected_finance_fields=None, output_format="csv"):
+        if selected_finance_fields is not None:
+            fields = [f"fin_{f}" for f in selected_finance_fields]
+        else:
+            fields = list(FIN_FIELD_CSV_MAP)
+        fields += list(HISTORY_GROWTH_FIELDS)
+        self.layout = layout
+        self.field_map = {"orgnr": "OrgNo", "year": "Year"}
+        if layout == "long":
+            self.value_fields = [f for f in fields if f in HISTORY_GROWTH_FIELDS or f[len("fin_"):] in NUMERIC_FINANCE_FIELDS]
+            self.field_map.update(field="Field", value="Value")
+            field_types = {"year": "int64", "field": "dictionary", "value": "float64"}
+        else:
+            self.value_fields = [f for f in fields if f != "fin_year"]
+            for f in self.value_fields:
+                self.field_map[f] = FIN_FIELD_CSV_MAP[f] if f in FIN_FIELD_CSV_MAP else HISTORY_GROWTH_FIELDS[f][1]
+            field_types = dict(FIN_FIELD_TYPES, year="int64", **{f: "float64" for f in HISTORY_GROWTH_FIELDS})
+        self.sink = open_sink(output_file, list(self.field_map), self.field_map, output_format=output_format,
+                              field_types=field_types)
+        self.output_file = output_file
+        self.written = set()
+        self.periods = 0
+
+    def write(self, orgnr, periods):
+        if not periods or orgnr in self.written:
+            return
+        self.written.add(orgnr)
+        for period in add_growth([calculate_financial_ratios(period) for period in periods]):
+            year = period.get("fin_year", "")
+            if self.layout == "long":
+                for f in self.value_fields:
+                    value = period.get(f, "")
+                    if value == "" or value is None or isinstance(value, bool):
+                        continue
+                    self.sink.write({"OrgNo": orgnr, "Year": year, "Field": f[len("fin_"):], "Value": value})
+            else:
+                row = {self.field_map[f]: period.get(f, "") for f in self.value_fields}
+                row.update(OrgNo=orgnr, Year=year)
+                self.sink.write(row)
+            self.periods += 1
+
+    def close(self):
+        self.sink.close()
+
+    def summary(self):
+        return f"Regnskapshistorikk for {len(self.written)} selskaper ({self.periods} perioder) lagret til {self.output_file}"
+
+
+class StoreHistoryWriter:
+    """
+    --finance-history for --format sqlite/duckdb: every accounting period goes to the
+    store's financials table (one row per orgnr and year) instead of a separate file.
+    Same interface as FinanceHistoryWriter.
+    """
+
+    def __init__(self, output_file, output_format="sqlite", batch_size=DEFAULT_STORE_BATCH_SIZE):
+        self.output_file = output_file
+        self.store = CompanyStore(output_file, output_format)
+        self.batch_size = max(1, batch_size)
+        self.buffer = []
+        self.written = set()
+        self.periods = 0
+
+    def write(self, orgnr, periods):
+        if not periods or orgnr in self.written:
+            return
+        self.written.add(orgnr)
+        for period in periods:
+            row = store_financials_row(orgnr, calculate_financial_ratios(dict(period)))
+            if row is not None:
+                self.buffer.append(row)
+                self.periods += 1
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.store.write(financials=list({row[:2]: row for row in self.buffer}.values()))
+            self.buffer = []
+
+    def close(self):
+        self.flush()
+        self.store.close()
+
+    def summary(self):
+        return f"Regnskapshistorikk for {len(self.written)} selskaper ({self.periods} perioder) lagret i {self.output_file}"
+
+
+def open_history(finance_history, history_output, selected_finance_fields, output_format="csv"):
+    """
+    FinanceHistoryWriter for --finance-history ("long"/"wide"), a StoreHistoryWriter for the
+    store formats, or None if it is off.
+    """
+    if not finance_history:
+        return None
+    if output_format in STORE_FORMATS:
+        return StoreHistoryWriter(history_output, output_format)
+    return FinanceHistoryWriter(history_output, finance_history, selected_finance_fields, output_format)
+
+
+class ChangeTracker:
+    """
+    --diff: compares the rows of this run with those of the previous run. The state file
+    (SQLite) keeps one entry per industry code and orgnr with a fingerprint of the row
+    (BLAKE2b of its JSON), the row itself and the accounts it was built from. Each row is
+    checked as it is written, so memory use does not grow with the result set. Changes are
+    streamed to a CSV file (DIFF_COLUMNS, plus Industry with several codes): one line per new
+    or removed company and one per changed field. The rows of this run go to a separate
+    table (pending) that is committed every DIFF_COMMIT_ROWS rows, so a run that stops early
+    keeps the accounts it fetched for the next one. finish() reports the companies that were
+    not seen again as removed and makes this run the baseline for the next one; an
+    incomplete run leaves the previous baseline as it was.
+    """
+
+    def __init__(self, state_file, output_file, industry_column=False):
+        self.state_file = state_file
+        self.output_file = output_file
+        self.conn = sqlite3.connect(state_file)
+        try:
+            # rows: the baseline from the last complete run; pending: rows of this run and of
+            # runs that did not complete, kept for their accounts
+            for table in ("rows", "pending"):
+                self.conn.execute(
+                    f"CREATE TABLE IF NOT EXISTS {table} (industry TEXT NOT NULL, orgnr TEXT NOT NULL, name TEXT, "
+                    "fingerprint BLOB NOT NULL, data TEXT NOT NULL, accounts_year TEXT, finance TEXT, run INTEGER NOT NULL, "
+                    "PRIMARY KEY (industry, orgnr))"
+                )
+            self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            row = self.conn.execute("SELECT value FROM meta WHERE key = 'run'").fetchone()
+            self.run = int(row[0]) + 1 if row else 1
+            self.first = self.conn.execute("SELECT 1 FROM rows LIMIT 1").fetchone() is None
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('run', ?)", (str(self.run),))
+            self.conn.commit()
+            self.sink = CsvSink(output_file, list(DIFF_COLUMNS), {c: c for c in DIFF_COLUMNS}, industry_column=industry_column)
+        except (sqlite3.Error, OSError):
+            self.conn.close()
+            raise
+        self.added = self.removed = self.changed = self.unchanged = 0
+        self.finance_kept = 0
+        self.uncommitted = 0
+        self.complete = None
+
+    def previous_finance(self, label, company_dict):
+        """
+        (True, fin_data) with the accounts stored for this company if its latest submitted
+        accounts (last_accounts_year) are the same as when they were fetched, else (False, None).
+        """
+        year = company_dict.get("last_accounts_year")
+        if not year:
+            return False, None
+        key = (label, company_dict.get("orgnr", ""))
+        # An interrupted run may have fetched newer accounts than the baseline has
+        row = (self.conn.execute("SELECT accounts_year, finance FROM pending WHERE industry = ? AND orgnr = ? AND finance IS NOT NULL",
+                                 key).fetchone()
+               or self.conn.execute("SELECT accounts_year, finance FROM rows WHERE industry = ? AND orgnr = ?", key).fetchone())
+        if row is None or row[1] is None or row[0] != year:
+            return False, None
+        self.finance_kept += 1
+        return True, json_loads(row[1])
+
+    def observe(self, label, company_data, company_dict, fin_data=None, finance=False):
+        """Compare one written row with the previous run and store it for the next one."""
+        orgnr = company_dict.get("orgnr", "")
+        name = company_dict.get("name", "")
+        row = {k: v for k, v in company_data.items() if k not in (INDUSTRY_COLUMN, INDUSTRY_CODES_KEY)}
+        data = json.dumps(row, sort_keys=True, ensure_ascii=False, default=str)
+        fingerprint = hashlib.blake2b(data.encode("utf-8"), digest_size=16).digest()
+        previous = self.conn.execute("SELECT fingerprint, data FROM rows WHERE industry = ? AND orgnr = ?",
+                                     (label, orgnr)).fetchone()
+        if previous is None:
+            self.added += 1
+            self._emit("added", label, orgnr, name)
+        elif previous[0] != fingerprint:
+            self.changed += 1
+            old, new = json_loads(previous[1]), json_loads(data)
+            for key in list(row) + [k for k in old if k not in row]:
+                if old.get(key, "") != new.get(key, ""):
+                    self._emit("changed", label, orgnr, name, FIN_FIELD_CSV_MAP.get(key, key),
+                               self._value(key, old.get(key, "")), self._value(key, new.get(key, "")))
+        else:
+            self.unchanged += 1
+        self.conn.execute(
+            "INSERT OR REPLACE INTO pending VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (label, orgnr, name, fingerprint, data, company_dict.get("last_accounts_year", ""),
+             json.dumps(fin_data, default=str) if finance else None, self.run),
+        )
+        self.uncommitted += 1
+        if self.uncommitted >= DIFF_COMMIT_ROWS:
+            self.conn.commit()
+            self.uncommitted = 0
+
+    @staticmethod
+    def _value(key, value):
+        # Financial values are written as in the output file
+        return format_finance_value(value) if key.startswith("fin_") and value is not None else value
+
+    def _emit(self, change, label, orgnr, name, field="", old="", new=""):
+        self.sink.write({"Change": change, INDUSTRY_COLUMN: label, "OrgNo": orgnr, "Name": name,
+                         "Field": field, "Old": old, "New": new})
+
+    def finish(self, complete=True):
+        """
+        Report the companies of the previous run that were not seen as removed and save this
+        run as the new baseline. If the run did not complete, the previous baseline is kept.
+        """
+        self.complete = complete
+        if not complete:
+            self.conn.commit()
+            self.sink.close()
+            return
+        for label, orgnr, name in self.conn.execute(
+                "SELECT industry, orgnr, name FROM rows WHERE NOT EXISTS (SELECT 1 FROM pending p WHERE p.industry = rows.industry "
+                "AND p.orgnr = rows.orgnr AND p.run = ?) ORDER BY industry, orgnr", (self.run,)).fetchall():
+            self.removed += 1
+            self._emit("removed", label, orgnr, name)
+        self.conn.execute("DELETE FROM rows")
+        self.conn.execute("INSERT INTO rows SELECT * FROM pending WHERE run = ?", (self.run,))
+        self.conn.execute("DELETE FROM pending")
+        self.conn.commit()
+        self.sink.close()
+        get_metrics().record("diff", self.stats())
+
+    def stats(self):
+        return {"added": self.added, "removed": self.removed, "changed": self.changed, "unchanged": self.unchanged,
+                "finance_kept": self.finance_kept}
+
+    def summary(self):
+        if not self.complete:
+            text = (f"Kjøringen ble ikke fullført: {self.output_file} er ufullstendig, "
+                    f"og forrige kjøring er fortsatt utgangspunktet for --diff")
+        elif self.first:
+            text = f"Første kjøring med --diff: {self.added} selskaper lagret som utgangspunkt i {self.state_file}"
+        else:
+            text = (f"Endringer siden forrige kjøring: {self.added} nye, {self.removed} fjernet, {self.changed} endret, "
+                    f"{self.unchanged} uendret -> {self.output_file}")
+        if self.finance_kept:
+            text += f"\nRegnskap fra forrige kjøring gjenbrukt for {self.finance_kept} selskaper uten nytt årsregnskap"
+        return text
+
+    def close(self):
+        self.sink.close()
+        self.conn.close()
+
+
+def save_to_csv(companies_data, output_file, selected_fields, field_map, extra_fields=None):
+    """
+    Save company data to CSV file (headers in English). If extra_fields is provided, include them as additional columns.
+    """
+    if not companies_data:
+        echo("\nIngen selskaper å lagre.")
+        return False
+    try:
+        with CsvSink(output_file, selected_fields, field_map, extra_fields) as sink:
+            for data in companies_data:
+                sink.write(data)
+        return True
+    except IOError as e:
+        echo(f"\nFeil ved lagring av fil: {e}")
+        return False
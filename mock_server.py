@@ -0,0 +1,685 @@
+#!/usr/bin/env python3
+"""
+Lokal testserver for Brønnøysundregisteret
+
+Etterligner søket i Enhetsregisteret (enheter) og Regnskapsregisteret (regnskap/{orgnr})
+med syntetiske selskaper, slik at main.py kan kjøres og måles uten å bruke data.brreg.no.
+Svartid, serverfeil og 429-svar kan styres fra kommandolinjen. Endringer (Ny, Endring,
+Sletting) kan legges inn mens serveren kjører med /_update?orgnr=...&type=..., og vises
+da i oppdateringsstrømmen (oppdateringer/enheter).
+
+    python3 mock_server.py --companies 100k --latency 0.05
+    BRREG_BASE_URL=http://127.0.0.1:8765 python3 main.py --industry 62 --fin
+"""
+
+import argparse
+import bisect
+import gzip
+import json
+import random
+import re
+import sys
+import threading
+import time
+from array import array
+from collections import Counter, OrderedDict
+from datetime import date, datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+
+# Constants
+DEFAULT_PORT = 8765
+DEFAULT_COMPANIES = 1000
+DEFAULT_SEED = 1
+DEFAULT_LATENCY = 0.05  # Gjennomsnittlig svartid i sekunder
+DEFAULT_JITTER = 0.5  # Svartiden varierer med ±50 %
+DEFAULT_RETRY_AFTER = 1  # Sekunder i Retry-After på 429-svar
+API_RESULT_WINDOW = 10000  # Som i API-et: man kan ikke bla forbi så mange treff
+MAX_PAGE_SIZE = 1000
+QUERY_CACHE_SIZE = 64  # Antall søk (uten side) som holdes ferdig beregnet
+ORGNR_BASE = 810000000  # Syntetiske organisasjonsnumre er ORGNR_BASE + løpenummer
+SCALES = {"1k": 1_000, "10k": 10_000, "100k": 100_000, "1m": 1_000_000}  # Navngitte størrelser
+
+ENHETER_PATH = "/enhetsregisteret/api/enheter"
+REGNSKAP_PATH = "/regnskapsregisteret/regnskap/"
+UPDATES_PATH = "/enhetsregisteret/api/oppdateringer/enheter"
+STATS_PATH = "/_stats"
+UPDATE_PATH = "/_update"
+UPDATE_TYPES = ("Ny", "Endring", "Sletting")
+
+# Industry codes the companies are spread over (code, description)
+INDUSTRY_CODES = [
+    ("62.010", "Programmeringstjenester"),
+    ("62.020", "Konsulentvirksomhet tilknyttet informasjonsteknologi"),
+    ("62.030", "Forvaltning og drift av IT-systemer"),
+    ("62.090", "Andre tjenester tilknyttet informasjonsteknologi"),
+    ("73.110", "Reklamebyråer"),
+    ("73.120", "Medieformidlingstjenester"),
+    ("70.220", "Bedriftsrådgivning og annen administrativ rådgivning"),
+    ("69.201", "Regnskap og bokføring"),
+    ("41.200", "Oppføring av bygninger"),
+    ("43.210", "Elektrisk installasjonsarbeid"),
+    ("47.110", "Butikkhandel med bredt vareutvalg med hovedvekt på nærings- og nytelsesmidler"),
+    ("56.101", "Drift av restauranter og kafeer"),
+    ("68.209", "Utleie av egen eller leid fast eiendom ellers"),
+    ("86.211", "Allmenn legetjeneste"),
+    ("49.410", "Godstransport på vei"),
+    ("46.900", "Uspesifisert engroshandel"),
+]
+# (kommune, kommunenummer, first postnummer)
+MUNICIPALITIES = [
+    ("OSLO", "0301", 150), ("BERGEN", "4601", 5003), ("TRONDHEIM", "5001", 7010),
+    ("STAVANGER", "1103", 4005), ("KRISTIANSAND", "4204", 4608), ("TROMSØ", "5501", 9008),
+    ("DRAMMEN", "3005", 3015), ("BÆRUM", "3024", 1337), ("ÅLESUND", "1507", 6002),
+    ("BODØ", "1804", 8006),
+]
+ORGANIZATION_FORMS = ["AS", "AS", "AS", "AS", "ENK", "ENK", "NUF", "DA", "ASA", "SA"]
+
+_MASK = (1 << 64) - 1
+_EPOCH = date(1900, 1, 1).toordinal()
+_RECENT = date(1995, 1, 1).toordinal()
+_TODAY = date(2025, 6, 30).toordinal()  # Fast "i dag", slik at dataene er like fra gang til gang
+
+
+def _mix(*values):
+    """Deterministic 64-bit hash of integers (splitmix64 style)."""
+    h = 0x9E3779B97F4A7C15
+    for v in values:
+        h = ((h ^ v) * 0xBF58476D1CE4E5B9) & _MASK
+        h = ((h ^ (h >> 27)) * 0x94D049BB133111EB) & _MASK
+        h ^= h >> 31
+    return h
+
+
+def _unit(*values):
+    """Deterministic float in [0, 1)."""
+    return _mix(*values) / 2.0 ** 64
+
+
+def parse_scale(value):
+    """Number of companies from a named scale (1k, 100k, 1m) or a plain number."""
+    value = str(value).strip().lower()
+    if value in SCALES:
+        return SCALES[value]
+    match = re.fullmatch(r"(\d+)([km]?)", value)
+    if not match:
+        raise ValueError(f"Ugyldig størrelse: {value}")
+    return int(match.group(1)) * {"": 1, "k": 1_000, "m": 1_000_000}[match.group(2)]
+
+
+class SyntheticRegistry:
+    """
+    A deterministic set of `size` synthetic companies. Only the attributes the search
+    can filter on are kept in arrays; full entity documents and accounts are generated
+    on demand from the company number and the seed.
+
+    For each industry code the companies are indexed by registration date, so a search
+    for a date window is a bisection rather than a scan.
+    """
+
+    def __init__(self, size, seed=DEFAULT_SEED):
+        self.size = size
+        self.seed = seed
+        self.codes = array("B", bytes(size))
+        self.registered = array("i", bytes(4 * size))
+        self.employees = array("i", bytes(4 * size))
+        by_code = [[] for _ in INDUSTRY_CODES]
+        for i in range(size):
+            code = _mix(seed, i, 1) % len(INDUSTRY_CODES)
+            # Most entities are registered after 1995 (when the register was established)
+            if _unit(seed, i, 2) < 0.05:
+                registered = _EPOCH + _mix(seed, i, 3) % (_RECENT - _EPOCH)
+            else:
+                registered = _RECENT + _mix(seed, i, 3) % (_TODAY - _RECENT)
+            u = _unit(seed, i, 4)
+            employees = 0 if u < 0.55 else int(2 ** ((u - 0.55) / 0.45 * 12))
+            self.codes[i] = code
+            self.registered[i] = registered
+            self.employees[i] = employees
+            by_code[code].append((registered, i))
+        self.removed = set()  # Deleted entities, left out of searches
+        self.revisions = {}  # Company number -> times changed (shown in the name)
+        # Per industry code: company numbers and registration dates, sorted by date
+        self.index = []
+        for entries in by_code:
+            entries.sort()
+            self.index.append((array("i", (d for d, _ in entries)), array("i", (i for _, i in entries))))
+
+    def __len__(self):
+        return self.size
+
+    def lookup(self, orgnr):
+        """Company number for an orgnr, or None if it is not in the registry."""
+        try:
+            i = int(orgnr) - ORGNR_BASE
+        except (TypeError, ValueError):
+            return None
+        return i if 0 <= i < self.size else None
+
+    def incorporated(self, i):
+        """Incorporation date ordinal, or None (about 10 % have none)."""
+        if _unit(self.seed, i, 5) < 0.1:
+            return None
+        return max(_EPOCH, self.registered[i] - _mix(self.seed, i, 6) % 1500)
+
+    def remove(self, i):
+        self.removed.add(i)
+
+    def restore(self, i):
+        self.removed.discard(i)
+
+    def revise(self, i):
+        self.revisions[i] = self.revisions.get(i, 0) + 1
+
+    def in_liquidation(self, i):
+        return _unit(self.seed, i, 7) < 0.02
+
+    def zipcode(self, i):
+        municipality = MUNICIPALITIES[_mix(self.seed, i, 8) % len(MUNICIPALITIES)]
+        return municipality, f"{municipality[2] + _mix(self.seed, i, 9) % 40:04d}"
+
+    def search(self, params):
+        """
+        Company numbers matching the search parameters (a dict of single values), in
+        the order the API returns them: by industry code, then registration date.
+        """
+        if params.get("organisasjonsnummer"):
+            found = [self.lookup(o) for o in params["organisasjonsnummer"].split(",")]
+            candidates = [i for i in found if i is not None]
+            prefixes = [c for c in params.get("naeringskode", "").split(",") if c]
+            if prefixes:
+                candidates = [i for i in candidates if INDUSTRY_CODES[self.codes[i]][0].startswith(tuple(prefixes))]
+        else:
+            candidates = self._search_codes(params)
+        return self._refine(candidates, params)
+
+    def _search_codes(self, params):
+        prefixes = tuple(c.strip() for c in params.get("naeringskode", "").split(",") if c.strip())
+        low = date.fromisoformat(params["fraRegistreringsdatoEnhetsregisteret"]).toordinal() \
+            if params.get("fraRegistreringsdatoEnhetsregisteret") else _EPOCH
+        high = date.fromisoformat(params["tilRegistreringsdatoEnhetsregisteret"]).toordinal() \
+            if params.get("tilRegistreringsdatoEnhetsregisteret") else _TODAY
+        result = []
+        for code_index, (code, _) in enumerate(INDUSTRY_CODES):
+            if prefixes and not code.startswith(prefixes):
+                continue
+            dates, ids = self.index[code_index]
+            result.extend(ids[bisect.bisect_left(dates, low):bisect.bisect_right(dates, high)])
+        return result
+
+    def _refine(self, candidates, params):
+        # Remaining filters are applied to the (already narrowed) candidate list
+        checks = []
+        if params.get("fraAntallAnsatte"):
+            low = int(params["fraAntallAnsatte"])
+            checks.append(lambda i: self.employees[i] >= low)
+        if params.get("tilAntallAnsatte"):
+            high = int(params["tilAntallAnsatte"])
+            checks.append(lambda i: self.employees[i] <= high)
+        if params.get("fraStiftelsesdato"):
+            low = date.fromisoformat(params["fraStiftelsesdato"]).toordinal()
+            checks.append(lambda i: (self.incorporated(i) or 0) >= low)
+        if params.get("tilStiftelsesdato"):
+            high = date.fromisoformat(params["tilStiftelsesdato"]).toordinal()
+            checks.append(lambda i: self.incorporated(i) is not None and self.incorporated(i) <= high)
+        if params.get("underAvvikling") in ("true", "false"):
+            wanted = params["underAvvikling"] == "true"
+            checks.append(lambda i: self.in_liquidation(i) == wanted)
+        if params.get("forretningsadresse.postnummer"):
+            zipcode = params["forretningsadresse.postnummer"]
+            checks.append(lambda i: self.zipcode(i)[1] == zipcode)
+        if self.removed:
+            checks.append(lambda i: i not in self.removed)
+        if not checks:
+            return candidates
+        return [i for i in candidates if all(check(i) for check in checks)]
+
+    def entity(self, i):
+        """The entity document for a company, shaped like the Enhetsregisteret API."""
+        seed = self.seed
+        orgnr = str(ORGNR_BASE + i)
+        code, description = INDUSTRY_CODES[self.codes[i]]
+        form = ORGANIZATION_FORMS[_mix(seed, i, 10) % len(ORGANIZATION_FORMS)]
+        (kommune, kommunenummer, _), postnummer = self.zipcode(i)
+        name = f"Syntetisk {i} {form}" + (f" (endret {self.revisions[i]})" if i in self.revisions else "")
+        domain = f"syntetisk{i}.no"
+        entity = {
+            "organisasjonsnummer": orgnr,
+            "navn": name,
+            "organisasjonsform": {"kode": form},
+            "registreringsdatoEnhetsregisteret": date.fromordinal(self.registered[i]).isoformat(),
+            "naeringskode1": {"kode": code, "beskrivelse": description},
+            "antallAnsatte": self.employees[i],
+            "harRegistrertAntallAnsatte": self.employees[i] > 0,
+            "forretningsadresse": {
+                "land": "Norge",
+                "landkode": "NO",
+                "postnummer": postnummer,
+                "poststed": kommune,
+                "adresse": [f"Syntetisk gate {_mix(seed, i, 11) % 200 + 1}"],
+                "kommune": kommune,
+                "kommunenummer": kommunenummer,
+            },
+            "konkurs": False,
+            "underAvvikling": self.in_liquidation(i),
+            "underTvangsavviklingEllerTvangsopplosning": False,
+            "_links": {"self": {"href": f"{ENHETER_PATH}/{orgnr}"}},
+        }
+        if _unit(seed, i, 20) >= 0.25:
+            # Year of the latest accounts, as in the register (see accounts())
+            entity["sisteInnsendteAarsregnskap"] = str(2024 - _mix(seed, i, 22) % 2)
+        incorporated = self.incorporated(i)
+        if incorporated is not None:
+            entity["stiftelsesdato"] = date.fromordinal(incorporated).isoformat()
+        contact = _mix(seed, i, 12)
+        if contact % 3:
+            entity["epostadresse"] = f"post@{domain}"
+        if contact % 5:
+            entity["telefon"] = f"{20000000 + contact % 80000000}"
+        if contact % 7 < 3:
+            entity["mobil"] = f"{40000000 + contact % 10000000}"
+        if contact % 4 == 0:
+            entity["hjemmeside"] = f"www.{domain}"
+        return entity
+
+    def accounts(self, i):
+        """The list of annual accounts for a company (empty for about a quarter of them)."""
+        seed = self.seed
+        if _unit(seed, i, 20) < 0.25:
+            return []
+        years = 1 + _mix(seed, i, 21) % 3
+        last = 2024 - _mix(seed, i, 22) % 2
+        scale = 1 + self.employees[i]
+        result = []
+        for year in range(last - years + 1, last + 1):
+            revenue = int(scale * 900_000 * (0.2 + _unit(seed, i, year, 1) * 1.6))
+            operating = int(revenue * (_unit(seed, i, year, 2) * 0.3 - 0.08))
+            financial_income = int(revenue * _unit(seed, i, year, 3) * 0.01)
+            financial_expenses = int(revenue * _unit(seed, i, year, 4) * 0.02)
+            net = int((operating + financial_income - financial_expenses) * 0.78)
+            fixed = int(revenue * _unit(seed, i, year, 5) * 0.5)
+            current = int(revenue * (0.1 + _unit(seed, i, year, 6) * 0.4))
+            contributed = 30_000 + int(_unit(seed, i, 23) * 500_000)
+            retained = int((fixed + current) * (_unit(seed, i, year, 7) * 0.6 - 0.1))
+            equity = contributed + retained
+            short_term = int((fixed + current - equity) * 0.6)
+            long_term = fixed + current - equity - short_term
+            result.append({
+                "id": _mix(seed, i, year) % 10_000_000,
+                "journalnr": f"{year + 1}{_mix(seed, i, year, 8) % 1_000_000:06d}",
+                "regnskapstype": "SELSKAP",
+                "virksomhet": {"organisasjonsnummer": str(ORGNR_BASE + i), "organisasjonsform": "AS"},
+                "regnskapsperiode": {"fraDato": f"{year}-01-01", "tilDato": f"{year}-12-31"},
+                "valuta": "NOK",
+                "avviklingsregnskap": self.in_liquidation(i) and year == last,
+                "regnkapsprinsipper": {"smaaForetak": self.employees[i] < 50, "regnskapsregler": "regnskapslovenAlminneligRegler"},
+                "revisjon": {"ikkeRevidertAarsregnskap": self.employees[i] < 2, "fravalgRevisjon": self.employees[i] < 2},
+                "eiendeler": {
+                    "sumEiendeler": fixed + current,
+                    "omloepsmidler": {"sumOmloepsmidler": current},
+                    "anleggsmidler": {"sumAnleggsmidler": fixed},
+                },
+                "egenkapitalGjeld": {
+                    "sumEgenkapitalGjeld": fixed + current,
+                    "egenkapital": {
+                        "sumEgenkapital": equity,
+                        "opptjentEgenkapital": {"sumOpptjentEgenkapital": retained},
+                        "innskuttEgenkapital": {"sumInnskuttEgenkaptial": contributed},
+                    },
+                    "gjeldOversikt": {
+                        "sumGjeld": short_term + long_term,
+                        "kortsiktigGjeld": {"sumKortsiktigGjeld": short_term},
+                        "langsiktigGjeld": {"sumLangsiktigGjeld": long_term},
+                    },
+                },
+                "resultatregnskapResultat": {
+                    "ordinaertResultatFoerSkattekostnad": operating + financial_income - financial_expenses,
+                    "aarsresultat": net,
+                    "totalresultat": net,
+                    "finansresultat": {
+                        "nettoFinans": financial_income - financial_expenses,
+                        "finansinntekt": {"sumFinansinntekter": financial_income},
+                        "finanskostnad": {"sumFinanskostnad": financial_expenses},
+                    },
+                    "driftsresultat": {
+                        "driftsresultat": operating,
+                        "driftsinntekter": {"sumDriftsinntekter": revenue},
+                        "driftskostnad": {"sumDriftskostnad": revenue - operating},
+                    },
+                },
+            })
+        return result
+
+
+class ServerStats:
+    """Request counts, status codes and handling times per endpoint. Thread-safe."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.durations = {}
+            self.statuses = {}
+            self.bytes_sent = 0
+
+    def record(self, endpoint, status, elapsed, size):
+        with self.lock:
+            self.durations.setdefault(endpoint, []).append(elapsed)
+            self.statuses.setdefault(endpoint, Counter())[status] += 1
+            self.bytes_sent += size
+
+    def summary(self):
+        """Per endpoint: requests, statuses and p50/p99/max handling time in milliseconds."""
+        with self.lock:
+            result = {"bytes_sent": self.bytes_sent, "endpoints": {}}
+            for endpoint, durations in self.durations.items():
+                ordered = sorted(durations)
+                result["endpoints"][endpoint] = {
+                    "requests": len(ordered),
+                    "statuses": {str(k): v for k, v in sorted(self.statuses[endpoint].items())},
+                    "p50_ms": round(percentile(ordered, 50) * 1000, 2),
+                    "p99_ms": round(percentile(ordered, 99) * 1000, 2),
+                    "max_ms": round(ordered[-1] * 1000, 2),
+                }
+            return result
+
+
+def percentile(ordered, pct):
+    """Nearest-rank percentile of an already sorted list (0 for an empty list)."""
+    if not ordered:
+        return 0
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    """Serves the registry of the owning MockServer (self.server)."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        started = time.monotonic()
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        server = self.server
+        if url.path == STATS_PATH:
+            if "reset" in params:
+                server.stats.reset()
+            return self._send(200, server.stats.summary())
+        if url.path == UPDATE_PATH:
+            try:
+                return self._send(200, server.apply_update(params.get("orgnr"), params.get("type", "Endring")))
+            except ValueError as e:
+                return self._send(400, {"feilmelding": str(e)})
+        if url.path.rstrip("/") == ENHETER_PATH:
+            endpoint = "enheter"
+        elif url.path.startswith(REGNSKAP_PATH):
+            endpoint = "regnskap"
+        elif url.path.rstrip("/") == UPDATES_PATH:
+            endpoint = "oppdateringer"
+        else:
+            return self._finish("other", started, 404, {"feilmelding": "Ukjent adresse"})
+
+        server.sleep()
+        injected = server.inject_failure()
+        if injected == 429:
+            return self._finish(endpoint, started, 429, {"feilmelding": "For mange forespørsler"},
+                                {"Retry-After": str(server.retry_after)})
+        if injected:
+            return self._finish(endpoint, started, injected, {"feilmelding": "Intern feil (injisert)"})
+
+        if endpoint == "enheter":
+            status, body = self._enheter(params)
+        elif endpoint == "regnskap":
+            i = server.registry.lookup(url.path[len(REGNSKAP_PATH):].strip("/"))
+            accounts = server.registry.accounts(i) if i is not None else []
+            status, body = (200, accounts) if accounts else (404, {"feilmelding": "Fant ikke regnskap"})
+        else:
+            status, body = self._updates(params)
+        return self._finish(endpoint, started, status, body)
+
+    def _updates(self, params):
+        # Like the real feed: from an oppdateringsid (inclusive) or a timestamp, oldest first
+        try:
+            size = int(params.get("size", 20))
+            first_id = int(params["oppdateringsid"]) if params.get("oppdateringsid") else None
+        except ValueError:
+            return 400, {"feilmelding": "Ugyldig oppdateringsid eller størrelse"}
+        with self.server.lock:
+            updates = list(self.server.updates)
+        if first_id is not None:
+            updates = [u for u in updates if u["oppdateringsid"] >= first_id]
+        elif params.get("dato"):
+            updates = [u for u in updates if u["dato"] >= params["dato"]]
+        selected = updates[:size]
+        body = {"page": {"size": size, "totalElements": len(updates), "totalPages": (len(updates) + size - 1) // size, "number": 0}}
+        if selected:
+            body["_embedded"] = {"oppdaterteEnheter": selected}
+        return 200, body
+
+    def _enheter(self, params):
+        server = self.server
+        try:
+            size = int(params.pop("size", 20))
+            page = int(params.pop("page", 0))
+        except ValueError:
+            return 400, {"feilmelding": "Ugyldig side eller størrelse"}
+        if size < 1 or size > MAX_PAGE_SIZE or page < 0:
+            return 400, {"feilmelding": f"size må være mellom 1 og {MAX_PAGE_SIZE}"}
+        if (page + 1) * size > server.result_window:
+            return 400, {"feilmelding": f"Kan ikke bla forbi {server.result_window} treff"}
+        try:
+            matches = server.search(params)
+        except ValueError as e:
+            return 400, {"feilmelding": str(e)}
+        total = len(matches)
+        body = {
+            "_links": {"self": {"href": self._url(params, page, size)}},
+            "page": {"size": size, "totalElements": total, "totalPages": (total + size - 1) // size, "number": page},
+        }
+        selected = matches[page * size:(page + 1) * size]
+        if selected:
+            body["_embedded"] = {"enheter": [server.registry.entity(i) for i in selected]}
+        if (page + 1) * size < total:
+            body["_links"]["next"] = {"href": self._url(params, page + 1, size)}
+        return 200, body
+
+    def _url(self, params, page, size):
+        host = self.headers.get("Host") or f"127.0.0.1:{self.server.server_address[1]}"
+        return f"http://{host}{ENHETER_PATH}?" + urlencode(dict(params, page=page, size=size))
+
+    def _finish(self, endpoint, started, status, body, headers=None):
+        size = self._send(status, body, headers)
+        self.server.stats.record(endpoint, status, time.monotonic() - started, size)
+
+    def _send(self, status, body, headers=None):
+        payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        compressed = self.server.gzip and len(payload) > 1024 and "gzip" in self.headers.get("Accept-Encoding", "")
+        if compressed:
+            payload = gzip.compress(payload, compresslevel=1)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json;charset=UTF-8")
+        self.send_header("Content-Length", str(len(payload)))
+        if compressed:
+            self.send_header("Content-Encoding", "gzip")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+        return len(payload)
+
+
+class MockServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server over a SyntheticRegistry.
+
+    latency is the mean handling time in seconds (varied by ±jitter), error_rate and
+    throttle_rate the share of requests answered with 500 and 429 respectively.
+    Searches are cached without page/size, so paging through a result is cheap.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, registry, latency=DEFAULT_LATENCY, jitter=DEFAULT_JITTER, error_rate=0.0,
+                 throttle_rate=0.0, retry_after=DEFAULT_RETRY_AFTER, result_window=API_RESULT_WINDOW,
+                 gzip=True, verbose=False):
+        super().__init__(address, MockHandler)
+        self.registry = registry
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.result_window = result_window
+        self.gzip = gzip
+        self.verbose = verbose
+        self.stats = ServerStats()
+        self.queries = OrderedDict()
+        self.updates = []  # The update feed, oldest first
+        self.lock = threading.Lock()
+
+    def sleep(self):
+        if self.latency > 0:
+            time.sleep(max(0.0, self.latency * (1 + self.jitter * random.uniform(-1, 1))))
+
+    def inject_failure(self):
+        """429 or 500 for the configured share of requests, else None."""
+        roll = random.random()
+        if roll < self.throttle_rate:
+            return 429
+        if roll < self.throttle_rate + self.error_rate:
+            return 500
+        return None
+
+    def apply_update(self, orgnr, change):
+        """
+        Change a company and add it to the update feed: Ny shows a removed company again,
+        Endring changes its name and Sletting removes it. Returns the feed entry.
+        """
+        i = self.registry.lookup(orgnr)
+        if i is None:
+            raise ValueError(f"Ukjent organisasjonsnummer: {orgnr}")
+        if change not in UPDATE_TYPES:
+            raise ValueError(f"Ukjent endringstype: {change} (bruk {', '.join(UPDATE_TYPES)})")
+        with self.lock:
+            if change == "Ny":
+                self.registry.restore(i)
+            elif change == "Endring":
+                self.registry.revise(i)
+            else:
+                self.registry.remove(i)
+            self.queries.clear()
+            update = {
+                "oppdateringsid": len(self.updates) + 1,
+                "dato": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+                "organisasjonsnummer": str(orgnr),
+                "endringstype": change,
+                "_links": {"enhet": {"href": f"{ENHETER_PATH}/{orgnr}"}},
+            }
+            self.updates.append(update)
+        return update
+
+    def search(self, params):
+        key = tuple(sorted(params.items()))
+        with self.lock:
+            if key in self.queries:
+                self.queries.move_to_end(key)
+                return self.queries[key]
+        matches = self.registry.search(params)
+        with self.lock:
+            self.queries[key] = matches
+            while len(self.queries) > QUERY_CACHE_SIZE:
+                self.queries.popitem(last=False)
+        return matches
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Lokal testserver som etterligner Enhetsregisteret og Regnskapsregisteret med syntetiske data."
+    )
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"Port (standard: {DEFAULT_PORT}, 0 = velg ledig port)")
+    parser.add_argument("--host", default="127.0.0.1", help="Adresse serveren lytter på (standard: 127.0.0.1)")
+    parser.add_argument(
+        "--companies", "-n",
+        default=str(DEFAULT_COMPANIES),
+        help=f"Antall syntetiske selskaper, f.eks. 1k, 100k eller 1m (standard: {DEFAULT_COMPANIES})"
+    )
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="Frø for de syntetiske dataene (standard: 1)")
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=DEFAULT_LATENCY,
+        help=f"Gjennomsnittlig svartid i sekunder (standard: {DEFAULT_LATENCY})"
+    )
+    parser.add_argument(
+        "--jitter",
+        type=float,
+        default=DEFAULT_JITTER,
+        help="Hvor mye svartiden varierer, som andel av --latency (standard: 0.5)"
+    )
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Andel forespørsler som får 500-svar (standard: 0)")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Andel forespørsler som får 429-svar (standard: 0)")
+    parser.add_argument(
+        "--retry-after",
+        type=int,
+        default=DEFAULT_RETRY_AFTER,
+        help=f"Sekunder i Retry-After på 429-svar (standard: {DEFAULT_RETRY_AFTER})"
+    )
+    parser.add_argument(
+        "--result-window",
+        type=int,
+        default=API_RESULT_WINDOW,
+        help=f"Hvor mange treff man kan bla gjennom i ett søk (standard: {API_RESULT_WINDOW})"
+    )
+    parser.add_argument("--no-gzip", action="store_true", help="Ikke komprimer svarene")
+    parser.add_argument("--verbose", "-v", action="store_true", help="Skriv ut hver forespørsel")
+    args = parser.parse_args(argv)
+    try:
+        args.companies = parse_scale(args.companies)
+    except ValueError as e:
+        parser.error(str(e))
+    for name in ("error_rate", "throttle_rate"):
+        if not 0 <= getattr(args, name) <= 1:
+            parser.error(f"--{name.replace('_', '-')} må være mellom 0 og 1")
+    if args.error_rate + args.throttle_rate > 1:
+        parser.error("--error-rate og --throttle-rate kan til sammen ikke være over 1")
+    return args
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    started = time.time()
+    registry = SyntheticRegistry(args.companies, args.seed)
+    server = MockServer(
+        (args.host, args.port), registry,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        retry_after=args.retry_after,
+        result_window=args.result_window,
+        gzip=not args.no_gzip,
+        verbose=args.verbose,
+    )
+    host, port = server.server_address[:2]
+    # The benchmark harness reads the address from this line
+    print(f"Testserver klar på http://{host}:{port} med {len(registry)} selskaper "
+          f"(bygget på {time.time() - started:.1f} s)", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopper testserveren.")
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
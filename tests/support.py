@@ -0,0 +1,131 @@
+"""
+Shared helpers for the tests: mock_server.py running in a background thread, and
+main.py run against it as a separate process (BRREG_BASE_URL is read at import).
+"""
+
+import csv
+import gzip
+import json
+import os
+import subprocess
+import sys
+import threading
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from mock_server import INDUSTRY_CODES, ORGNR_BASE, MockHandler, MockServer, SyntheticRegistry  # noqa: E402
+
+
+MAIN_SCRIPT = os.path.join(ROOT, "main.py")
+# No pauses, no rate limits and no state outside the test directory
+FAST_ARGS = ["--page-delay", "0", "--page-rate", "0", "--finance-rate", "0", "--no-shared-rate-limit"]
+RUN_TIMEOUT = 120  # Sekunder en kjøring av main.py kan ta i testene
+
+
+class FailingPagesHandler(MockHandler):
+    """Answers every search page after the first with 500, as an overloaded API would."""
+
+    def _enheter(self, params):
+        if int(params.get("page", 0)) > 0:
+            return 500, {"feilmelding": "Intern feil (test)"}
+        return super()._enheter(params)
+
+
+class RunningMockServer:
+    """Context manager that serves a SyntheticRegistry on a free port without latency or errors."""
+
+    def __init__(self, companies=2000, **options):
+        options.setdefault("latency", 0)
+        self.server = MockServer(("127.0.0.1", 0), SyntheticRegistry(companies), **options)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    @property
+    def registry(self):
+        return self.server.registry
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def env(self):
+        return dict(os.environ, BRREG_BASE_URL=self.url, PYTHONUNBUFFERED="1")
+
+    def orgnrs(self, prefix):
+        """Orgnrs of the companies under an industry code prefix, in the order the search returns them."""
+        registry = self.registry
+        return [str(ORGNR_BASE + i) for i in registry.search({"naeringskode": prefix})]
+
+    def run_main(self, *args, cache_file=None):
+        """Run main.py with args against the server and return the CompletedProcess (text output)."""
+        command = [sys.executable, MAIN_SCRIPT] + FAST_ARGS
+        command += ["--cache-file", cache_file] if cache_file else ["--no-cache"]
+        return subprocess.run(command + list(args), env=self.env(), capture_output=True, text=True, timeout=RUN_TIMEOUT)
+
+    def start_main(self, *args):
+        """Start main.py (e.g. --serve) in the background with stdout piped; the caller stops it."""
+        command = [sys.executable, MAIN_SCRIPT] + FAST_ARGS + ["--no-cache"] + list(args)
+        return subprocess.Popen(command, env=self.env(), stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+
+
+class RegistryClient:
+    """Answers finance lookups straight from a SyntheticRegistry, in place of HttpClient."""
+
+    rate_limiter = None
+
+    def __init__(self, registry):
+        self.registry = registry
+
+    def get_json(self, url, endpoint=None, limiter=None, **kwargs):
+        return self.registry.accounts(int(url.rsplit("/", 1)[1]) - ORGNR_BASE)
+
+
+def read_rows(path):
+    """Rows of a CSV file written by main.py, as dicts."""
+    with open(path, newline="", encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+
+def write_dump(registry, path, layout="compact"):
+    """
+    Write the companies of a registry as an Enhetsregisteret dump: gzip JSON, or CSV if path ends in .csv(.gz).
+    A JSON dump is written on one line ("compact"), one entity per line ("lines") or indented ("pretty").
+    """
+    entities = [registry.entity(i) for i in range(len(registry)) if i not in registry.removed]
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "wt", encoding="utf-8", newline="") as f:
+        if ".csv" not in path:
+            if layout == "lines":
+                f.write("[\n" + ",\n".join(json.dumps(entity) for entity in entities) + "\n]\n")
+            else:
+                json.dump(entities, f, indent=2 if layout == "pretty" else None)
+            return
+        rows = [_flatten(entity) for entity in entities]
+        columns = sorted({key for row in rows for key in row})
+        writer = csv.DictWriter(f, columns)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def _flatten(value, prefix=""):
+    # Dotted column names as in the CSV dump (forretningsadresse.postnummer); lists keep their first item
+    row = {}
+    for key, item in value.items():
+        if key == "_links":
+            continue
+        if isinstance(item, dict):
+            row.update(_flatten(item, f"{prefix}{key}."))
+        else:
+            item = item[0] if isinstance(item, list) else item
+            row[prefix + key] = str(item).lower() if isinstance(item, bool) else item
+    return row
@@ -0,0 +1,173 @@
+"""The library API (iter_companies, write_companies) and lazy imports."""
+
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from datetime import date
+
+from support import ROOT, FailingPagesHandler, RegistryClient, RunningMockServer, read_rows, write_dump
+
+import brreg_finder
+from brreg_finder import Company, CrawlError, FilterError, iter_companies, write_companies
+
+FILTER = "employees > 3 and fin_revenue > 0"
+
+# Run code in a fresh interpreter against the mock server and report whether requests got imported
+PROBE = """
+import json, sys
+sys.path.insert(0, {root!r})
+{code}
+print(json.dumps({{"requests": "requests" in sys.modules, "result": result}}))
+"""
+
+
+def run_probe(code, env=None):
+    """Run code (which sets `result`) with PROBE and return its report and the CompletedProcess."""
+    process = subprocess.run([sys.executable, "-c", PROBE.format(root=ROOT, code=code)], capture_output=True,
+                             text=True, env=env, timeout=120)
+    report = json.loads(process.stdout.strip().splitlines()[-1]) if process.returncode == 0 else None
+    return report, process
+
+
+class ListSink:
+
+    def __init__(self):
+        self.companies = []
+        self.closed = False
+
+    def write(self, company):
+        self.companies.append(company)
+
+    def close(self):
+        self.closed = True
+
+
+class LazyImportTest(unittest.TestCase):
+
+    def probe(self, code, env=None):
+        report, process = run_probe(code, env)
+        self.assertEqual(process.returncode, 0, process.stderr)
+        return report
+
+    def test_package_import_and_help_skip_requests(self):
+        probe = self.probe("import brreg_finder\nresult = bool(brreg_finder.compile_filter('employees > 1'))")
+        self.assertEqual(probe, {"requests": False, "result": True})
+        probe = self.probe("from brreg_finder.cli import main\nimport contextlib, io\n"
+                           "sys.argv = ['main.py', '--help']\n"
+                           "with contextlib.redirect_stdout(io.StringIO()):\n"
+                           "    try:\n        main()\n    except SystemExit as e:\n        result = e.code")
+        self.assertEqual(probe, {"requests": False, "result": 0})
+
+    def test_local_dump_runs_skip_requests(self):
+        with tempfile.TemporaryDirectory() as tmp, RunningMockServer() as mock:
+            dump_file = os.path.join(tmp, "enheter.json.gz")
+            write_dump(mock.registry, dump_file)
+            probe = self.probe(
+                "from brreg_finder import iter_companies\n"
+                f"result = [c.orgnr for c in iter_companies('62', source='dump', dump_file={dump_file!r})]",
+                env=mock.env())
+            self.assertFalse(probe["requests"])
+            self.assertEqual(sorted(probe["result"]), sorted(mock.orgnrs("62")))
+
+    def test_exports(self):
+        self.assertIn("iter_companies", dir(brreg_finder))
+        self.assertIs(brreg_finder.iter_companies, iter_companies)
+        with self.assertRaises(AttributeError):
+            brreg_finder.not_there
+
+
+class IterCompaniesTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.mock = RunningMockServer().__enter__()
+        cls.dump_file = os.path.join(cls.tmp.name, "enheter.json.gz")
+        write_dump(cls.mock.registry, cls.dump_file)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.mock.__exit__(None, None, None)
+        cls.tmp.cleanup()
+
+    def iter_dump(self, **options):
+        return iter_companies("62", source="dump", dump_file=self.dump_file, client=RegistryClient(self.mock.registry),
+                              **options)
+
+    def test_typed_records_match_the_cli(self):
+        output = os.path.join(self.tmp.name, "out.csv")
+        result = self.mock.run_main("--industry", "62", "--fin", "--filter", FILTER, "--output", output)
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+        rows = read_rows(output)
+        printed = io.StringIO()
+        with redirect_stdout(printed):
+            companies = list(self.iter_dump(filter_expr=FILTER, finance=True))
+        self.assertEqual(printed.getvalue(), "")
+        self.assertEqual(sorted(c.orgnr for c in companies), sorted(row["OrgNo"] for row in rows))
+        by_orgnr = {row["OrgNo"]: row for row in rows}
+        for company in companies:
+            row = by_orgnr[company.orgnr]
+            self.assertIsInstance(company, Company)
+            self.assertEqual(company.industry, "62")
+            self.assertIsInstance(company.registration_date, date)
+            self.assertEqual(company.registration_date.isoformat(), row["RegistrationDate"])
+            self.assertEqual(company.employees, int(row["Employees"]))
+            self.assertEqual(f"{company.financials.revenue:,}".replace(",", " "), row["Revenue"])
+            self.assertEqual(company.financials.profit_margin, float(row["Profit Margin (%)"]))
+
+    def test_callbacks_and_limit(self):
+        progress, messages = [], []
+        companies = list(self.iter_dump(limit=25, progress=lambda *counts: progress.append(counts),
+                                        messages=messages.append))
+        self.assertEqual(len(companies), 25)
+        self.assertEqual(progress[-1][1], 25)
+        self.assertIsNone(companies[0].financials)
+        # Messages only go to the callback while the generator runs
+        printed = io.StringIO()
+        with redirect_stdout(printed):
+            brreg_finder.common.echo("ferdig")
+        self.assertEqual(printed.getvalue(), "ferdig\n")
+
+    def test_write_companies(self):
+        sink = ListSink()
+        written = write_companies(sink, ["62", "73"], source="dump", dump_file=self.dump_file, limit=10)
+        self.assertEqual((written, len(sink.companies), sink.closed), (20, 20, True))
+        self.assertEqual({c.industry for c in sink.companies}, {"62", "73"})
+
+    def test_errors(self):
+        with self.assertRaises(FilterError):
+            next(self.iter_dump(filter_expr="employees >"))
+        with self.assertRaises(ValueError):
+            next(iter_companies("62", source="ftp"))
+
+
+class IterCompaniesApiTest(unittest.TestCase):
+
+    def probe(self, mock, code):
+        report, process = run_probe(code, mock.env())
+        self.assertEqual(process.returncode, 0, process.stderr)
+        return report["result"]
+
+    def test_crawl(self):
+        code = ("from brreg_finder import HttpClient, iter_companies\n"
+                "client = HttpClient()\n"
+                "result = [c.orgnr for c in iter_companies('62', client=client, page_delay=0)]")
+        with RunningMockServer() as mock:
+            self.assertEqual(self.probe(mock, code), mock.orgnrs("62"))
+
+    def test_failed_pages_raise(self):
+        code = ("from brreg_finder import CrawlError, iter_companies\n"
+                "try:\n    list(iter_companies('62', page_delay=0, max_retries=0))\n    result = None\n"
+                "except CrawlError as e:\n    result = type(e).__name__")
+        with RunningMockServer(companies=8000) as mock:
+            mock.server.RequestHandlerClass = FailingPagesHandler
+            self.assertEqual(self.probe(mock, code), CrawlError.__name__)
+
+
+if __name__ == "__main__":
+    unittest.main()
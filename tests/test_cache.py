@@ -0,0 +1,97 @@
+"""ResponseCache: fresh hits, revalidation, cached 404s and eviction, through HttpClient."""
+
+import hashlib
+import json
+import os
+import tempfile
+import unittest
+
+import requests
+
+from support import MockHandler, RunningMockServer
+
+from brreg_finder.cache import ResponseCache
+from brreg_finder.client import HttpClient
+
+ENHETER_PATH = "/enhetsregisteret/api/enheter"
+REGNSKAP_PATH = "/regnskapsregisteret/regnskap/"
+
+
+class ETagHandler(MockHandler):
+    """Adds an ETag to every 200 answer and answers a matching If-None-Match with 304."""
+
+    def _send(self, status, body, headers=None):
+        if status != 200:
+            return super()._send(status, body, headers)
+        etag = '"%s"' % hashlib.sha1(json.dumps(body, sort_keys=True).encode("utf-8")).hexdigest()
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return 0
+        return super()._send(status, body, dict(headers or {}, ETag=etag))
+
+
+class ResponseCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "cache.sqlite")
+        self.mock = RunningMockServer().__enter__()
+        self.mock.server.RequestHandlerClass = ETagHandler
+        self.url = self.mock.url + ENHETER_PATH
+        self.params = {"naeringskode": "62", "size": 10}
+
+    def tearDown(self):
+        self.mock.__exit__(None, None, None)
+        self.tmp.cleanup()
+
+    def fetch(self, cache, url=None):
+        client = HttpClient(max_retries=0, cache=cache)
+        try:
+            return client.get_json(url or self.url, self.params if url is None else None)
+        finally:
+            self.requests = client.stats()["requests"]
+            client.close()
+
+    def test_fresh_entries_are_served_without_a_request(self):
+        cache = ResponseCache(self.path)
+        first = self.fetch(cache)
+        cache.close()
+        # The entry outlives the process that stored it
+        cache = ResponseCache(self.path)
+        self.assertEqual(self.fetch(cache), first)
+        self.assertEqual(self.requests, 0)
+        self.assertEqual(cache.stats(), {"hits": 1, "revalidated": 0, "misses": 0})
+        cache.close()
+
+    def test_stale_entries_are_revalidated(self):
+        cache = ResponseCache(self.path, ttls={"enheter": 0})
+        first = self.fetch(cache)
+        self.assertEqual(self.fetch(cache), first)
+        self.assertEqual(self.requests, 1)
+        self.assertEqual(cache.stats(), {"hits": 0, "revalidated": 1, "misses": 1})
+        cache.close()
+
+    def test_missing_accounts_are_cached(self):
+        cache = ResponseCache(self.path)
+        url = self.mock.url + REGNSKAP_PATH + "999999999"
+        for expected_requests in (1, 0):
+            with self.assertRaises(requests.HTTPError):
+                self.fetch(cache, url)
+            self.assertEqual(self.requests, expected_requests)
+        cache.close()
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = ResponseCache(self.path, max_bytes=1)
+        self.fetch(cache)
+        cache.close()
+        cache = ResponseCache(self.path)
+        self.fetch(cache)
+        self.assertEqual(self.requests, 1)
+        cache.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
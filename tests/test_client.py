@@ -0,0 +1,113 @@
+"""HTTP layer: PagePrefetcher, PolitenessPolicy and HttpClient against the mock server."""
+
+import json
+import time
+import unittest
+
+import requests
+
+from support import RunningMockServer
+
+from brreg_finder.client import HttpClient, PagePrefetcher, PolitenessPolicy
+
+ENHETER_PATH = "/enhetsregisteret/api/enheter"
+
+
+class PrefetchTest(unittest.TestCase):
+
+    def test_pages_in_order_and_ahead_of_the_consumer(self):
+        with RunningMockServer() as mock:
+            expected = mock.orgnrs("62")
+            client = HttpClient(max_retries=0)
+            prefetcher = PagePrefetcher(mock.url + ENHETER_PATH, {"naeringskode": "62", "size": 100}, depth=2, client=client)
+            pages, orgnrs = [], []
+            try:
+                for page_number, data in prefetcher:
+                    if page_number == 0:
+                        # While this page is processed, the next ones are downloaded
+                        time.sleep(0.5)
+                        self.assertEqual(prefetcher.queue.qsize(), 2)
+                    pages.append(page_number)
+                    orgnrs += [e["organisasjonsnummer"] for e in data.get("_embedded", {}).get("enheter", [])]
+            finally:
+                prefetcher.close()
+                client.close()
+            self.assertEqual(pages, list(range(len(pages))))
+            self.assertEqual(orgnrs, expected)
+
+
+class PolitenessTest(unittest.TestCase):
+
+    def test_delay_follows_response_time(self):
+        policy = PolitenessPolicy(min_delay=0.01, smoothing=0.5)
+        policy.record(0.2)
+        self.assertAlmostEqual(policy.delay, 0.2)
+        policy.record(0.0)
+        # A lower target is approached halfway at a time
+        self.assertAlmostEqual(policy.delay, 0.15)
+        policy.record(0.0)
+        self.assertAlmostEqual(policy.delay, 0.1)
+        for _ in range(20):
+            policy.record(0.0)
+        self.assertAlmostEqual(policy.delay, 0.01, places=3)
+
+    def test_retry_after_blocks_the_next_request(self):
+        policy = PolitenessPolicy(min_delay=0.0)
+        policy.record(0.01, status=429, retry_after="0.3")
+        self.assertEqual(policy.throttled, 1)
+        started = time.monotonic()
+        policy.wait()
+        self.assertGreaterEqual(time.monotonic() - started, 0.25)
+
+
+def fail_first(server, statuses):
+    """Make the mock answer its next requests with the given statuses (429/500), then normally."""
+    pending = list(statuses)
+    server.inject_failure = lambda: pending.pop(0) if pending else None
+
+
+class HttpClientTest(unittest.TestCase):
+
+    def test_transient_errors_are_retried(self):
+        with RunningMockServer() as mock:
+            fail_first(mock.server, [500, 500])
+            client = HttpClient(max_retries=3, backoff_base=0.01)
+            data = client.get_json(mock.url + ENHETER_PATH, {"naeringskode": "62", "size": 1})
+            self.assertEqual(len(data["_embedded"]["enheter"]), 1)
+            stats = client.stats()
+            client.close()
+            self.assertEqual((stats["requests"], stats["retries"]), (3, 2))
+
+    def test_gives_up_after_max_retries(self):
+        with RunningMockServer() as mock:
+            fail_first(mock.server, [500] * 5)
+            client = HttpClient(max_retries=1, backoff_base=0.01)
+            with self.assertRaises(requests.HTTPError):
+                client.get_json(mock.url + ENHETER_PATH, {"naeringskode": "62"})
+            self.assertEqual(client.stats()["requests"], 2)
+            client.close()
+
+    def test_retry_after_is_honoured(self):
+        with RunningMockServer() as mock:
+            mock.server.retry_after = 1
+            fail_first(mock.server, [429])
+            client = HttpClient(max_retries=2, backoff_base=0.01)
+            started = time.monotonic()
+            client.get_json(mock.url + ENHETER_PATH, {"naeringskode": "62", "size": 1})
+            self.assertGreaterEqual(time.monotonic() - started, 0.9)
+            client.close()
+
+    def test_connections_are_reused_and_compressed(self):
+        with RunningMockServer() as mock:
+            client = HttpClient(max_retries=0)
+            for page in range(5):
+                data = client.get_json(mock.url + ENHETER_PATH, {"naeringskode": "62", "size": 100, "page": page})
+            stats = client.stats()
+            client.close()
+            self.assertEqual((stats["connections_opened"], stats["connections_reused"]), (1, 4))
+            # gzip: all five pages take fewer bytes on the wire than the last one as JSON
+            self.assertLess(stats["bytes_received"], len(json.dumps(data, ensure_ascii=False).encode("utf-8")))
+
+
+if __name__ == "__main__":
+    unittest.main()
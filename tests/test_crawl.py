@@ -0,0 +1,31 @@
+"""API crawl: completeness reporting of ShardedCrawl."""
+
+import os
+import tempfile
+import unittest
+
+from support import FailingPagesHandler, RunningMockServer, read_rows
+
+
+class CrawlReportTest(unittest.TestCase):
+
+    def test_single_shard_failure_is_reported(self):
+        with tempfile.TemporaryDirectory() as tmp, RunningMockServer(companies=8000) as mock:
+            mock.server.RequestHandlerClass = FailingPagesHandler
+            output = os.path.join(tmp, "out.csv")
+            result = mock.run_main("--industry", "62", "--output", output, "--max-retries", "0")
+            expected = len(mock.orgnrs("62"))
+            self.assertGreater(expected, 1000)
+            self.assertEqual(len(read_rows(output)), 1000)
+            self.assertIn(f"UFULLSTENDIG: hentet 1000 av {expected} enheter", result.stdout)
+
+    def test_limit_is_not_reported_as_incomplete(self):
+        with tempfile.TemporaryDirectory() as tmp, RunningMockServer() as mock:
+            output = os.path.join(tmp, "out.csv")
+            result = mock.run_main("--industry", "62", "--output", output, "--limit", "10")
+            self.assertEqual(len(read_rows(output)), 10)
+            self.assertNotIn("UFULLSTENDIG", result.stdout)
+
+
+if __name__ == "__main__":
+    unittest.main()
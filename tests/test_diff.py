@@ -0,0 +1,65 @@
+"""--diff: baseline handling of ChangeTracker across complete and incomplete runs."""
+
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from support import FailingPagesHandler, MockHandler, RunningMockServer, read_rows
+
+
+def count(state, table):
+    conn = sqlite3.connect(state)
+    try:
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    finally:
+        conn.close()
+
+
+class DiffTest(unittest.TestCase):
+
+    def test_limit_is_rejected(self):
+        with tempfile.TemporaryDirectory() as tmp, RunningMockServer() as mock:
+            result = mock.run_main("--industry", "62", "--output", os.path.join(tmp, "out.csv"), "--diff", "--limit", "10")
+            self.assertEqual(result.returncode, 1)
+            self.assertIn("--diff kan ikke kombineres med --serve, --resume eller --limit.", result.stdout)
+
+    def test_incomplete_run_keeps_baseline(self):
+        with tempfile.TemporaryDirectory() as tmp, RunningMockServer(companies=8000) as mock:
+            output = os.path.join(tmp, "out.csv")
+            changes = os.path.join(tmp, "out_endringer.csv")
+            state = output + ".diff.sqlite"
+            args = ("--industry", "62", "--output", output, "--diff", "--max-retries", "0")
+            expected = len(mock.orgnrs("62"))
+            self.assertGreater(expected, 1000)
+
+            self.assertEqual(mock.run_main(*args).returncode, 0)
+            self.assertEqual(count(state, "rows"), expected)
+
+            # Only the first page arrives: its rows are committed, the baseline is untouched
+            mock.server.RequestHandlerClass = FailingPagesHandler
+            mock.run_main(*args)
+            self.assertEqual(count(state, "rows"), expected)
+            self.assertEqual(count(state, "pending"), 1000)
+
+            mock.server.RequestHandlerClass = MockHandler
+            self.assertEqual(mock.run_main(*args).returncode, 0)
+            self.assertEqual(read_rows(changes), [])
+            self.assertEqual(count(state, "rows"), expected)
+            self.assertEqual(count(state, "pending"), 0)
+
+    def test_pages_are_not_read_from_cache(self):
+        with tempfile.TemporaryDirectory() as tmp, RunningMockServer() as mock:
+            output = os.path.join(tmp, "out.csv")
+            cache_file = os.path.join(tmp, "cache.sqlite")
+            args = ("--industry", "62", "--output", output, "--diff")
+            self.assertEqual(mock.run_main(*args, cache_file=cache_file).returncode, 0)
+            changed = mock.orgnrs("62")[0]
+            mock.server.apply_update(changed, "Endring")
+            self.assertEqual(mock.run_main(*args, cache_file=cache_file).returncode, 0)
+            changes = read_rows(os.path.join(tmp, "out_endringer.csv"))
+            self.assertEqual([(c["Change"], c["OrgNo"], c["Field"]) for c in changes], [("changed", changed, "Name")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+"""--source dump: the bulk file gives the same rows as the API, serially or with reader processes."""
+
+import os
+import tempfile
+import unittest
+
+from support import RunningMockServer, SyntheticRegistry, read_rows, write_dump
+
+from brreg_finder.common import FIELD_MAP
+from brreg_finder.dump import DumpChunks, ParallelDumpReader, iter_chunk_entities, iter_dump_companies
+from brreg_finder.filters import compile_filter
+from brreg_finder.records import company_industry_codes, extract_company_data, industry_matches
+
+ARGS = ("--industry", "62", "--fin", "--fields", "name,orgnr,employees,zipcode,revenue", "--filter", "employees > 3")
+
+
+class DumpTest(unittest.TestCase):
+
+    def run_rows(self, mock, tmp, *args):
+        output = os.path.join(tmp, "out.csv")
+        result = mock.run_main(*ARGS, "--output", output, *args)
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+        return sorted(read_rows(output), key=lambda row: row["OrgNo"])
+
+    def test_json_and_csv_dumps_match_the_api(self):
+        with tempfile.TemporaryDirectory() as tmp, RunningMockServer() as mock:
+            expected = self.run_rows(mock, tmp)
+            self.assertGreater(len(expected), 1)
+            for name in ("enheter.json.gz", "enheter.csv"):
+                with self.subTest(dump=name):
+                    dump_file = os.path.join(tmp, name)
+                    write_dump(mock.registry, dump_file)
+                    self.assertEqual(self.run_rows(mock, tmp, "--source", "dump", "--dump-file", dump_file), expected)
+
+    def test_parse_workers_match_the_api(self):
+        with tempfile.TemporaryDirectory() as tmp, RunningMockServer() as mock:
+            expected = self.run_rows(mock, tmp)
+            for name, layout in (("lines.json.gz", "lines"), ("pretty.json", "pretty"), ("enheter.csv.gz", "compact"),
+                                 ("compact.json.gz", "compact")):
+                with self.subTest(dump=name):
+                    dump_file = os.path.join(tmp, name)
+                    write_dump(mock.registry, dump_file, layout)
+                    rows = self.run_rows(mock, tmp, "--source", "dump", "--dump-file", dump_file, "--parse-workers", "2")
+                    self.assertEqual(rows, expected)
+
+
+class ParallelDumpReaderTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.registry = SyntheticRegistry(1500)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def dump(self, name, layout="compact"):
+        path = os.path.join(self.tmp.name, name)
+        write_dump(self.registry, path, layout)
+        return path
+
+    def test_chunks_hold_whole_entities(self):
+        for name, layout in (("lines.json.gz", "lines"), ("pretty.json", "pretty"), ("enheter.csv", "compact")):
+            with self.subTest(dump=name):
+                path = self.dump(name, layout)
+                chunks = DumpChunks(path, chunk_size=50000)
+                pieces = list(chunks)
+                chunks.close()
+                self.assertGreater(len(pieces), 3)
+                entities = [e for piece in pieces for e in iter_chunk_entities(chunks.layout, piece)]
+                self.assertEqual(entities, list(iter_dump_companies(path)))
+
+    def test_compact_json_is_read_serially(self):
+        chunks = DumpChunks(self.dump("compact.json"))
+        self.assertIsNone(chunks.layout)
+        chunks.close()
+
+    def test_rows_in_file_order(self):
+        path = self.dump("lines.json", "lines")
+        compiled = compile_filter("employees > 3 and fin_revenue > 0")
+        expected = []
+        for company in iter_dump_companies(path):
+            codes = company_industry_codes(company)
+            matches = [i for i, code in enumerate(("62", "73")) if codes and industry_matches(code, codes)]
+            if matches:
+                company_dict = extract_company_data(company, list(FIELD_MAP), FIELD_MAP, all_fields=True)
+                expected.append((company_dict["orgnr"], matches, compiled.prefilter(company_dict)))
+        reader = ParallelDumpReader(DumpChunks(path, chunk_size=50000), ["62", "73"], compiled, workers=2)
+        try:
+            results = list(reader)
+        finally:
+            reader.close()
+        self.assertGreater(len(results), 3)
+        self.assertEqual(sum(read for read, _ in results), len(self.registry))
+        rows = [row for _, chunk_rows in results for row in chunk_rows]
+        self.assertEqual([(d["orgnr"] if d else expected[n][0], matches, passed)
+                          for n, (_, matches, d, _, passed) in enumerate(rows)], expected)
+        self.assertTrue(any(passed for *_, passed in rows) and not all(passed for *_, passed in rows))
+
+
+if __name__ == "__main__":
+    unittest.main()
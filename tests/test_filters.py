@@ -0,0 +1,88 @@
+"""--filter: compiled predicate and the partial decision made before any finance lookup."""
+
+import unittest
+
+import support  # noqa: F401  (puts the repository on sys.path)
+
+from brreg_finder.filters import FilterError, compile_filter, plan_pushdown, safe_eval_filter
+
+
+COMPANY = {"name": "Syntetisk AS", "email": "post@syntetisk.no", "mobile": "", "employees": 12, "state": "OSLO",
+           "zipcode": "0150", "in_liquidation": False, "registration_date": "2015-06-01"}
+
+
+class CompileTest(unittest.TestCase):
+
+    def test_predicate(self):
+        for expr, expected in [
+            ("employees >= 10 and state == 'OSLO'", True),
+            ("employees > 12 or mobile", False),
+            ("email and not mobile", True),
+            ("zipcode in ['0150', '0151'] and not in_liquidation", True),
+            ("10 < employees <= 12", True),
+            ("registration_date > '2012-12-12'", True),
+            ("employees > -1 and name != 'Annet AS'", True),
+        ]:
+            with self.subTest(expr=expr):
+                self.assertEqual(compile_filter(expr).predicate(dict(COMPANY)), expected)
+
+    def test_mismatched_types_do_not_match(self):
+        self.assertFalse(compile_filter("mobile > 10 or employees > 0").predicate(dict(COMPANY)))
+
+    def test_invalid_expressions_are_rejected(self):
+        for expr in ("employees >", "turnover > 5", "__import__('os')", "name.upper() == 'X'", "employees + 1 > 2"):
+            with self.subTest(expr=expr), self.assertRaises(FilterError):
+                compile_filter(expr)
+
+    def test_fields_and_prefilter(self):
+        compiled = compile_filter("employees > 5 and (revenue > 1000000 or fin_profit_margin > 10)")
+        self.assertEqual(compiled.fields, {"employees", "revenue", "profit_margin"})
+        self.assertEqual(compiled.finance_fields, {"revenue", "profit_margin"})
+        self.assertTrue(compiled.needs_finance)
+        # The prefilter only checks the part without financial fields
+        self.assertTrue(compiled.prefilter(dict(COMPANY)))
+        self.assertFalse(compiled.prefilter(dict(COMPANY, employees=3)))
+        self.assertTrue(compile_filter("employees > 50 or revenue > 0").prefilter(dict(COMPANY)))
+
+    def test_safe_eval_filter(self):
+        self.assertTrue(safe_eval_filter("state == 'OSLO'", dict(COMPANY)))
+        self.assertFalse(safe_eval_filter("unknown_field == 1", dict(COMPANY)))
+
+
+class DecideTest(unittest.TestCase):
+
+    def assertConsistent(self, expr, company_dict, decision):
+        compiled = compile_filter(expr)
+        self.assertEqual(compiled.decide(company_dict), decision)
+        if decision is not None:
+            # Missing accounts are one possible outcome of the lookup
+            self.assertEqual(compiled.predicate(dict(company_dict)), decision)
+
+    def test_comparison_on_missing_accounts(self):
+        company = {"email": "a@b.no", "employees": 10, "fin_revenue": None}
+        self.assertConsistent("fin_revenue > 1000 or email", company, None)
+        self.assertConsistent("email or fin_revenue > 1000", company, True)
+        self.assertConsistent("not (fin_revenue > 0 and employees > 100)", company, None)
+        self.assertConsistent("fin_revenue and employees > 100", company, False)
+
+    def test_bare_numeric_names_cannot_fail(self):
+        # apply_financials() sets them to 0.0 when the accounts are missing
+        company = {"email": "a@b.no", "revenue": 0.0}
+        self.assertConsistent("revenue > 1000 or email", company, True)
+        self.assertConsistent("revenue > 1000 or revenue < -5 or email", company, True)
+
+
+class PushdownTest(unittest.TestCase):
+
+    def test_only_lower_date_bounds_are_pushed(self):
+        compiled = compile_filter("registration_date > '2010-01-01' and registration_date < '2015-01-01' "
+                                  "and incorporation_date <= '2014-12-31'")
+        # A company without the dates passes the upper bounds locally
+        self.assertTrue(compile_filter("registration_date < '2015-01-01'").predicate({"registration_date": ""}))
+        params, pushed = plan_pushdown(compiled)
+        self.assertEqual(params, {"fraRegistreringsdatoEnhetsregisteret": "2010-01-02"})
+        self.assertEqual(pushed, ["registration_date > '2010-01-01'"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,173 @@
+"""Finance lookups: FinanceFetcher, TokenBucket and the batch ratio computation."""
+
+import threading
+import time
+import unittest
+
+import support  # noqa: F401  (puts the repository on sys.path)
+
+from brreg_finder.common import SHARED_FINANCE_RESULTS
+from brreg_finder.filters import compile_filter
+from brreg_finder.finance import FinanceBatch, FinanceFetcher, TokenBucket, apply_financials_batch, import_numpy
+
+
+class CountingClient:
+    """Stands in for HttpClient: every orgnr has no accounts, and lookups are counted."""
+
+    rate_limiter = None
+
+    def __init__(self):
+        self.lookups = 0
+        self.lock = threading.Lock()
+
+    def get_json(self, url, params=None, endpoint="enheter", politeness=None, limiter=None):
+        with self.lock:
+            self.lookups += 1
+        return None
+
+
+class SlowClient:
+    """Stands in for HttpClient: a lookup takes longer the lower the orgnr, and concurrency is recorded."""
+
+    rate_limiter = None
+
+    def __init__(self):
+        self.active = self.most_active = 0
+        self.lock = threading.Lock()
+
+    def get_json(self, url, params=None, endpoint="enheter", politeness=None, limiter=None):
+        if limiter is not None:
+            limiter.acquire()
+        with self.lock:
+            self.active += 1
+            self.most_active = max(self.most_active, self.active)
+        time.sleep(0.05 - int(url.rsplit("/", 1)[1]) * 0.005)
+        with self.lock:
+            self.active -= 1
+        return None
+
+
+class TokenBucketTest(unittest.TestCase):
+
+    def test_rate_after_burst(self):
+        bucket = TokenBucket(rate=50, burst=5)
+        started = time.monotonic()
+        for _ in range(15):
+            bucket.acquire()
+        # The burst is free; the other 10 tokens take 10 / 50 s
+        self.assertGreaterEqual(time.monotonic() - started, 0.19)
+
+    def test_zero_rate_does_not_limit(self):
+        bucket = TokenBucket(rate=0)
+        started = time.monotonic()
+        for _ in range(1000):
+            bucket.acquire()
+        self.assertLess(time.monotonic() - started, 0.5)
+
+
+class FinanceFetcherTest(unittest.TestCase):
+
+    def test_concurrent_lookups_come_back_in_order(self):
+        client = SlowClient()
+        fetcher = FinanceFetcher(workers=4, rate=0, client=client)
+        try:
+            for n in range(8):
+                fetcher.submit(str(n), n)
+            self.assertEqual([item for item, fin_data in fetcher.ready(block=True)], list(range(8)))
+        finally:
+            fetcher.close()
+        self.assertGreater(client.most_active, 1)
+
+    def test_lookups_share_the_rate_limit(self):
+        fetcher = FinanceFetcher(workers=4, rate=40, burst=1, client=SlowClient())
+        started = time.monotonic()
+        try:
+            for n in range(9):
+                fetcher.submit("9", n)
+            list(fetcher.ready(block=True))
+        finally:
+            fetcher.close()
+        self.assertGreaterEqual(time.monotonic() - started, 0.19)
+
+    def test_shared_results_are_reused_and_bounded(self):
+        client = CountingClient()
+        fetcher = FinanceFetcher(workers=4, rate=0, client=client, share_results=True)
+        try:
+            fetcher.submit("1", "a")
+            fetcher.submit("1", "b")
+            self.assertEqual([item for item, _ in fetcher.ready(block=True)], ["a", "b"])
+            self.assertEqual((client.lookups, fetcher.reused), (1, 1))
+
+            # A recent result is still reused once it has been handed out
+            fetcher.submit("1", "c")
+            list(fetcher.ready(block=True))
+            self.assertEqual(client.lookups, 1)
+
+            for n in range(SHARED_FINANCE_RESULTS * 3):
+                fetcher.submit(str(n + 100), n)
+                list(fetcher.ready())
+            list(fetcher.ready(block=True))
+            self.assertLessEqual(len(fetcher.shared), SHARED_FINANCE_RESULTS)
+            self.assertEqual(client.lookups, 1 + SHARED_FINANCE_RESULTS * 3)
+        finally:
+            fetcher.close()
+
+
+@unittest.skipIf(import_numpy() is None, "numpy er ikke installert")
+class FinanceBatchTest(unittest.TestCase):
+
+    def test_ratios_match_scalar_path_on_half_way_values(self):
+        # Profit margins of 0.005, 0.015, 0.025 and 0.065 %, where np.round and round differ
+        accounts = [{"fin_revenue": 100000, "fin_net_profit": profit, "fin_total_equity": 200000 - profit,
+                     "fin_total_assets": 200000, "fin_total_liabilities": profit} for profit in (5, 15, 25, 65)]
+
+        def rows(batches):
+            result = []
+            for batch in batches:
+                entries = [({}, {}, dict(fin)) for fin in batch]
+                apply_financials_batch(entries, None, None)
+                result += [company_data for company_data, _, _ in entries]
+            return result
+
+        scalar = rows([[fin] for fin in accounts])
+        self.assertEqual(rows([accounts]), scalar)
+        self.assertEqual([row["fin_profit_margin"] for row in scalar], [0.01, 0.01, 0.03, 0.07])
+
+    def test_missing_values_are_nan(self):
+        np = import_numpy()
+        if np is None:
+            self.skipTest("numpy er ikke installert")
+        batch = FinanceBatch([{"fin_revenue": 500, "fin_net_profit": 50, "fin_total_assets": 0}, None], np)
+        batch.compute_ratios()
+        self.assertEqual(batch.values("fin_revenue"), [500.0, ""])
+        self.assertEqual(batch.values("fin_profit_margin"), [10.0, ""])
+        self.assertEqual(batch.values("fin_equity_ratio"), ["", ""])  # Zero denominator
+        self.assertEqual(batch.filter_column("revenue").tolist(), [500.0, 0.0])
+
+    def test_batch_filter_matches_scalar_path(self):
+        fins = [{"fin_revenue": 2000000, "fin_net_profit": 300000, "fin_total_assets": 1000000, "fin_year": 2023},
+                {"fin_revenue": 2000000, "fin_net_profit": -5000, "fin_total_assets": 1000000, "fin_year": 2023},
+                {"fin_revenue": 100, "fin_net_profit": 99, "fin_total_assets": 0, "fin_year": 2022},
+                None, {}]
+        companies = [{"name": f"AS {n}", "employees": n * 10} for n in range(len(fins))]
+        for expr in ("fin_revenue > 1000000 and fin_profit_margin > 10",
+                     "fin_net_profit < 0 or employees >= 30",
+                     "not fin_equity_ratio",
+                     "fin_revenue > 1000 and name == 'AS 1'"):
+            with self.subTest(expr=expr):
+                compiled = compile_filter(expr)
+
+                def run(batches):
+                    results, rows = [], []
+                    for batch in batches:
+                        entries = [({}, dict(d), dict(fin) if fin is not None else None) for d, fin in batch]
+                        results += apply_financials_batch(entries, compiled, ["revenue", "profit_margin"])
+                        rows += [company_data for company_data, _, _ in entries]
+                    return results, rows
+
+                pairs = list(zip(companies, fins))
+                self.assertEqual(run([pairs]), run([[pair] for pair in pairs]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+"""--finance-history: every accounting period in a separate file, long or wide, with growth."""
+
+import os
+import tempfile
+import unittest
+
+from support import RunningMockServer, read_rows
+
+from brreg_finder.common import HISTORY_GROWTH_FIELDS, NUMERIC_FINANCE_FIELDS
+from brreg_finder.finance import _period_end, add_growth, calculate_financial_ratios, parse_financial_period
+
+ARGS = ("--industry", "62", "--limit", "20")
+
+
+def expected_periods(registry, orgnr):
+    accounts = sorted(registry.accounts(registry.lookup(orgnr)), key=_period_end)
+    return add_growth([calculate_financial_ratios(parse_financial_period(a)) for a in accounts])
+
+
+class FinanceHistoryTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.mock = RunningMockServer().__enter__()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.mock.__exit__(None, None, None)
+        cls.tmp.cleanup()
+
+    def run_history(self, *layout):
+        output = os.path.join(self.tmp.name, f"out_{'_'.join(layout) or 'default'}.csv")
+        result = self.mock.run_main(*ARGS, "--finance-history", *layout, "--output", output)
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+        stem, ext = os.path.splitext(output)
+        return [row["OrgNo"] for row in read_rows(output)], read_rows(f"{stem}_historikk{ext}")
+
+    def test_long_layout_keeps_every_period(self):
+        orgnrs, rows = self.run_history()
+        expected = []
+        for orgnr in orgnrs:
+            for period in expected_periods(self.mock.registry, orgnr):
+                for key, value in period.items():
+                    field = key[len("fin_"):]
+                    if (field in NUMERIC_FINANCE_FIELDS or key in HISTORY_GROWTH_FIELDS) and key != "fin_year" \
+                            and value not in ("", None):
+                        expected.append((orgnr, period["fin_year"], field, str(value)))
+        self.assertTrue(any(row["Field"] == "revenue_growth" for row in rows))
+        self.assertEqual(sorted((r["OrgNo"], r["Year"], r["Field"], r["Value"]) for r in rows), sorted(expected))
+
+    def test_wide_layout_has_one_row_per_period(self):
+        orgnrs, rows = self.run_history("wide")
+        expected = [(orgnr, p["fin_year"], str(p["fin_revenue"]), str(p["fin_revenue_growth"]))
+                    for orgnr in orgnrs for p in expected_periods(self.mock.registry, orgnr)]
+        self.assertGreater(len(expected), len(orgnrs) // 2)
+        self.assertEqual([(r["OrgNo"], r["Year"], r["Revenue"], r["Revenue Growth (%)"]) for r in rows], expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,196 @@
+"""
+--incremental and the --serve refresh against the update feed of mock_server.py
+(Ny, Endring and Sletting entries added while the server runs).
+"""
+
+import gzip
+import json
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+from support import INDUSTRY_CODES, FailingPagesHandler, MockHandler, RunningMockServer, read_rows
+
+
+CODE = INDUSTRY_CODES[0][0]
+OTHER_CODE = INDUSTRY_CODES[4][0]
+
+
+def snapshot_meta(path):
+    db = sqlite3.connect(path)
+    try:
+        return dict(db.execute("SELECT key, value FROM meta"))
+    finally:
+        db.close()
+
+
+def snapshot_count(path):
+    db = sqlite3.connect(path)
+    try:
+        return db.execute("SELECT COUNT(*) FROM companies").fetchone()[0]
+    finally:
+        db.close()
+
+
+class IncrementalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.output = os.path.join(self.tmp.name, "out.csv")
+        self.snapshot = os.path.join(self.tmp.name, "out.snapshot.sqlite")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def sync(self, mock, code=CODE, *extra):
+        return mock.run_main("--industry", code, "--incremental", "--output", self.output, "--snapshot", self.snapshot, *extra)
+
+    def test_updates_deletes_and_cursor(self):
+        with RunningMockServer() as mock:
+            orgnrs = mock.orgnrs(CODE)
+            hidden, changed, deleted, later = orgnrs[:4]
+            # Not in the register yet when the snapshot is built
+            mock.registry.remove(mock.registry.lookup(hidden))
+            mock.server.queries.clear()
+
+            result = self.sync(mock)
+            self.assertEqual(result.returncode, 0, result.stdout)
+            self.assertEqual([r["OrgNo"] for r in read_rows(self.output)], [o for o in orgnrs if o != hidden])
+            self.assertIn("since", snapshot_meta(self.snapshot))
+
+            mock.server.apply_update(changed, "Endring")
+            mock.server.apply_update(deleted, "Sletting")
+            mock.server.apply_update(hidden, "Ny")
+            result = self.sync(mock)
+            self.assertEqual(result.returncode, 0, result.stdout)
+            self.assertIn("3 endringer i oppdateringsstrømmen: 2 oppdatert, 1 fjernet.", result.stdout)
+            rows = {r["OrgNo"]: r for r in read_rows(self.output)}
+            self.assertEqual(set(rows), set(orgnrs) - {deleted})
+            self.assertTrue(rows[changed]["Name"].endswith("(endret 1)"))
+            self.assertEqual(snapshot_meta(self.snapshot)["last_update_id"], "3")
+
+            # The next sync continues after the stored cursor; a change in another code is not stored
+            mock.server.apply_update(later, "Endring")
+            mock.server.apply_update(mock.orgnrs(OTHER_CODE)[0], "Endring")
+            result = self.sync(mock)
+            self.assertEqual(result.returncode, 0, result.stdout)
+            self.assertIn("2 endringer i oppdateringsstrømmen: 1 oppdatert, 0 fjernet.", result.stdout)
+            rows = {r["OrgNo"]: r for r in read_rows(self.output)}
+            self.assertEqual(len(rows), len(orgnrs) - 1)
+            self.assertTrue(rows[later]["Name"].endswith("(endret 1)"))
+            self.assertEqual(snapshot_meta(self.snapshot)["last_update_id"], "5")
+
+            result = self.sync(mock)
+            self.assertIn("0 endringer i oppdateringsstrømmen", result.stdout)
+
+    def test_incomplete_crawl_keeps_previous_snapshot(self):
+        # Enough companies under "62" for more than one page of 1000
+        with RunningMockServer(companies=8000) as mock:
+            result = self.sync(mock)
+            self.assertEqual(result.returncode, 0, result.stdout)
+            meta, count = snapshot_meta(self.snapshot), snapshot_count(self.snapshot)
+
+            mock.server.RequestHandlerClass = FailingPagesHandler
+            result = self.sync(mock, "62", "--max-retries", "0")
+            self.assertNotEqual(result.returncode, 0, result.stdout)
+            self.assertEqual(snapshot_meta(self.snapshot), meta)
+            self.assertEqual(snapshot_count(self.snapshot), count)
+
+            # Without an earlier snapshot for the code nothing is stored and no output is written
+            os.remove(self.snapshot)
+            os.remove(self.output)
+            result = self.sync(mock, "62", "--max-retries", "0")
+            self.assertNotEqual(result.returncode, 0, result.stdout)
+            self.assertEqual(snapshot_meta(self.snapshot), {})
+            self.assertEqual(snapshot_count(self.snapshot), 0)
+            self.assertFalse(os.path.exists(self.output))
+
+            mock.server.RequestHandlerClass = MockHandler
+            result = self.sync(mock, "62")
+            self.assertEqual(result.returncode, 0, result.stdout)
+            self.assertEqual(len(read_rows(self.output)), len(mock.orgnrs("62")))
+
+    def test_snapshot_crawl_ignores_cached_pages(self):
+        cache_file = os.path.join(self.tmp.name, "cache.sqlite")
+        with RunningMockServer() as mock:
+            changed = mock.orgnrs(CODE)[0]
+            # A normal run leaves the search pages in the cache
+            result = mock.run_main("--industry", CODE, "--output", os.path.join(self.tmp.name, "plain.csv"), cache_file=cache_file)
+            self.assertEqual(result.returncode, 0, result.stdout)
+            mock.server.apply_update(changed, "Endring")
+            # The snapshot's `since` must be later than the update, so only the crawl can see it
+            time.sleep(1.1)
+            result = mock.run_main("--industry", CODE, "--incremental", "--output", self.output, "--snapshot", self.snapshot,
+                                   cache_file=cache_file)
+            self.assertEqual(result.returncode, 0, result.stdout)
+            rows = {r["OrgNo"]: r for r in read_rows(self.output)}
+            self.assertTrue(rows[changed]["Name"].endswith("(endret 1)"))
+
+
+class ServeRefreshTest(unittest.TestCase):
+
+    def test_refresh_applies_feed_to_dump_index(self):
+        with tempfile.TemporaryDirectory() as tmp, RunningMockServer() as mock:
+            registry = mock.registry
+            orgnrs = mock.orgnrs(CODE)
+            hidden, changed, deleted = orgnrs[:3]
+            registry.remove(registry.lookup(hidden))
+            dump_file = os.path.join(tmp, "dump.json.gz")
+            with gzip.open(dump_file, "wt", encoding="utf-8") as f:
+                json.dump([registry.entity(i) for i in range(len(registry)) if i not in registry.removed], f)
+            # The dump is older than every update in the feed
+            os.utime(dump_file, (time.time() - 3600, time.time() - 3600))
+
+            process = mock.start_main("--industry", CODE, "--serve", "--port", "0", "--source", "dump",
+                                      "--dump-file", dump_file, "--refresh-interval", "0.01")
+            try:
+                address = None
+                for line in process.stdout:
+                    if "Spørre-API klart på" in line:
+                        address = line.split("klart på ")[1].split()[0]
+                        break
+                self.assertIsNotNone(address, "the query API did not start")
+
+                def company(orgnr):
+                    try:
+                        with urlopen(f"{address}/company/{orgnr}", timeout=10) as response:
+                            return json.load(response)
+                    except HTTPError as e:
+                        if e.code == 404:
+                            return None
+                        raise
+
+                self.assertIsNone(company(hidden))
+                mock.server.apply_update(changed, "Endring")
+                mock.server.apply_update(deleted, "Sletting")
+                mock.server.apply_update(hidden, "Ny")
+                deadline = time.monotonic() + 30
+                status = {}
+                while time.monotonic() < deadline:
+                    with urlopen(f"{address}/status", timeout=10) as response:
+                        status = json.load(response)
+                    if (status.get("last_refresh") or {}).get("updates"):
+                        break
+                    time.sleep(0.2)
+                self.assertEqual(status["last_refresh"], {"updates": 3, "upserted": 2, "deleted": 1})
+                self.assertTrue(company(changed)["name"].endswith("(endret 1)"))
+                self.assertIsNone(company(deleted))
+                self.assertIsNotNone(company(hidden))
+                self.assertEqual(status["companies"], len(orgnrs) - 1)
+
+                # The cursor moved past the applied updates: later refreshes see nothing new
+                time.sleep(1.5)
+                with urlopen(f"{address}/status", timeout=10) as response:
+                    self.assertEqual(json.load(response)["last_refresh"]["updates"], 0)
+            finally:
+                process.terminate()
+                process.wait(timeout=10)
+                process.stdout.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
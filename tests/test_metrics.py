@@ -0,0 +1,126 @@
+"""Run-time metrics: Histogram, Metrics, progress lines, --metrics-json and --profile."""
+
+import json
+import os
+import pstats
+import tempfile
+import threading
+import unittest
+
+from support import RunningMockServer, read_rows
+
+from brreg_finder.metrics import Histogram, Metrics, format_duration, format_progress
+
+
+class HistogramTest(unittest.TestCase):
+
+    def test_percentiles_within_observed_range(self):
+        histogram = Histogram(bounds=(10, 20, 50))
+        for value in [1, 2, 3, 4, 5, 6, 7, 8, 9, 10] * 9 + [40] * 9 + [400]:
+            histogram.observe(value)
+        summary = histogram.summary()
+        self.assertEqual((summary["count"], summary["min"], summary["max"]), (100, 1, 400))
+        self.assertEqual(summary["buckets"], {"<=10": 90, "<=50": 9, ">50": 1})
+        self.assertLessEqual(summary["p50"], 10)
+        self.assertTrue(20 < summary["p99"] <= 50)
+        self.assertEqual(Histogram().percentile(99), 0)
+
+    def test_overflow_bucket_uses_max(self):
+        histogram = Histogram(bounds=(10,))
+        for value in (50, 60, 70):
+            histogram.observe(value)
+        self.assertEqual(histogram.percentile(100), 70)
+        self.assertTrue(50 <= histogram.percentile(50) <= 70)
+
+
+class MetricsTest(unittest.TestCase):
+
+    def test_counts_from_threads(self):
+        metrics = Metrics()
+
+        def work():
+            for _ in range(1000):
+                metrics.count("rows")
+                metrics.add_time("write", 0.001)
+                metrics.observe("http.enheter", 5)
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        summary = metrics.summary()
+        self.assertEqual(summary["counters"], {"rows": 4000})
+        self.assertEqual(summary["stages"]["write"]["count"], 4000)
+        self.assertAlmostEqual(summary["stages"]["write"]["seconds"], 4.0, places=2)
+        self.assertEqual(summary["latency_ms"]["http.enheter"]["count"], 4000)
+
+    def test_stages_in_report_order(self):
+        metrics = Metrics()
+        for stage in ("write", "custom", "http"):
+            metrics.add_time(stage, 1)
+        metrics.record("http", {"requests": 3})
+        summary = metrics.summary()
+        self.assertEqual(list(summary["stages"]), ["http", "write", "custom"])
+        self.assertEqual(summary["http"], {"requests": 3})
+        json.dumps(summary)
+
+    def test_progress_line(self):
+        metrics = Metrics()
+        metrics.started -= 10
+        metrics.count("expected", 1000)
+        metrics.count("companies", 250)
+        metrics.count("rows", 100)
+        line = format_progress(metrics)
+        self.assertTrue(line.startswith("[0:10] 250 enheter av ca. 1000 (25 %), 100 rader"), line)
+        self.assertIn("25 enheter/s", line)
+        self.assertIn("ca. 0:30 igjen", line)
+        self.assertEqual([format_duration(s) for s in (59.6, 61, 3723)], ["1:00", "1:01", "1:02:03"])
+
+
+class RunMetricsTest(unittest.TestCase):
+
+    def test_metrics_json_and_progress(self):
+        with tempfile.TemporaryDirectory() as tmp, RunningMockServer(latency=0.01) as mock:
+            output, metrics_file = os.path.join(tmp, "out.csv"), os.path.join(tmp, "metrics.json")
+            result = mock.run_main("--industry", "62", "--fin", "--output", output, "--metrics-json", metrics_file,
+                                   "--progress", "0.5")
+            self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+            with open(metrics_file, encoding="utf-8") as f:
+                summary = json.load(f)
+            rows = len(read_rows(output))
+        self.assertIn("enheter av ca.", result.stdout)
+        self.assertEqual(summary["counters"]["rows"], rows)
+        self.assertEqual(summary["counters"]["companies"], len(mock.orgnrs("62")))
+        self.assertEqual(summary["stages"]["finance_lookup"]["count"], summary["counters"]["finance_lookups"])
+        for stage in ("http", "json", "extract", "finance_apply", "write"):
+            self.assertIn(stage, summary["stages"])
+        regnskap = mock.server.stats.summary()["endpoints"]["regnskap"]["requests"]
+        self.assertEqual(summary["latency_ms"]["http.regnskap"]["count"], regnskap)
+        self.assertEqual(summary["http"]["requests"], regnskap + summary["latency_ms"]["http.enheter"]["count"])
+
+    def test_profiles(self):
+        with tempfile.TemporaryDirectory() as tmp, RunningMockServer() as mock:
+            output = os.path.join(tmp, "out.csv")
+            profile = os.path.join(tmp, "run.prof")
+            result = mock.run_main("--industry", "62", "--output", output, "--profile", profile)
+            self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+            functions = {name for _, _, name in pstats.Stats(profile).stats}
+            self.assertIn("fetch_companies", functions)
+
+            stacks = os.path.join(tmp, "run.stacks")
+            result = mock.run_main("--industry", "62", "--fin", "--output", output, "--profile", stacks,
+                                   "--profile-mode", "sample")
+            self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+            with open(stacks, encoding="utf-8") as f:
+                lines = f.read().splitlines()
+        self.assertTrue(lines)
+        for line in lines:
+            _, count = line.rsplit(" ", 1)
+            self.assertGreater(int(count), 0)
+        # Worker threads are sampled too, not just the main thread
+        self.assertGreater(len({line.split(";", 1)[0] for line in lines}), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+"""mock_server.py (the synthetic registry and its endpoints) and the benchmark harness."""
+
+import gzip
+import json
+import os
+import tempfile
+import unittest
+from datetime import date
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from support import ORGNR_BASE, RunningMockServer, SyntheticRegistry
+
+import benchmark
+from mock_server import ENHETER_PATH, INDUSTRY_CODES, REGNSKAP_PATH, STATS_PATH, UPDATE_PATH, parse_scale
+
+
+def get(url, headers=None):
+    """(status, headers, JSON body) for a GET, also for error statuses."""
+    try:
+        response = urlopen(Request(url, headers=headers or {}), timeout=30)
+    except HTTPError as e:
+        response = e
+    with response:
+        payload = response.read()
+        if response.headers.get("Content-Encoding") == "gzip":
+            payload = gzip.decompress(payload)
+        return response.status, response.headers, json.loads(payload)
+
+
+class SyntheticRegistryTest(unittest.TestCase):
+
+    def test_scales(self):
+        self.assertEqual([parse_scale(s) for s in ("1k", "100K", "1m", "2500", "3k")],
+                         [1_000, 100_000, 1_000_000, 2_500, 3_000])
+        with self.assertRaises(ValueError):
+            parse_scale("mange")
+
+    def test_generated_data_is_deterministic(self):
+        first, second, other = SyntheticRegistry(500), SyntheticRegistry(500), SyntheticRegistry(500, seed=2)
+        self.assertEqual([first.entity(i) for i in range(50)], [second.entity(i) for i in range(50)])
+        self.assertEqual([first.accounts(i) for i in range(50)], [second.accounts(i) for i in range(50)])
+        self.assertNotEqual([first.entity(i) for i in range(50)], [other.entity(i) for i in range(50)])
+
+    def test_search_matches_a_scan(self):
+        registry = SyntheticRegistry(3000)
+        params = {"naeringskode": "62", "fraRegistreringsdatoEnhetsregisteret": "2010-01-01",
+                  "tilRegistreringsdatoEnhetsregisteret": "2015-12-31", "fraAntallAnsatte": "5"}
+        low, high = date(2010, 1, 1).toordinal(), date(2015, 12, 31).toordinal()
+        expected = sorted((registry.codes[i], registry.registered[i], i) for i in range(len(registry))
+                          if INDUSTRY_CODES[registry.codes[i]][0].startswith("62")
+                          and low <= registry.registered[i] <= high and registry.employees[i] >= 5)
+        found = registry.search(params)
+        self.assertTrue(found)
+        self.assertEqual(found, [i for _, _, i in expected])
+        self.assertEqual(registry.lookup(str(ORGNR_BASE + 42)), 42)
+        self.assertIsNone(registry.lookup(str(ORGNR_BASE + 3000)))
+
+
+class MockServerTest(unittest.TestCase):
+
+    def test_paging(self):
+        with RunningMockServer() as mock:
+            url = f"{mock.url}{ENHETER_PATH}?naeringskode=62&size=100"
+            orgnrs = []
+            while url:
+                status, _, body = get(url)
+                self.assertEqual(status, 200)
+                orgnrs += [e["organisasjonsnummer"] for e in body.get("_embedded", {}).get("enheter", [])]
+                url = body["_links"].get("next", {}).get("href")
+            self.assertEqual(orgnrs, mock.orgnrs("62"))
+            self.assertEqual(body["page"]["totalElements"], len(orgnrs))
+            # As in the API, paging stops at the result window
+            status, _, _ = get(f"{mock.url}{ENHETER_PATH}?size=1000&page=10")
+            self.assertEqual(status, 400)
+
+    def test_accounts_and_stats(self):
+        with RunningMockServer() as mock:
+            registry = mock.registry
+            with_accounts = next(i for i in range(len(registry)) if registry.accounts(i))
+            without = next(i for i in range(len(registry)) if not registry.accounts(i))
+            status, _, body = get(f"{mock.url}{REGNSKAP_PATH}{ORGNR_BASE + with_accounts}")
+            self.assertEqual((status, body), (200, registry.accounts(with_accounts)))
+            status, _, _ = get(f"{mock.url}{REGNSKAP_PATH}{ORGNR_BASE + without}")
+            self.assertEqual(status, 404)
+            _, _, stats = get(f"{mock.url}{STATS_PATH}")
+            self.assertEqual(stats["endpoints"]["regnskap"]["requests"], 2)
+            self.assertEqual(stats["endpoints"]["regnskap"]["statuses"], {"200": 1, "404": 1})
+            _, _, stats = get(f"{mock.url}{STATS_PATH}?reset=1")
+            self.assertEqual(stats["endpoints"], {})
+
+    def test_injected_failures(self):
+        with RunningMockServer(throttle_rate=1.0, retry_after=3) as mock:
+            status, headers, _ = get(f"{mock.url}{ENHETER_PATH}?naeringskode=62")
+            self.assertEqual((status, headers["Retry-After"]), (429, "3"))
+            mock.server.throttle_rate, mock.server.error_rate = 0.0, 1.0
+            status, _, _ = get(f"{mock.url}{REGNSKAP_PATH}{ORGNR_BASE}")
+            self.assertEqual(status, 500)
+
+    def test_gzip_and_updates(self):
+        with RunningMockServer() as mock:
+            _, headers, body = get(f"{mock.url}{ENHETER_PATH}?naeringskode=62&size=50", {"Accept-Encoding": "gzip"})
+            self.assertEqual(headers["Content-Encoding"], "gzip")
+            orgnr = body["_embedded"]["enheter"][0]["organisasjonsnummer"]
+            _, _, update = get(f"{mock.url}{UPDATE_PATH}?orgnr={orgnr}&type=Sletting")
+            self.assertEqual(update["endringstype"], "Sletting")
+            self.assertNotIn(orgnr, mock.orgnrs("62"))
+
+
+class BenchmarkTest(unittest.TestCase):
+
+    def test_runs_each_mode(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            results_file = os.path.join(tmp, "results.json")
+            code = benchmark.main(["--scale", "500", "--modes", "basic,finance", "--latency", "0",
+                                   "--workdir", tmp, "--json", results_file])
+            self.assertEqual(code, 0)
+            with open(results_file, encoding="utf-8") as f:
+                results = json.load(f)["results"]
+        self.assertEqual([r["mode"] for r in results], ["basic", "finance"])
+        for result in results:
+            self.assertEqual(result["exit_code"], 0)
+            self.assertGreater(result["rows"], 0)
+            self.assertIn("enheter", result["endpoints"])
+        self.assertEqual(results[0]["rows"], results[1]["rows"])
+        self.assertIn("regnskap", results[1]["endpoints"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+"""CompanyPipeline: the filter gives the same rows whichever way it is evaluated."""
+
+import os
+import tempfile
+import unittest
+
+from support import RegistryClient, RunningMockServer, read_rows
+
+from brreg_finder.filters import compile_filter
+from brreg_finder.finance import fetch_latest_financials
+from brreg_finder.serve import CompanyIndex
+
+# Conditions on accounts mixed with ones the other fields decide, in both orders
+FILTERS = (
+    "fin_revenue > 0 or employees > 5",
+    "employees > 5 or fin_revenue > 0",
+    "fin_revenue > 1000000 or email",
+    "revenue > 1000000 or email",
+    "not (fin_revenue > 0 and employees > 100)",
+)
+
+
+class FinanceFilterTest(unittest.TestCase):
+
+    def run_filter(self, mock, tmp, filter_expr, fields):
+        output = os.path.join(tmp, "out.csv")
+        result = mock.run_main("--industry", "62", "--fin", "--fields", fields, "--filter", filter_expr, "--output", output)
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+        return sorted(row["OrgNo"] for row in read_rows(output))
+
+    def test_pipeline_and_index_agree(self):
+        with tempfile.TemporaryDirectory() as tmp, RunningMockServer() as mock:
+            registry = mock.registry
+            client = RegistryClient(registry)
+            index = CompanyIndex()
+            for i in registry.search({"naeringskode": "62"}):
+                company = registry.entity(i)
+                index.upsert(company)
+                index.set_finance(company["organisasjonsnummer"],
+                                  fetch_latest_financials(company["organisasjonsnummer"], client))
+            for filter_expr in FILTERS:
+                with self.subTest(filter=filter_expr):
+                    _, records, _ = index.query(compile_filter(filter_expr), limit=len(index))
+                    expected = sorted(record["orgnr"] for record in records)
+                    self.assertGreater(len(expected), 1)
+                    # Without financial columns, lookups are skipped where the filter allows it
+                    self.assertEqual(self.run_filter(mock, tmp, filter_expr, "name,orgnr,employees"), expected)
+                    self.assertEqual(self.run_filter(mock, tmp, filter_expr, "name,orgnr,employees,revenue"), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,40 @@
+"""Filter pushdown: search parameters narrow what is fetched without changing the output."""
+
+import os
+import tempfile
+import unittest
+
+from support import RunningMockServer, read_rows
+
+FILTERS = (
+    "employees >= 5 and registration_date >= '2010-01-01'",
+    "employees >= 2 and employees <= 20 and not in_liquidation",
+    "incorporation_date > '2005-06-30' and registration_date < '2020-01-01' or employees > 100",
+    "zipcode == '0150' or employees > 1000",
+)
+
+
+class PushdownTest(unittest.TestCase):
+
+    def run_filter(self, mock, tmp, filter_expr, *args):
+        output = os.path.join(tmp, "out.csv")
+        mock.server.stats.reset()
+        result = mock.run_main("--industry", "62", "--filter", filter_expr, "--output", output, *args)
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+        stats = mock.server.stats.summary()["endpoints"]["enheter"]
+        return read_rows(output), stats["requests"]
+
+    def test_same_rows_with_fewer_requests(self):
+        with tempfile.TemporaryDirectory() as tmp, RunningMockServer(companies=12000) as mock:
+            for filter_expr in FILTERS:
+                with self.subTest(filter=filter_expr):
+                    expected, full_requests = self.run_filter(mock, tmp, filter_expr, "--no-pushdown")
+                    rows, requests = self.run_filter(mock, tmp, filter_expr)
+                    self.assertEqual(rows, expected)
+                    self.assertLessEqual(requests, full_requests)
+                    if " or " not in filter_expr:
+                        self.assertLess(requests, full_requests)
+
+
+if __name__ == "__main__":
+    unittest.main()
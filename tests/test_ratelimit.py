@@ -0,0 +1,141 @@
+"""SharedRateLimiter: spacing, budgets per endpoint, AIMD adjustment and sharing between processes."""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from email.utils import formatdate
+
+from support import MAIN_SCRIPT, RUN_TIMEOUT, RunningMockServer, read_rows
+
+from brreg_finder.common import RATE_LIMIT_DECREASE, RATE_LIMIT_MIN_RATE
+from brreg_finder.ratelimit import SharedRateLimiter, format_rate_limit_stats, parse_retry_after
+
+
+def timed_acquires(limiter, endpoint, n):
+    started = time.monotonic()
+    for _ in range(n):
+        limiter.acquire(endpoint)
+    return time.monotonic() - started
+
+
+class SharedRateLimiterTest(unittest.TestCase):
+
+    def test_retry_after(self):
+        self.assertEqual(parse_retry_after("3"), 3.0)
+        self.assertAlmostEqual(parse_retry_after(formatdate(time.time() + 30, usegmt=True)), 30, delta=2)
+        self.assertEqual(parse_retry_after(formatdate(time.time() - 30, usegmt=True)), 0.0)
+        self.assertIsNone(parse_retry_after("snart"))
+        self.assertIsNone(parse_retry_after(None))
+
+    def test_spacing_and_burst(self):
+        limiter = SharedRateLimiter({"enheter": (20, 5), "regnskap": (0, 1)})
+        self.assertLess(timed_acquires(limiter, "enheter", 5), 0.05)
+        self.assertGreater(timed_acquires(limiter, "enheter", 10), 0.4)
+        # No limit for rate 0, and endpoints without a budget are not covered
+        self.assertLess(timed_acquires(limiter, "regnskap", 100), 0.5)
+        self.assertFalse(limiter.covers("oppdateringer"))
+        self.assertLess(timed_acquires(limiter, "oppdateringer", 100), 0.5)
+        stats = limiter.stats()
+        self.assertEqual((stats["enheter"]["requests"], stats["regnskap"]["requests"]), (15, 100))
+        self.assertNotIn("oppdateringer", stats)
+
+    def test_backoff_and_ramp_up(self):
+        limiter = SharedRateLimiter({"regnskap": (10, 1)})
+        limiter.record("regnskap", 429, retry_after="0.3")
+        # Answers from the same episode do not decrease the rate again
+        limiter.record("regnskap", 503)
+        stats = limiter.stats()["regnskap"]
+        self.assertEqual((stats["throttled"], stats["decreases"]), (2, 1))
+        self.assertEqual(stats["rate"], 10 * RATE_LIMIT_DECREASE)
+        # Every process pauses until Retry-After has passed
+        self.assertGreater(timed_acquires(limiter, "regnskap", 1), 0.25)
+        limiter.record("regnskap", 500)  # Server errors say nothing about the rate
+        self.assertEqual(limiter.stats()["regnskap"]["rate"], 10 * RATE_LIMIT_DECREASE)
+        for status in (200, 404) * 50:
+            limiter.record("regnskap", status)
+        self.assertEqual(limiter.stats()["regnskap"]["rate"], 10)
+        self.assertEqual(limiter.stats()["regnskap"]["min_rate"], 10 * RATE_LIMIT_DECREASE)
+
+    def test_rate_has_a_floor(self):
+        limiter = SharedRateLimiter({"regnskap": (1, 1)})
+        for _ in range(10):
+            limiter.record("regnskap", 429, retry_after="0")
+            limiter.state["regnskap"]["calm_until"] = 0
+        self.assertEqual(limiter.stats()["regnskap"]["rate"], RATE_LIMIT_MIN_RATE)
+
+    def test_state_file_is_shared(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "state", "ratelimit.json")
+            limiters = [SharedRateLimiter({"regnskap": (40, 1)}, path) for _ in range(2)]
+            try:
+                threads = [threading.Thread(target=timed_acquires, args=(limiter, "regnskap", 20)) for limiter in limiters]
+                started = time.monotonic()
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                # 40 requests under one budget of 40/s, not two of 40/s each
+                self.assertGreater(time.monotonic() - started, 0.9)
+                limiters[0].record("regnskap", 429, retry_after="0.3")
+                self.assertGreater(timed_acquires(limiters[1], "regnskap", 1), 0.25)
+                with open(path, encoding="utf-8") as f:
+                    self.assertEqual(json.load(f)["regnskap"]["rate"], 40 * RATE_LIMIT_DECREASE)
+            finally:
+                for limiter in limiters:
+                    limiter.close()
+
+    def test_damaged_state_file_resets(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "ratelimit.json")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("{ikke json")
+            limiter = SharedRateLimiter({"regnskap": (10, 1)}, path)
+            try:
+                limiter.acquire("regnskap")
+            finally:
+                limiter.close()
+            with open(path, encoding="utf-8") as f:
+                self.assertIn("tat", json.load(f)["regnskap"])
+
+    def test_summary_line(self):
+        limiter = SharedRateLimiter({"enheter": (0, 1), "regnskap": (5, 1)})
+        limiter.acquire("regnskap")
+        limiter.record("regnskap", 429, retry_after="0")
+        line = format_rate_limit_stats(limiter.stats())
+        self.assertTrue(line.startswith("Ratebegrensning (felles for alle prosesser): regnskap 2.5/s (maks 5, laveste 2.5)"),
+                        line)
+        self.assertIn("1 × 429/503", line)
+        self.assertNotIn("enheter", line)
+
+
+class ConcurrentRunsTest(unittest.TestCase):
+
+    def test_two_runs_share_the_finance_budget(self):
+        with tempfile.TemporaryDirectory() as tmp, RunningMockServer(companies=400) as mock:
+            state = os.path.join(tmp, "ratelimit.json")
+            lookups = len(mock.orgnrs("62"))
+            processes = []
+            started = time.monotonic()
+            for n in range(2):
+                command = [sys.executable, MAIN_SCRIPT, "--no-cache", "--page-delay", "0", "--page-rate", "0",
+                           "--finance-rate", "40", "--finance-burst", "1", "--rate-limit-file", state,
+                           "--industry", "62", "--fin", "--output", os.path.join(tmp, f"out{n}.csv")]
+                processes.append(subprocess.Popen(command, env=mock.env(), stdout=subprocess.PIPE,
+                                                  stderr=subprocess.STDOUT, text=True))
+            outputs = [process.communicate(timeout=RUN_TIMEOUT)[0] for process in processes]
+            elapsed = time.monotonic() - started
+            for process, output in zip(processes, outputs):
+                self.assertEqual(process.returncode, 0, output)
+                self.assertIn("Ratebegrensning (felles for alle prosesser): ", output)
+            self.assertEqual(len(read_rows(os.path.join(tmp, "out0.csv"))), lookups)
+        # Both runs' lookups went through one budget of 40/s
+        self.assertGreater(elapsed, 2 * lookups / 40 * 0.8)
+
+
+if __name__ == "__main__":
+    unittest.main()
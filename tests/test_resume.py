@@ -0,0 +1,58 @@
+"""--resume: finance work queued at a checkpoint is restored as it was."""
+
+import json
+import os
+import tempfile
+import time
+import unittest
+
+from support import ORGNR_BASE, FailingPagesHandler, MockHandler, RunningMockServer, read_rows
+
+PAGE_SIZE = 1000  # Enheter per side i søket
+FILTER = "employees > 5 or revenue > 5000000"
+
+
+class ResumeTest(unittest.TestCase):
+
+    def test_pending_finance_is_restored_by_kind(self):
+        with tempfile.TemporaryDirectory() as tmp, RunningMockServer(companies=8000) as mock:
+            registry = mock.registry
+            orgnrs = mock.orgnrs("62")
+            self.assertGreater(len(orgnrs), PAGE_SIZE)
+            # Lookups are only needed where employees > 5 does not decide the filter
+            needs_lookup = [registry.employees[int(orgnr) - ORGNR_BASE] <= 5 for orgnr in orgnrs]
+            # The last lookup on the first page is slow, so the checkpoint at the end of the
+            # page holds it and the rows queued behind it
+            slow = next(orgnrs[i] for i in range(PAGE_SIZE - 2, 0, -1) if needs_lookup[i] and not needs_lookup[i + 1])
+
+            class SlowLookupHandler(FailingPagesHandler):
+                def _finish(self, endpoint, *args, **kwargs):
+                    if endpoint == "regnskap" and self.path.rstrip("/").endswith(slow):
+                        time.sleep(1)
+                    return super()._finish(endpoint, *args, **kwargs)
+
+            output = os.path.join(tmp, "out.csv")
+            run = ("--industry", "62", "--fin", "--fields", "name,orgnr,employees", "--filter", FILTER, "--workers", "8")
+            args = run + ("--output", output, "--checkpoint-interval", "0.001", "--max-retries", "0")
+            mock.server.RequestHandlerClass = SlowLookupHandler
+            mock.run_main(*args)
+            with open(output + ".checkpoint.json", encoding="utf-8") as f:
+                pending = json.load(f)["pending_finance"]
+            kinds = [entry[3] for entry in pending]
+            self.assertEqual(kinds[0], "lookup")
+            self.assertIn("skipped", kinds)
+
+            mock.server.RequestHandlerClass = MockHandler
+            mock.server.stats.reset()
+            result = mock.run_main(*args, "--resume")
+            self.assertEqual(result.returncode, 0, result.stdout)
+            lookups = mock.server.stats.summary()["endpoints"]["regnskap"]["requests"]
+            self.assertEqual(lookups, kinds.count("lookup") + sum(needs_lookup[PAGE_SIZE:]))
+
+            uninterrupted = os.path.join(tmp, "full.csv")
+            mock.run_main(*run, "--output", uninterrupted)
+            self.assertEqual(read_rows(output), read_rows(uninterrupted))
+
+
+if __name__ == "__main__":
+    unittest.main()
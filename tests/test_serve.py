@@ -0,0 +1,35 @@
+"""CompanyIndex: counters and finance data across replaced records."""
+
+import unittest
+
+import support  # noqa: F401  (puts the repository on sys.path)
+
+from brreg_finder.serve import CompanyIndex
+
+
+def entity(orgnr, name):
+    return {"organisasjonsnummer": orgnr, "navn": name, "naeringskode1": {"kode": "62.010"}}
+
+
+class CompanyIndexTest(unittest.TestCase):
+
+    def test_upsert_keeps_finance_and_its_count(self):
+        index = CompanyIndex()
+        index.upsert(entity("900000001", "A"))
+        index.upsert(entity("900000002", "B"))
+        index.set_finance("900000001", {"fin_revenue": 1000})
+        self.assertEqual(index.with_finance, 1)
+
+        index.upsert(entity("900000001", "A (endret)"))
+        self.assertEqual(index.get("900000001")["revenue"], 1000.0)
+        self.assertEqual(index.with_finance, 1)
+
+        index.upsert(entity("900000002", "B (endret)"))
+        self.assertEqual(index.with_finance, 1)
+
+        index.remove("900000001")
+        self.assertEqual(index.with_finance, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
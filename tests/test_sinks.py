@@ -0,0 +1,118 @@
+"""Output sinks: streaming CSV, columnar files and the SQLite/DuckDB store."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from support import RunningMockServer, read_rows
+
+from brreg_finder.common import FIELD_MAP
+from brreg_finder.sinks import ColumnarSink, CompanyStore, CsvSink
+
+try:
+    import duckdb  # noqa: F401
+except ImportError:
+    duckdb = None
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+class CsvSinkTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "out.csv")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_rows_reach_the_file_before_close(self):
+        sink = CsvSink(self.path, ["name", "orgnr"], FIELD_MAP, extra_fields=["fin_revenue"], buffer_size=2,
+                       flush_interval=60)
+        sink.write({"Name": "A", "OrgNo": "1", "fin_revenue": 1234567.0})
+        self.assertEqual(read_rows(self.path), [])
+        sink.write({"Name": "B", "OrgNo": "2"})
+        # A full buffer is written at once, with financial values formatted
+        self.assertEqual(read_rows(self.path), [{"Name": "A", "OrgNo": "1", "Revenue": "1 234 567"},
+                                                {"Name": "B", "OrgNo": "2", "Revenue": ""}])
+        sink.write({"Name": "C", "OrgNo": "3"})
+        sink.close()
+        self.assertEqual(sink.rows_written, 3)
+        self.assertEqual(len(read_rows(self.path)), 3)
+
+    def test_resume_truncates_and_appends(self):
+        with CsvSink(self.path, ["name"], FIELD_MAP) as sink:
+            sink.write({"Name": "A"})
+            offset = sink.position()
+            sink.write({"Name": "lost"})
+        with CsvSink(self.path, ["name"], FIELD_MAP, resume_at=offset) as sink:
+            sink.write({"Name": "B"})
+        self.assertEqual(read_rows(self.path), [{"Name": "A"}, {"Name": "B"}])
+
+
+@unittest.skipIf(pyarrow is None, "pyarrow er ikke installert")
+class ColumnarSinkTest(unittest.TestCase):
+
+    def test_typed_columns_match_csv(self):
+        fields = "name,orgnr,employees,registration_date,state,revenue,profit_margin,year"
+        with tempfile.TemporaryDirectory() as tmp, RunningMockServer() as mock:
+            csv_file = os.path.join(tmp, "out.csv")
+            mock.run_main("--industry", "62", "--fin", "--fields", fields, "--limit", "50", "--output", csv_file)
+            expected = read_rows(csv_file)
+            for name, read in (("out.parquet", pyarrow.parquet.read_table),
+                               ("out.arrow", lambda path: pyarrow.ipc.open_file(path).read_all())):
+                with self.subTest(format=name):
+                    path = os.path.join(tmp, name)
+                    result = mock.run_main("--industry", "62", "--fin", "--fields", fields, "--limit", "50", "--output", path)
+                    self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+                    table = read(path)
+                    types = {field.name: str(field.type) for field in table.schema}
+                    self.assertEqual(types["Employees"], "int64")
+                    self.assertEqual(types["RegistrationDate"], "date32[day]")
+                    self.assertTrue(types["State"].startswith("dictionary"))
+                    self.assertEqual((types["Revenue"], types["Profit Margin (%)"]), ("int64", "double"))
+                    rows = table.to_pylist()
+                    self.assertEqual([r["OrgNo"] for r in rows], [r["OrgNo"] for r in expected])
+                    for row, csv_row in zip(rows, expected):
+                        self.assertEqual(row["RegistrationDate"].isoformat(), csv_row["RegistrationDate"])
+                        self.assertEqual("" if row["Revenue"] is None else f"{row['Revenue']:,}".replace(",", " "),
+                                         csv_row["Revenue"])
+
+    def test_dictionary_grows_across_arrow_batches(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "out.arrow")
+            sink = ColumnarSink(path, ["name", "state"], FIELD_MAP, row_group_size=2, output_format="arrow")
+            states = ["OSLO", "BERGEN", "OSLO", "TROMSØ", "BODØ"]
+            for n, state in enumerate(states):
+                sink.write({"Name": str(n), "State": state})
+            sink.close()
+            table = pyarrow.ipc.open_file(path).read_all()
+            self.assertEqual(table.column("State").to_pylist(), states)
+
+
+@unittest.skipIf(duckdb is None, "duckdb er ikke installert")
+class DuckDBStoreTest(unittest.TestCase):
+
+    def test_staging_path_with_quote(self):
+        work = tempfile.mkdtemp(suffix="'s")
+        saved = tempfile.tempdir
+        tempfile.tempdir = work
+        try:
+            store = CompanyStore(os.path.join(work, "store.duckdb"), engine="duckdb")
+            store.write(industries={"900000001": ["62.010", "63.110"]})
+            store.write(industries={"900000001": ["62.020"]})
+            rows = store.execute("SELECT code, orgnr FROM company_industries").fetchall()
+            store.close()
+        finally:
+            tempfile.tempdir = saved
+            shutil.rmtree(work)
+        self.assertEqual(rows, [("62.020", "900000001")])
+
+
+if __name__ == "__main__":
+    unittest.main()